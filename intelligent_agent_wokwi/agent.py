@@ -1,19 +1,62 @@
 import serial
+import argparse
+import logging
+import selectors
+import threading
 import time
-import json
-import sys
+
+import logs
+import metrics
+import telemetry
+from detectors import DetectorSet, describe
+from profiler import SamplingProfiler, DUMP_INTERVAL
+from rules import Rule, RuleState
 
 # Configuration
 SERIAL_PORT = 'COM3' # Default, user might need to change this
 BAUD_RATE = 115200
 TEMP_THRESHOLD = 30.0 # Celsius
 FLOW_THRESHOLD = 50.0 # Liters/hour
+TEMP_HYSTERESIS = 1.0 # Celsius below TEMP_THRESHOLD before Actuator 1 turns off
+FLOW_HYSTERESIS = 5.0 # Liters/hour below FLOW_THRESHOLD before Actuator 2 turns off
+TEMP_EARLY_THRESHOLD = 27.0 # Celsius; Actuator 1 turns on above this while the temperature is rising
+FLOW_EARLY_THRESHOLD = 40.0 # Liters/hour; Actuator 2 turns on above this while the flow is rising
+MIN_DWELL_TIME = 5.0 # Seconds an actuator holds a state before it may switch again
+RESYNC_INTERVAL = 60.0 # Seconds between re-sending the full actuator state
+WAKEUP_TIMEOUT = 0.5 # Seconds between stop-flag checks while the port is idle
+MAX_LINE_LENGTH = 4096 # Discard unterminated input longer than this
+METRICS_PORT = 8003 # /metrics for a standalone agent (the backend uses metrics.METRICS_PORT)
+READING_METRICS = ('temp', 'humidity', 'flow')
+
+log = logging.getLogger("agent")
+PROCESS_SECONDS = metrics.histogram("wokwi_agent_process_seconds", "Time to decode one reading and evaluate the rules",
+                                    sample_every=metrics.SAMPLE_EVERY)
+COMMANDS = metrics.counter("wokwi_agent_commands_total", "Actuator commands issued", ["actuator"])
+ANOMALIES = metrics.counter("wokwi_agent_anomalies_total", "Anomalies and drifts detected", ["metric", "kind"])
+INVALID = metrics.counter("wokwi_agent_invalid_total", "Readings the agent could not process")
+
+def default_rules(min_dwell=MIN_DWELL_TIME):
+    """The agent's actuator rules (see rules.py for their semantics)."""
+    return [
+        Rule("ACT1", "temp", TEMP_THRESHOLD, TEMP_HYSTERESIS, min_dwell,
+             alert="High Temperature! Activating Actuator 1.", early_threshold=TEMP_EARLY_THRESHOLD),
+        Rule("ACT2", "flow", FLOW_THRESHOLD, FLOW_HYSTERESIS, min_dwell,
+             alert="High Water Flow! Activating Actuator 2.", early_threshold=FLOW_EARLY_THRESHOLD),
+    ]
+
 
 class IntelligentAgent:
-    def __init__(self, port, baud_rate):
+    def __init__(self, port, baud_rate, min_dwell=MIN_DWELL_TIME, resync_interval=RESYNC_INTERVAL,
+                 clock=time.monotonic, rules=None):
         self.port = port
         self.baud_rate = baud_rate
         self.ser = None
+        self._stop = threading.Event()
+        self.clock = clock
+        self.resync_interval = resync_interval
+        self.last_resync = None
+        self.actuators = [RuleState(rule) for rule in (rules or default_rules(min_dwell))]
+        self.detectors = DetectorSet(READING_METRICS)
 
     def connect(self):
         try:
@@ -28,67 +71,136 @@ class IntelligentAgent:
     def process_data(self, data):
         """
         Analyzes sensor data and decides on actions.
-        Returns a list of commands to send.
+        Returns a list of commands to send: only actuators whose state changed,
+        or every actuator when a periodic resync is due.
         """
+        started = time.perf_counter() if PROCESS_SECONDS.sampled() else None
         commands = []
         try:
-            # Parse JSON data
-            sensors = json.loads(data)
-            temp = sensors.get('temp', 0)
-            flow = sensors.get('flow', 0)
+            # Parse JSON (or compact binary) data; every sample goes through the
+            # detectors, the rules act on the newest one
+            now = self.clock()
+            samples = telemetry.decode_samples(data)
+            if not samples:
+                return commands
+            for sensors in samples:
+                readings = {metric: sensors.get(metric, 0) for metric in READING_METRICS}
+                for metric, kind, value in self.detectors.update(now - sensors.get('age_ms', 0) / 1000,
+                                                                 list(readings.values())):
+                    ANOMALIES.inc(1, metric, kind)
+                    log.warning("[ANOMALY] %s", describe(metric, kind, value))
+            for metric, rising in self.detectors.rising().items():
+                readings[f"{metric}_rising"] = rising
             
-            print(f"Received: Temp={temp:.1f}C, Flow={flow:.1f}L/h")
-
-            # Logic for Actuator 1 (Temperature)
-            if temp > TEMP_THRESHOLD:
-                print(f"  [ALERT] High Temperature! Activating Actuator 1.")
-                commands.append("ACT1:ON")
-            else:
-                commands.append("ACT1:OFF")
-
-            # Logic for Actuator 2 (Water Flow)
-            if flow > FLOW_THRESHOLD:
-                print(f"  [ALERT] High Water Flow! Activating Actuator 2.")
-                commands.append("ACT2:ON")
-            else:
-                commands.append("ACT2:OFF")
+            log.debug("Received: Temp=%.1fC, Flow=%.1fL/h", readings['temp'], readings['flow'])
+
+            for actuator in self.actuators:
+                if actuator.update(readings, now):
+                    if actuator.on and actuator.rule.alert:
+                        log.info("[ALERT] %s", actuator.rule.alert)
+                    commands.append(actuator.command())
+
+            # Periodically re-send the full state in case a command was lost
+            if self.last_resync is None or now - self.last_resync >= self.resync_interval:
+                self.last_resync = now
+                commands = [actuator.command() for actuator in self.actuators]
                 
-        except json.JSONDecodeError:
-            print(f"  [WARN] Invalid data received: {data}")
+        except ValueError:
+            INVALID.inc()
+            log.warning("Invalid data received: %r", data)
         except Exception as e:
-            print(f"  [ERROR] Processing error: {e}")
-            
+            INVALID.inc()
+            log.error("Processing error: %s", e)
+
+        for command in commands:
+            COMMANDS.inc(1, command.split(':')[0])
+        if started is not None:
+            PROCESS_SECONDS.observe(time.perf_counter() - started)
         return commands
 
+    def handle_lines(self, lines):
+        """
+        Processes a batch of received lines and sends the resulting commands
+        in a single write. Only the last command per actuator is kept.
+        """
+        commands = {}
+        for line in lines:
+            line = line.decode('utf-8', errors='replace').strip()
+            if line:
+                for action in self.process_data(line):
+                    commands[action.split(':')[0]] = action
+        if commands:
+            self.ser.write(''.join(action + '\n' for action in commands.values()).encode('utf-8'))
+        return list(commands.values())
+
+    def _wait_for_data(self, selector):
+        """Blocks until the port is readable and returns everything buffered."""
+        if selector:
+            if not selector.select(WAKEUP_TIMEOUT):
+                return b''
+            return self.ser.read(self.ser.in_waiting or 1)
+        # No pollable descriptor (e.g. Windows COM ports): a blocking read
+        # returns as soon as the first byte arrives or the port timeout expires
+        chunk = self.ser.read(1)
+        if chunk and self.ser.in_waiting:
+            chunk += self.ser.read(self.ser.in_waiting)
+        return chunk
+
+    def _make_selector(self):
+        try:
+            fd = self.ser.fileno()
+        except (AttributeError, OSError, ValueError):
+            return None
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
+        return selector
+
+    def stop(self):
+        self._stop.set()
+
     def run(self):
         if not self.connect():
             return
 
         print("Agent is running. Press Ctrl+C to stop.")
+        selector = self._make_selector()
+        pending = b''
         try:
-            while True:
-                if self.ser.in_waiting > 0:
-                    line = self.ser.readline().decode('utf-8').strip()
-                    if line:
-                        actions = self.process_data(line)
-                        for action in actions:
-                            self.ser.write((action + '\n').encode('utf-8'))
-                            # print(f"  Sent: {action}") # Optional debug
-                            
-                time.sleep(0.1) # Prevent CPU hogging
+            while not self._stop.is_set():
+                chunk = self._wait_for_data(selector)
+                if not chunk:
+                    continue
+
+                # Drain every complete line received since the last wakeup
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                if len(pending) > MAX_LINE_LENGTH:
+                    pending = b''
+                if lines:
+                    self.handle_lines(lines)
                 
         except KeyboardInterrupt:
             print("\nStopping agent...")
         finally:
+            if selector:
+                selector.close()
             if self.ser and self.ser.is_open:
                 self.ser.close()
             print("Disconnected.")
 
 if __name__ == "__main__":
-    # Allow port to be passed as argument
-    port = SERIAL_PORT
-    if len(sys.argv) > 1:
-        port = sys.argv[1]
-    
-    agent = IntelligentAgent(port, BAUD_RATE)
-    agent.run()
+    parser = argparse.ArgumentParser(description="Run the actuator agent on a serial port")
+    parser.add_argument("port", nargs="?", default=SERIAL_PORT)
+    parser.add_argument("--profile", action="store_true", help="run the sampling profiler (see profiler.py)")
+    parser.add_argument("--profile-interval", type=float, default=DUMP_INTERVAL)
+    args = parser.parse_args()
+
+    logs.setup()
+    metrics.serve(METRICS_PORT)
+    profiler = SamplingProfiler(dump_interval=args.profile_interval).start() if args.profile else None
+    agent = IntelligentAgent(args.port, BAUD_RATE)
+    try:
+        agent.run()
+    finally:
+        if profiler:
+            profiler.stop()
@@ -1,287 +1,216 @@
-import paho.mqtt.client as mqtt
-import json
+"""
+Backend service: ingests sensor readings from MQTT, stores them per device
+and renders HTML reports.
+
+Importing this module is cheap and has no side effects: the MQTT client
+is only imported when start() connects (see transport.py), the metrics
+HTTP server, the profiler and the asyncio dashboard gateway only in main(),
+the reports directory is created when the report worker starts, and pandas
+and numpy are only loaded by the export and analytics paths that use them.
+"""
+import logging
 import time
-import pandas as pd
 import os
 import threading
 from datetime import datetime
 
+import logs
+import metrics
+import storage as storage_backends
+from detectors import describe
+from devices import DeviceRegistry
+from pipeline import IngestPipeline
+from reports import ReportWorker
+from rollups import RollupWorker
+from telemetry import device_from_topic
+from transport import MqttTransport, CLIENT_ID, paho_client
+from wal import WriteAheadLog, WAL_DIR
+
 
 # Configuration
 MQTT_BROKER = "test.mosquitto.org"
 MQTT_PORT = 1883
-TOPIC_SENSORS = "wokwi/sensors/sayf_project"
-EXCEL_FILE = "sensor_data.xlsx"
+MQTT_POOL_SIZE = 2  # Connections sharing the sensor subscriptions (see transport.py)
+MQTT_GROUP = "wokwi-backend"  # Shared subscription group; backend instances in it split the load
+TOPIC_SENSORS = "wokwi/sensors/+"  # One topic level per device: wokwi/sensors/<device_id>
+TOPIC_SENSORS_BINARY = "wokwi/sensors/+/bin"  # Same devices in compact binary mode
+TOPIC_ACTUATORS = "wokwi/actuators/{device}"
+STORAGE_BACKEND = storage_backends.STORAGE_BACKEND  # "binary" or "excel"
+INGEST_WORKERS = os.cpu_count() or 4  # Worker threads; each device is pinned to one
 REPORTS_DIR = "reports"
 REPORT_INTERVAL = 30  # Generate report every 30 data captures
 TIMER_INTERVAL = 60  # Generate report every 60 seconds
+REPORT_WINDOW = "last_30"
+REPORT_MIN_INTERVAL = 1.0  # Seconds between two reports of the same device
+BUFFER_RETENTION = 100000  # Recent readings kept in memory per device
+WAL_ENABLED = True  # fsync every ingest batch to the write-ahead log before applying it
+ROLLUPS_ENABLED = True  # Roll binary storage up into 1m/1h/1d tiers and apply retention (see rollups.py)
+RESTORE_WINDOW = 3600  # Seconds of the write-ahead log replayed on start to rebuild buffers and stats
+METRICS_PORT = metrics.METRICS_PORT  # Prometheus text on /metrics, JSON on /metrics.json
+GATEWAY_ENABLED = True  # Serve the dashboard's actuator endpoint and WebSocket feed on port 1880 (see gateway.py)
 
-# Global Data Buffer
-data_buffer = []
-data_counter = 0
-last_timer_report = None
+# Statistics windows: name -> (max samples, max age in seconds)
+# Time windows are bucketed (see stats.py), so their memory is fixed whatever the sample rate
+STATS_WINDOWS = {
+    REPORT_WINDOW: (REPORT_INTERVAL, None),
+    "1m": (None, 60),
+    "1h": (None, 3600),
+    "24h": (None, 86400),
+}
 
-# Ensure reports directory exists
-if not os.path.exists(REPORTS_DIR):
-    os.makedirs(REPORTS_DIR)
+# Per-device state (ring buffer, stats, storage, report counter)
+devices = DeviceRegistry(STORAGE_BACKEND, BUFFER_RETENTION, STATS_WINDOWS)
+# Renders reports off the ingest path; concurrent triggers for a device are coalesced
+report_worker = ReportWorker(REPORTS_DIR, REPORT_INTERVAL, REPORT_MIN_INTERVAL)
+# Durable log of every ingested batch, replayed after a restart (opened in start())
+wal = WriteAheadLog(WAL_DIR)
+# Long-term history tiers and raw retention (binary storage only)
+rollup_worker = RollupWorker()
+last_timer_report = None
+pipeline = None
+mqtt = None  # MqttTransport, created in start()
+gateway = None  # Gateway, started by main()
+# Set to end main() and the report timer; waiting on it (not time.sleep) keeps them idle in profiles
+shutdown = threading.Event()
+log = logging.getLogger("backend")
 
-def on_connect(client, userdata, flags, rc):
-    print(f"Connected to MQTT Broker with result code {rc}")
-    client.subscribe(TOPIC_SENSORS)
+# Instrumentation; values kept by the pipeline and report worker are read at scrape time
+READINGS = metrics.counter("wokwi_readings_total", "Readings persisted", ["device"])
+ANOMALIES = metrics.counter("wokwi_anomalies_total", "Anomalies and drifts detected", ["device", "metric", "kind"])
+READING_RATE = metrics.meter("wokwi_readings_per_second", "Readings persisted per second (last minute)", ["device"])
+metrics.counter("wokwi_ingest_received_total", "Raw payloads accepted into the ingest queue",
+                fn=lambda: pipeline.stats()["received"])
+metrics.counter("wokwi_ingest_dropped_total", "Raw payloads dropped because the ingest queue was full",
+                fn=lambda: pipeline.stats()["dropped"])
+metrics.counter("wokwi_ingest_invalid_total", "Raw payloads that failed to decode",
+                fn=lambda: pipeline.stats()["invalid"])
+metrics.gauge("wokwi_ingest_queue_depth", "Raw payloads waiting in the ingest queues",
+              fn=lambda: pipeline.stats()["depth"])
+metrics.gauge("wokwi_ingest_max_queue_depth", "Deepest ingest queue seen", fn=lambda: pipeline.stats()["max_depth"])
+metrics.gauge("wokwi_reports_pending", "Devices waiting for a report", fn=lambda: report_worker.pending())
+metrics.gauge("wokwi_devices", "Devices seen", fn=lambda: len(devices.shards()))
+metrics.gauge("wokwi_mqtt_connected", "Open MQTT connections", fn=lambda: mqtt.connected)
 
 def on_message(client, userdata, msg):
-    global data_counter
-    try:
-        payload = msg.payload.decode()
-        data = json.loads(payload)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Add timestamp to data
-        entry = {
-            "Timestamp": timestamp,
-            "Temperature": data.get("temp", 0),
-            "Humidity": data.get("humidity", 0),
-            "Water Flow": data.get("flow", 0)
-        }
-        
-        data_buffer.append(entry)
-        data_counter += 1
-        print(f"Logged: {entry} (Count: {data_counter})")
-        
-        # Save to Excel immediately
-        save_to_excel(entry)
-        
-        # Generate report every REPORT_INTERVAL captures
-        if data_counter >= REPORT_INTERVAL:
-            generate_report()
-            data_counter = 0
-        
-    except Exception as e:
-        print(f"Error processing message: {e}")
+    # Runs on paho's network thread: only hand the raw payload to the pipeline
+    pipeline.submit(msg.payload, key=device_from_topic(msg.topic))
 
-def save_to_excel(entry):
-    df_new = pd.DataFrame([entry])
-    if os.path.exists(EXCEL_FILE):
-        try:
-            # Read existing data
-            df_existing = pd.read_excel(EXCEL_FILE)
-            # Concat new data
-            df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-            # Write back
-            df_combined.to_excel(EXCEL_FILE, index=False)
-        except Exception as e:
-            print(f"Error saving to Excel: {e}")
-    else:
-        df_new.to_excel(EXCEL_FILE, index=False)
+def send_command(device_id, command):
+    """Publish an actuator command ('ACT1:ON') to a device; batched with its other pending commands"""
+    mqtt.publish_command(TOPIC_ACTUATORS.format(device=device_id), command)
 
-def generate_report():
-    """Generate a comprehensive report from the last 30 data points"""
-    if len(data_buffer) < REPORT_INTERVAL:
-        print(f"Not enough data for report. Have {len(data_buffer)}, need {REPORT_INTERVAL}")
+def persist_batch(device_id, readings):
+    """Pipeline sink: buffer, store and count a batch of decoded readings for one device"""
+    if not readings:
         return
-    
-    # Get last 30 data points
-    recent_data = data_buffer[-REPORT_INTERVAL:]
-    df = pd.DataFrame(recent_data)
-    
-    # Calculate statistics
-    stats = {
-        'temperature': {
-            'min': df['Temperature'].min(),
-            'max': df['Temperature'].max(),
-            'avg': df['Temperature'].mean(),
-            'std': df['Temperature'].std()
-        },
-        'humidity': {
-            'min': df['Humidity'].min(),
-            'max': df['Humidity'].max(),
-            'avg': df['Humidity'].mean(),
-            'std': df['Humidity'].std()
-        },
-        'flow': {
-            'min': df['Water Flow'].min(),
-            'max': df['Water Flow'].max(),
-            'avg': df['Water Flow'].mean(),
-            'std': df['Water Flow'].std()
-        }
-    }
-    
-    # Determine trends
-    temp_trend = "Increasing" if df['Temperature'].iloc[-1] > df['Temperature'].iloc[0] else "Decreasing"
-    humidity_trend = "Increasing" if df['Humidity'].iloc[-1] > df['Humidity'].iloc[0] else "Decreasing"
-    flow_trend = "Increasing" if df['Water Flow'].iloc[-1] > df['Water Flow'].iloc[0] else "Decreasing"
-    
-    # Generate report filename
-    report_filename = os.path.join(REPORTS_DIR, f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
-    
-    # Create HTML report
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Sensor Data Report</title>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }}
-            .container {{ max-width: 900px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-            h1 {{ color: #333; border-bottom: 3px solid #38bdf8; padding-bottom: 10px; }}
-            h2 {{ color: #555; margin-top: 30px; }}
-            table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
-            th, td {{ padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }}
-            th {{ background-color: #38bdf8; color: white; }}
-            .metric {{ background: #f8f9fa; padding: 15px; margin: 10px 0; border-left: 4px solid #38bdf8; }}
-            .metric-name {{ font-weight: bold; color: #555; }}
-            .metric-value {{ font-size: 1.2em; color: #333; }}
-            .trend {{ display: inline-block; padding: 5px 10px; border-radius: 5px; font-weight: bold; }}
-            .trend.up {{ background: #fef3c7; color: #92400e; }}
-            .trend.down {{ background: #dbeafe; color: #1e40af; }}
-            .footer {{ margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; color: #666; font-size: 0.9em; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Sensor Data Analysis Report</h1>
-            <p><strong>Report Generated:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-            <p><strong>Data Range:</strong> {df['Timestamp'].iloc[0]} to {df['Timestamp'].iloc[-1]}</p>
-            <p><strong>Total Samples:</strong> {len(recent_data)}</p>
-            
-            <h2>Temperature Analysis</h2>
-            <div class="metric">
-                <div class="metric-name">Average Temperature</div>
-                <div class="metric-value">{stats['temperature']['avg']:.2f} °C</div>
-            </div>
-            <table>
-                <tr>
-                    <th>Metric</th>
-                    <th>Value</th>
-                </tr>
-                <tr>
-                    <td>Minimum</td>
-                    <td>{stats['temperature']['min']:.2f} °C</td>
-                </tr>
-                <tr>
-                    <td>Maximum</td>
-                    <td>{stats['temperature']['max']:.2f} °C</td>
-                </tr>
-                <tr>
-                    <td>Standard Deviation</td>
-                    <td>{stats['temperature']['std']:.2f} °C</td>
-                </tr>
-                <tr>
-                    <td>Trend</td>
-                    <td><span class="trend {'up' if temp_trend == 'Increasing' else 'down'}">{temp_trend}</span></td>
-                </tr>
-            </table>
-            
-            <h2>Humidity Analysis</h2>
-            <div class="metric">
-                <div class="metric-name">Average Humidity</div>
-                <div class="metric-value">{stats['humidity']['avg']:.2f} %</div>
-            </div>
-            <table>
-                <tr>
-                    <th>Metric</th>
-                    <th>Value</th>
-                </tr>
-                <tr>
-                    <td>Minimum</td>
-                    <td>{stats['humidity']['min']:.2f} %</td>
-                </tr>
-                <tr>
-                    <td>Maximum</td>
-                    <td>{stats['humidity']['max']:.2f} %</td>
-                </tr>
-                <tr>
-                    <td>Standard Deviation</td>
-                    <td>{stats['humidity']['std']:.2f} %</td>
-                </tr>
-                <tr>
-                    <td>Trend</td>
-                    <td><span class="trend {'up' if humidity_trend == 'Increasing' else 'down'}">{humidity_trend}</span></td>
-                </tr>
-            </table>
-            
-            <h2>Water Flow Analysis</h2>
-            <div class="metric">
-                <div class="metric-name">Average Water Flow</div>
-                <div class="metric-value">{stats['flow']['avg']:.2f} L/h</div>
-            </div>
-            <table>
-                <tr>
-                    <th>Metric</th>
-                    <th>Value</th>
-                </tr>
-                <tr>
-                    <td>Minimum</td>
-                    <td>{stats['flow']['min']:.2f} L/h</td>
-                </tr>
-                <tr>
-                    <td>Maximum</td>
-                    <td>{stats['flow']['max']:.2f} L/h</td>
-                </tr>
-                <tr>
-                    <td>Standard Deviation</td>
-                    <td>{stats['flow']['std']:.2f} L/h</td>
-                </tr>
-                <tr>
-                    <td>Trend</td>
-                    <td><span class="trend {'up' if flow_trend == 'Increasing' else 'down'}">{flow_trend}</span></td>
-                </tr>
-            </table>
-            
-            <h2>Recommendations</h2>
-            <ul>
-                <li>Temperature range: {stats['temperature']['min']:.1f}°C to {stats['temperature']['max']:.1f}°C - {'Within normal range' if stats['temperature']['max'] < 30 else 'Review cooling systems'}</li>
-                <li>Humidity range: {stats['humidity']['min']:.1f}% to {stats['humidity']['max']:.1f}% - {'Optimal conditions' if 30 <= stats['humidity']['avg'] <= 70 else 'Consider humidity control'}</li>
-                <li>Water flow range: {stats['flow']['min']:.1f} to {stats['flow']['max']:.1f} L/h - {'Normal operation' if stats['flow']['max'] < 50 else 'Check for leaks'}</li>
-            </ul>
-            
-            <div class="footer">
-                <p>This report was automatically generated by the Wokwi Intelligent Agent System.</p>
-                <p>For questions or concerns, please review the sensor data and agent logs.</p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    
-    # Write report to file
-    with open(report_filename, 'w') as f:
-        f.write(html_content)
-    
-    print(f"\n{'='*60}")
-    print(f"REPORT GENERATED: {report_filename}")
-    print(f"{'='*60}")
-    print(f"Temperature: {stats['temperature']['avg']:.2f}°C (min: {stats['temperature']['min']:.2f}, max: {stats['temperature']['max']:.2f})")
-    print(f"Humidity: {stats['humidity']['avg']:.2f}% (min: {stats['humidity']['min']:.2f}, max: {stats['humidity']['max']:.2f})")
-    print(f"Water Flow: {stats['flow']['avg']:.2f} L/h (min: {stats['flow']['min']:.2f}, max: {stats['flow']['max']:.2f})")
-    print(f"{'='*60}\n")
+    # Live dashboards get the readings before the write-ahead log fsync
+    if gateway:
+        gateway.publish(device_id, readings)
+    if WAL_ENABLED:
+        wal.write(device_id, readings)
+    shard = devices.get(device_id)
+    for timestamp_ns, temp, humidity, flow in readings:
+        for metric, kind, value in shard.add(timestamp_ns, temp, humidity, flow):
+            ANOMALIES.inc(1, device_id, metric, kind)
+            log.warning("[%s] Anomaly: %s", device_id, describe(metric, kind, value))
+
+        # Generate report every REPORT_INTERVAL captures
+        if shard.counter >= REPORT_INTERVAL:
+            generate_report(shard)
+            shard.counter = 0
+
+    READINGS.inc(len(readings), device_id)
+    READING_RATE.mark(len(readings), device_id)
+    log.debug("[%s] Logged %d reading(s), last: Temp=%.1fC, Humidity=%.1f%%, Flow=%.1fL/h (Count: %d)",
+              device_id, len(readings), temp, humidity, flow, shard.counter)
+
+def generate_report(shard):
+    """Queue a report of a device's last 30 data points; it is rendered on the report worker"""
+    report_worker.request(shard.device_id,
+                          lambda: dict(shard.stats.snapshot(REPORT_WINDOW), detectors=shard.detectors.snapshot()))
 
 
 def generate_timed_reports():
-    """Generate reports every 60 seconds automatically"""
+    """Generate reports for every device every 60 seconds automatically"""
     global last_timer_report
-    while True:
-        time.sleep(TIMER_INTERVAL)
-        if len(data_buffer) > 0:  # Only generate if we have data
-            print(f"\n{'='*60}")
-            print(f"[TIMER] Generating automatic report at {datetime.now().strftime('%H:%M:%S')}")
-            print(f"{'='*60}")
-            generate_report()
+    while not shutdown.wait(TIMER_INTERVAL):
+        shards = [shard for shard in devices.shards() if len(shard.buffer) > 0]
+        if shards:  # Only generate if we have data
+            log.info("[TIMER] Generating automatic reports for %d device(s)", len(shards))
+            for shard in shards:
+                generate_report(shard)
             last_timer_report = datetime.now()
+            log.info("[TIMER] Ingest pipeline: %s, reports: %s", pipeline.stats(), report_worker.stats())
         else:
-            print(f"[TIMER] Skipping report - no data available yet")
+            log.info("[TIMER] Skipping report - no data available yet")
 
-def main():
-    client = mqtt.Client()
-    client.on_connect = on_connect
-    client.on_message = on_message
-    
-    print("Connecting to MQTT Broker...")
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.loop_start()
+def recover():
+    """Rebuild device buffers and stats from the last RESTORE_WINDOW seconds of the write-ahead log"""
+    started = time.perf_counter()
+    since_ns = time.time_ns() - int(RESTORE_WINDOW * 1e9)
+    batches = {}
+    for device_id, readings in wal.replay(since_ns):
+        batches.setdefault(device_id, []).extend(readings)
+    for device_id, readings in batches.items():
+        devices.get(device_id).restore(readings)
+    count = sum(len(readings) for readings in batches.values())
+    if count:
+        log.info("Restored %d reading(s) for %d device(s) from the write-ahead log in %.0f ms",
+                 count, len(batches), (time.perf_counter() - started) * 1000)
+    return count
+
+def start(client_factory=paho_client):
+    """Recover from the write-ahead log, start the storage, report, rollup and ingest workers, then connect to MQTT"""
+    global pipeline, mqtt
+    if WAL_ENABLED:
+        wal.open()
+        recover()
+    devices.start()
+    report_worker.start()
+    if ROLLUPS_ENABLED and STORAGE_BACKEND == "binary":
+        rollup_worker.start()
+    pipeline = IngestPipeline(persist_batch, workers=INGEST_WORKERS)
+    pipeline.start()
+
+    # Connections retry with backoff and re-subscribe on their own after a broker outage
+    mqtt = MqttTransport([TOPIC_SENSORS, TOPIC_SENSORS_BINARY], on_message, MQTT_BROKER, MQTT_PORT,
+                         pool_size=MQTT_POOL_SIZE, group=MQTT_GROUP, client_id=f"{CLIENT_ID}-backend",
+                         client_factory=client_factory)
+    mqtt.start()
+
+def stop():
+    """Disconnect, then drain the pipeline, pending reports and storage batches"""
+    mqtt.stop()
+    pipeline.stop()
+    report_worker.stop()
+    rollup_worker.stop()
+    devices.close()
+    if WAL_ENABLED:
+        wal.close()
+
+def main(argv=None):
+    # Only the service itself needs the CLI parser, the profiler and the gateway (asyncio)
+    global gateway
+    import argparse
+    from gateway import Gateway, GATEWAY_PORT
+    from profiler import SamplingProfiler, DUMP_INTERVAL, PROFILE_DIR
+
+    parser = argparse.ArgumentParser(description="Log sensor readings and generate HTML reports")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"run the sampling profiler and write stacks to {PROFILE_DIR}/ (SIGUSR1 dumps now)")
+    parser.add_argument("--profile-interval", type=float, default=DUMP_INTERVAL,
+                        help="seconds between profile dumps")
+    args = parser.parse_args(argv)
+
+    logs.setup()
+    profiler = SamplingProfiler(dump_interval=args.profile_interval).start() if args.profile else None
+    start()
+    metrics_server = metrics.serve(METRICS_PORT)
+    if GATEWAY_ENABLED:
+        gateway = Gateway(send_command, port=GATEWAY_PORT).start()
     
     # Start timer-based report generation in background thread
-    timer_thread = threading.Thread(target=generate_timed_reports, daemon=True)
+    timer_thread = threading.Thread(target=generate_timed_reports, name="report-timer", daemon=True)
     timer_thread.start()
     
     print(f"\n{'='*60}")
@@ -291,16 +220,30 @@ def main():
     print(f"  1. Every {REPORT_INTERVAL} data captures (data-based)")
     print(f"  2. Every {TIMER_INTERVAL} seconds (time-based)")
     print(f"Reports saved to: {os.path.abspath(REPORTS_DIR)}")
+    print(f"Subscribed topics: {TOPIC_SENSORS}, {TOPIC_SENSORS_BINARY} ({MQTT_POOL_SIZE} MQTT connections, "
+          f"{INGEST_WORKERS} ingest workers)")
+    print(f"Storage backend: {STORAGE_BACKEND} (export with: python storage.py export <device_id>)")
+    print(f"Metrics: http://localhost:{METRICS_PORT}/metrics (JSON: /metrics.json)")
+    if gateway:
+        print(f"Gateway: http://localhost:{GATEWAY_PORT}/api/actuator, ws://localhost:{GATEWAY_PORT}/ws/sensors")
+    if profiler:
+        print(f"Profiling: every {args.profile_interval:g} s and on SIGUSR1 to {os.path.abspath(PROFILE_DIR)}")
     print(f"{'='*60}\n")
     
     try:
-        while True:
-            time.sleep(1)
-                
+        # A timeout keeps Ctrl+C responsive on Windows
+        while not shutdown.wait(1):
+            pass
     except KeyboardInterrupt:
-        print("\nStopping service...")
-        client.loop_stop()
-        client.disconnect()
+        pass
+    print("\nStopping service...")
+    shutdown.set()
+    metrics_server.shutdown()
+    if gateway:
+        gateway.stop()
+    stop()
+    if profiler:
+        profiler.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,518 @@
+"""
+End-to-end load benchmark for backend_service and IntelligentAgent.
+
+Runs everything in one process on an in-process stand-in for the MQTT
+broker (FakeBroker / FakeClient mimic the parts of paho's client the
+services use), so results do not depend on a public broker or the network:
+
+    load generator --wokwi/sensors/<device>--> backend_service (ingest, storage, reports)
+                                           \\-> IntelligentAgent per device
+                                                --wokwi/actuators/<device>--> fake actuator
+
+Reported as JSON: cold start time (import and first ingested reading, in a
+fresh interpreter), ingest throughput, pipeline counters, sensor-to-actuator
+latency percentiles, write-ahead log recovery time, report render times,
+process memory growth and the services' own timing histograms (see
+metrics.py; cumulative per process).
+
+Usage: python benchmark.py [--devices 10] [--rate 50] [--duration 10]
+                           [--format json|binary] [--batch 1] [--output results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+import metrics
+import telemetry
+from test_mqtt_pub import scenario_reading
+
+
+# Configuration
+DEFAULT_DEVICES = 10
+DEFAULT_RATE = 50.0  # Messages per second per device
+DEFAULT_DURATION = 10.0  # Seconds of load
+DRAIN_TIMEOUT = 30.0  # Seconds to wait for the backend to catch up after the load stops
+TICK = 0.01  # Load generator pacing interval in seconds
+TOPIC_SENSORS = "wokwi/sensors/{device}"
+TOPIC_ACTUATORS = "wokwi/actuators/{device}"
+STARTUP_TIMEOUT = 30.0  # Seconds for the cold start probe
+
+# Run in a fresh interpreter: times `import backend_service`, start() and the
+# first reading through the pipeline (which includes up to pipeline.BATCH_TIMEOUT
+# of batching delay), not counting the import of this harness, and lists the
+# heavy modules loaded by then
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import backend_service
+imported = time.perf_counter()
+from benchmark import FakeBroker, FakeClient
+harness = time.perf_counter() - imported
+broker = FakeBroker()
+backend_service.start(broker.client_factory)
+ready = time.perf_counter() - harness
+FakeClient(broker).publish("wokwi/sensors/probe", json.dumps({"temp": 21.0, "humidity": 50.0, "flow": 10.0}))
+deadline = time.monotonic() + 10
+while not backend_service.pipeline.stats()["processed"] and time.monotonic() < deadline:
+    time.sleep(0.001)
+ingested = time.perf_counter() - harness
+heavy = sorted(name for name in ("pandas", "numpy", "openpyxl", "paho") if name in sys.modules)
+backend_service.stop()
+print(json.dumps({"import_ms": (imported - started) * 1000, "ready_ms": (ready - started) * 1000,
+                  "first_ingest_ms": (ingested - started) * 1000, "heavy_modules": heavy}))
+"""
+
+
+def topic_matches(pattern, topic):
+    """MQTT topic filter matching with '+' and '#' wildcards."""
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+class FakeMessage:
+    def __init__(self, topic, payload, qos=0):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.sent = time.perf_counter()  # When it was published (not part of paho's message)
+
+
+class FakeMessageInfo:
+    """Returned by FakeClient.publish; the broker acknowledges it after its ack_delay."""
+
+    def __init__(self, ack_delay):
+        self.acked_at = time.monotonic() + ack_delay
+
+    def wait_for_publish(self, timeout=None):
+        remaining = self.acked_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining if timeout is None else min(remaining, timeout))
+
+
+class FakeBroker:
+    """
+    Routes published messages to the inboxes of subscribed FakeClients.
+    Shared subscriptions ($share/<group>/<filter>) deliver each message to
+    one member of the group, in turn. Publishes are acknowledged after
+    `ack_delay` seconds (a network round trip).
+    """
+
+    def __init__(self, ack_delay=0.0):
+        self.ack_delay = ack_delay
+        self._subscriptions = []  # (topic filter, group or None, client)
+        self._turns = {}  # group -> messages delivered to it
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def client_factory(self, client_id=None, clean_session=True):
+        """transport.MqttTransport client factory connecting to this broker."""
+        return FakeClient(self)
+
+    def subscribe(self, client, pattern):
+        group = None
+        if pattern.startswith("$share/"):
+            _, group, pattern = pattern.split("/", 2)
+        with self._lock:
+            self._subscriptions.append((pattern, group, client))
+
+    def unsubscribe_all(self, client):
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s[2] is not client]
+
+    def publish(self, topic, payload, qos=0):
+        message = FakeMessage(topic, payload, qos)
+        with self._lock:
+            self.published += 1
+            clients = set()
+            groups = {}
+            for pattern, group, client in self._subscriptions:
+                if topic_matches(pattern, topic):
+                    if group is None:
+                        clients.add(client)
+                    elif client not in groups.setdefault(group, []):
+                        groups[group].append(client)
+            for group, members in groups.items():
+                turn = self._turns[group] = self._turns.get(group, -1) + 1
+                clients.add(members[turn % len(members)])
+        for client in clients:
+            client._inbox.put(message)
+
+
+class FakeClient:
+    """
+    Stand-in for paho.mqtt.client.Client connected to a FakeBroker.
+    Callbacks run on the client's own loop thread, like paho's network thread.
+    """
+
+    def __init__(self, broker, userdata=None):
+        self.broker = broker
+        self.userdata = userdata
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+        self._inbox = queue.Queue()
+        self._thread = None
+
+    def connect(self, host, port=1883, keepalive=60):
+        return 0
+
+    def connect_async(self, host, port=1883, keepalive=60):
+        pass
+
+    def max_inflight_messages_set(self, inflight):
+        pass
+
+    def max_queued_messages_set(self, queue_size):
+        pass
+
+    def reconnect_delay_set(self, min_delay=1, max_delay=120):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for pattern, _ in topics:
+            self.broker.subscribe(self, pattern)
+        return 0, 1
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.broker.publish(topic, payload, qos)
+        return FakeMessageInfo(self.broker.ack_delay)
+
+    def loop_start(self):
+        # Connect (and subscribe) before returning, so no early message is missed
+        if self.on_connect:
+            self.on_connect(self, self.userdata, {}, 0)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            message = self._inbox.get()
+            if message is None:
+                return
+            if self.on_message:
+                self.on_message(self, self.userdata, message)
+
+    def loop_stop(self):
+        if self._thread:
+            self._inbox.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def disconnect(self):
+        self.broker.unsubscribe_all(self)
+        if self.on_disconnect:
+            self.on_disconnect(self, self.userdata, 0)
+
+
+class AgentBridge:
+    """
+    Runs one IntelligentAgent per device on sensor messages and publishes its
+    commands; a second client plays the actuators and records the latency
+    from the sensor message to the command arriving.
+    """
+
+    def __init__(self, broker, min_dwell=0.0):
+        from agent import IntelligentAgent
+
+        self._agent_class = IntelligentAgent
+        self.min_dwell = min_dwell
+        self.agents = {}
+        self.origins = {}  # device -> send times of the sensor messages behind queued commands
+        self.latencies = []
+        self.commands = 0
+
+        self.client = FakeClient(broker)
+        self.client.on_message = self._on_sensor
+        self.client.subscribe([(TOPIC_SENSORS.format(device="+"), 0), (TOPIC_SENSORS.format(device="+") + "/bin", 0)])
+        self.actuators = FakeClient(broker)
+        self.actuators.on_message = self._on_command
+        self.actuators.subscribe(TOPIC_ACTUATORS.format(device="+"))
+
+    def start(self):
+        self.client.loop_start()
+        self.actuators.loop_start()
+
+    def stop(self):
+        self.client.loop_stop()
+        self.actuators.loop_stop()
+
+    def pending(self):
+        """Commands published but not yet received by the actuators."""
+        return sum(len(origins) for origins in self.origins.values())
+
+    def _on_sensor(self, client, userdata, msg):
+        device = telemetry.device_from_topic(msg.topic)
+        agent = self.agents.get(device)
+        if agent is None:
+            agent = self.agents[device] = self._agent_class(None, None, min_dwell=self.min_dwell)
+        commands = agent.process_data(msg.payload)
+        if commands:
+            origins = self.origins.setdefault(device, deque())
+            for command in commands:
+                origins.append(msg.sent)
+                client.publish(TOPIC_ACTUATORS.format(device=device), command)
+
+    def _on_command(self, client, userdata, msg):
+        device = msg.topic.rsplit("/", 1)[-1]
+        self.latencies.append(time.perf_counter() - self.origins[device].popleft())
+        self.commands += 1
+
+
+def encode_payload(device_num, seq, readings, payload_format):
+    """Build a sensor message carrying one or more readings (oldest first)."""
+    if payload_format == "binary":
+        now_ms = time.time_ns() // 1_000_000
+        return b"".join(
+            telemetry.encode_binary(device_num, seq + i, now_ms - (len(readings) - 1 - i) * 1000, r["temp"],
+                                    r["humidity"], r["flow"])
+            for i, r in enumerate(readings)
+        )
+    if len(readings) == 1:
+        return json.dumps(readings[0])
+    samples = [[(len(readings) - 1 - i) * 1000, r["temp"], r["humidity"], r["flow"]] for i, r in enumerate(readings)]
+    return json.dumps({"samples": samples})
+
+
+def generate_load(client, devices, rate, duration, payload_format="json", batch=1, seed=1):
+    """
+    Publish `rate` messages per second per device for `duration` seconds.
+    Returns (messages, readings) sent.
+    """
+    rng = random.Random(seed)
+    suffix = telemetry.BINARY_SUFFIX if payload_format == "binary" else ""
+    topics = [TOPIC_SENSORS.format(device=f"bench{i:03d}") + suffix for i in range(devices)]
+    seqs = [0] * devices
+    messages = 0
+    started = time.perf_counter()
+    while True:
+        elapsed = time.perf_counter() - started
+        if elapsed >= duration:
+            break
+        # Catch up to the number of messages due by now, in device order
+        due = int(elapsed * rate * devices)
+        while messages < due:
+            device = messages % devices
+            readings = [scenario_reading(seqs[device] + i, rng) for i in range(batch)]
+            client.publish(topics[device], encode_payload(device, seqs[device], readings, payload_format))
+            seqs[device] += batch
+            messages += 1
+        time.sleep(TICK)
+    return messages, messages * batch
+
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] for p in points}
+    result["max"] = ordered[-1]
+    result["mean"] = sum(ordered) / len(ordered)
+    return result
+
+
+def rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+
+        # Peak instead of current RSS where /proc is unavailable (kB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure_startup():
+    """Cold start of backend_service in a new interpreter (see STARTUP_PROBE)."""
+    workdir = tempfile.mkdtemp(prefix="wokwi-startup-")
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")])))
+    try:
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=workdir, env=env, capture_output=True,
+                                text=True, timeout=STARTUP_TIMEOUT, check=True)
+        process_ms = (time.perf_counter() - started) * 1000
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    startup = json.loads(result.stdout.strip().splitlines()[-1])
+    startup["process_ms"] = process_ms  # Including interpreter start-up and shutdown
+    return {key: round(value, 1) if isinstance(value, float) else value for key, value in startup.items()}
+
+
+def _ms(summary):
+    return {key: round(value * 1000, 3) for key, value in summary.items()}
+
+
+def run_benchmark(devices=DEFAULT_DEVICES, rate=DEFAULT_RATE, duration=DEFAULT_DURATION, payload_format="json",
+                  batch=1, min_dwell=0.0, seed=1, verbose=False, startup=True):
+    """Run one benchmark in a temporary working directory and return the results dict."""
+    startup = measure_startup() if startup else None
+    workdir = tempfile.mkdtemp(prefix="wokwi-bench-")
+    cwd = os.getcwd()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    if not verbose:
+        logging.disable(logging.CRITICAL)  # The scenarios trigger anomaly warnings on purpose
+    try:
+        os.chdir(workdir)  # Storage ("data") and reports are relative paths
+        with output:
+            import backend_service
+            from devices import DeviceRegistry
+            from reports import ReportWorker
+
+            # Fresh per-run state, wired exactly as backend_service.main() does
+            backend_service.devices = DeviceRegistry(backend_service.STORAGE_BACKEND, backend_service.BUFFER_RETENTION,
+                                                     backend_service.STATS_WINDOWS)
+            report_worker = backend_service.report_worker = ReportWorker(
+                os.path.join(workdir, backend_service.REPORTS_DIR), backend_service.REPORT_INTERVAL,
+                backend_service.REPORT_MIN_INTERVAL)
+            render_times = []
+            render = report_worker.render
+
+            def timed_render(device_id, stats):
+                started = time.perf_counter()
+                path = render(device_id, stats)
+                if path:
+                    render_times.append(time.perf_counter() - started)
+                return path
+
+            report_worker.render = timed_render
+
+            broker = FakeBroker()
+            bridge = AgentBridge(broker, min_dwell)
+            rss_start = rss_mb()
+            backend_service.start(broker.client_factory)
+            bridge.start()
+
+            publisher = FakeClient(broker)
+            started = time.perf_counter()
+            messages, readings = generate_load(publisher, devices, rate, duration, payload_format, batch, seed)
+            load_elapsed = time.perf_counter() - started
+
+            # Wait for the backend to persist everything that was accepted
+            deadline = time.monotonic() + DRAIN_TIMEOUT
+            while time.monotonic() < deadline:
+                stats = backend_service.pipeline.stats()
+                if stats["processed"] + (stats["dropped"] + stats["invalid"]) * batch >= readings:
+                    break
+                time.sleep(0.01)
+            ingest_elapsed = time.perf_counter() - started
+            while bridge.pending() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            rss_end = rss_mb()
+
+            bridge.stop()
+            backend_service.stop()
+            stats = backend_service.pipeline.stats()
+
+            # Restart: rebuild fresh device state from the write-ahead log
+            recovery = None
+            if backend_service.WAL_ENABLED:
+                backend_service.devices = DeviceRegistry(backend_service.STORAGE_BACKEND,
+                                                         backend_service.BUFFER_RETENTION,
+                                                         backend_service.STATS_WINDOWS)
+                backend_service.wal.open()
+                started = time.perf_counter()
+                restored = backend_service.recover()
+                recovery = {"readings": restored, "ms": round((time.perf_counter() - started) * 1000, 1)}
+                backend_service.devices.close()
+                backend_service.wal.close()
+    finally:
+        os.chdir(cwd)
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {
+            "devices": devices,
+            "rate_per_device": rate,
+            "duration_s": duration,
+            "format": payload_format,
+            "batch": batch,
+            "ingest_workers": backend_service.INGEST_WORKERS,
+        },
+        "startup": startup,
+        "load": {
+            "messages": messages,
+            "readings": readings,
+            "elapsed_s": round(load_elapsed, 3),
+            "messages_per_s": round(messages / load_elapsed, 1),
+        },
+        "ingest": {
+            "processed": stats["processed"],
+            "dropped": stats["dropped"],
+            "invalid": stats["invalid"],
+            "batches": stats["batches"],
+            "max_queue_depth": stats["max_depth"],
+            "elapsed_s": round(ingest_elapsed, 3),
+            "readings_per_s": round(stats["processed"] / ingest_elapsed, 1),
+        },
+        "agent": {
+            "commands": bridge.commands,
+            "latency_ms": _ms(percentiles(bridge.latencies)),
+        },
+        "recovery": recovery,
+        "reports": {
+            "rendered": len(render_times),
+            "coalesced": report_worker.coalesced,
+            "render_ms": _ms(percentiles(render_times)),
+        },
+        "timings": {
+            name: metric["series"][0]["value"]
+            for name, metric in metrics.REGISTRY.snapshot().items()
+            if metric["type"] == "histogram" and metric["series"]
+        },
+        "memory": {
+            "rss_start_mb": round(rss_start, 1),
+            "rss_end_mb": round(rss_end, 1),
+            "rss_growth_mb": round(rss_end - rss_start, 1),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark on an in-process MQTT broker")
+    parser.add_argument("--devices", type=int, default=DEFAULT_DEVICES)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="messages per second per device")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds of load")
+    parser.add_argument("--format", choices=["json", "binary"], default="json")
+    parser.add_argument("--batch", type=int, default=1, help="readings per message")
+    parser.add_argument("--min-dwell", type=float, default=0.0, help="agent actuator dwell time in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-startup", action="store_true", help="skip the cold start measurement")
+    parser.add_argument("--output", help="also write the JSON results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the services' console output")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.devices, args.rate, args.duration, args.format, args.batch, args.min_dwell,
+                            args.seed, args.verbose, not args.no_startup)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Streaming anomaly and drift detection with O(1) state per metric.
+
+Every sample updates, per metric:
+  - an exponentially weighted mean and variance (z-score against the recent
+    baseline),
+  - a streaming median and median absolute deviation (robust z-score; a
+    sample far outside the usual spread is a spike),
+  - two-sided CUSUM of the clipped z-score (slow drift away from the
+    baseline, long before a fixed limit is reached),
+  - the rate of change between consecutive samples, against a per-metric
+    limit (a sudden jump, e.g. a leak opening); the step must also be
+    outside the usual spread (the EW mean absolute deviation), so sensor
+    noise at a high sample rate is not mistaken for a jump.
+
+The cost is a few float operations per metric, so detectors run inline on
+every reading. The agent switches actuators on early while a metric is
+rising (see Rule.early_threshold) and the backend keeps a DetectorSet per
+device whose snapshot feeds the report recommendations.
+
+The rising flag only depends on the EW statistics and the CUSUM, which are
+linear recurrences and a running minimum, so RisingDetector computes it
+for whole columns of many devices with NumPy (used by rules.evaluate_batch
+to replay history); it gives the same flags as MetricDetector.
+"""
+import math
+import threading
+from collections import Counter, deque
+
+
+# Configuration
+ALPHA = 0.05  # EW smoothing factor of the baseline (~20-sample memory)
+WARMUP = 30  # Samples before any event is reported
+Z_LIMIT = 4.0  # Robust z-score of a spike; also clips the CUSUM input
+CUSUM_K = 0.5  # Allowance in standard deviations per sample
+CUSUM_H = 8.0  # Decision interval; a drift is reported while the sum exceeds it
+MAD_TO_STD = 1.4826  # Scale of the MAD to a normal standard deviation
+RECENT_EVENTS = 10  # Events kept per device for reports
+SCAN_CHUNK = 256  # Samples per vectorized step of RisingDetector
+SCAN_BLOCK = 65536  # Samples (all devices together) RisingDetector works on at once, so temporaries stay in cache
+
+# Per-metric rate-of-change limit (units per second) and noise floor of the scale
+METRIC_SETTINGS = {
+    "temperature": {"max_rate": 0.5, "min_scale": 0.1},
+    "humidity": {"max_rate": 2.0, "min_scale": 0.5},
+    "flow": {"max_rate": 5.0, "min_scale": 0.5},
+}
+ALIASES = {"temp": "temperature"}  # The agent's reading names
+
+EVENT_LABELS = {
+    "spike_up": "spike above the usual range",
+    "spike_down": "spike below the usual range",
+    "drift_up": "drifting upward",
+    "drift_down": "drifting downward",
+    "rate_up": "rising faster than its rate limit",
+    "rate_down": "falling faster than its rate limit",
+}
+
+
+class MetricDetector:
+    """Detectors for one metric of one device."""
+
+    def __init__(self, alpha=ALPHA, z_limit=Z_LIMIT, cusum_k=CUSUM_K, cusum_h=CUSUM_H, max_rate=None,
+                 min_scale=0.0, warmup=WARMUP):
+        self.alpha = alpha
+        self.z_limit = z_limit
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.max_rate = max_rate
+        self.min_scale = min_scale
+        self.warmup = warmup
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        self.median = 0.0
+        self.mad = 0.0
+        self.deviation = 0.0  # EW mean absolute deviation from the mean
+        self.cusum_high = 0.0
+        self.cusum_low = 0.0
+        self.z = 0.0
+        self.robust_z = 0.0
+        self.rate = 0.0
+        self.rising = False  # Drifting up or jumping up at the last sample
+        self.falling = False
+        self._last = None  # (value, time in seconds)
+
+    def update(self, x, t):
+        """Feed one sample taken at `t` seconds; returns the event kinds it triggered."""
+        self.count += 1
+        if self._last is None:
+            self.mean = self.median = x
+            self._last = (x, t)
+            return []
+
+        # Score the sample against the baseline before it
+        scale = max(math.sqrt(self.variance), self.min_scale)
+        robust_scale = max(MAD_TO_STD * self.mad, self.min_scale)
+        jump_scale = max(MAD_TO_STD * self.deviation, self.min_scale)
+        self.z = (x - self.mean) / scale if scale else 0.0
+        self.robust_z = (x - self.median) / robust_scale if robust_scale else 0.0
+        last_x, last_t = self._last
+        self.rate = (x - last_x) / (t - last_t) if t > last_t else 0.0
+        self._last = (x, t)
+
+        # CUSUM; clipping keeps one outlier from looking like a drift
+        z = max(-self.z_limit, min(self.z, self.z_limit))
+        drifting_up = self.cusum_high > self.cusum_h
+        drifting_down = self.cusum_low > self.cusum_h
+        self.cusum_high = max(0.0, self.cusum_high + z - self.cusum_k)
+        self.cusum_low = max(0.0, self.cusum_low - z - self.cusum_k)
+
+        # Learn the sample
+        d = x - self.mean
+        self.mean += self.alpha * d
+        self.variance = (1 - self.alpha) * (self.variance + self.alpha * d * d)
+        self.deviation += self.alpha * (abs(x - self.mean) - self.deviation)
+        step = self.alpha * robust_scale
+        self.median += step if x > self.median else -step if x < self.median else 0.0
+        self.mad += self.alpha * (abs(x - self.median) - self.mad)
+
+        if self.count <= self.warmup:
+            return []
+        events = []
+        if self.robust_z > self.z_limit:
+            events.append("spike_up")
+        elif self.robust_z < -self.z_limit:
+            events.append("spike_down")
+        # Drifts are reported once, when the sum crosses the decision interval
+        if self.cusum_high > self.cusum_h and not drifting_up:
+            events.append("drift_up")
+        if self.cusum_low > self.cusum_h and not drifting_down:
+            events.append("drift_down")
+        jump_up = jump_down = False
+        if self.max_rate is not None and abs(x - last_x) > self.z_limit * jump_scale:
+            jump_up = self.rate > self.max_rate
+            jump_down = self.rate < -self.max_rate
+            if jump_up:
+                events.append("rate_up")
+            elif jump_down:
+                events.append("rate_down")
+        self.rising = self.cusum_high > self.cusum_h or jump_up
+        self.falling = self.cusum_low > self.cusum_h or jump_down
+        return events
+
+    @property
+    def state(self):
+        if self.count <= self.warmup:
+            return "Learning"
+        if self.rising:
+            return "Rising"
+        if self.falling:
+            return "Falling"
+        return "Stable"
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "baseline": self.mean,
+            "z": self.robust_z,
+            "rate": self.rate,
+            "cusum_high": self.cusum_high,
+            "cusum_low": self.cusum_low,
+        }
+
+
+def detector_for(metric, **options):
+    """A MetricDetector with the configured settings of a metric (by report or agent name)."""
+    settings = dict(METRIC_SETTINGS.get(ALIASES.get(metric, metric), {}))
+    settings.update(options)
+    return MetricDetector(**settings)
+
+
+def _linear_scan(np, inputs, decay, initial):
+    """
+    y[i] = decay * y[i - 1] + inputs[..., i] along the last axis, from
+    y[-1] = initial, SCAN_CHUNK samples at a time: within a chunk y is a
+    cumulative sum of the inputs scaled by powers of decay.
+    """
+    output = np.empty(inputs.shape)
+    if decay <= 0:
+        output[...] = inputs
+        return output
+    # Keep decay ** -chunk far from overflowing for short memories
+    chunk = max(1, min(SCAN_CHUNK, int(-600 / math.log(decay)) if decay < 1 else SCAN_CHUNK))
+    powers = decay ** np.arange(1, chunk + 1)
+    carry = np.asarray(initial, np.float64)
+    for start in range(0, inputs.shape[-1], chunk):
+        part = inputs[..., start:start + chunk]
+        scale = powers[:part.shape[-1]]
+        y = scale * (carry[..., None] + np.cumsum(part / scale, axis=-1))
+        output[..., start:start + chunk] = y
+        carry = y[..., -1]
+    return output
+
+
+class RisingDetector:
+    """
+    MetricDetector.rising for an array of devices, a batch of samples at a
+    time. Carries each device's state between calls; feeding the same
+    samples to a MetricDetector per device gives the same flags.
+    """
+
+    def __init__(self, shape, metric=None, **options):
+        import numpy as np
+
+        self.settings = detector_for(metric, **options) if metric else MetricDetector(**options)
+        self.count = np.zeros(shape, np.int64)
+        self.mean = np.zeros(shape)
+        self.variance = np.zeros(shape)
+        self.deviation = np.zeros(shape)
+        self.cusum_high = np.zeros(shape)
+        self.last_x = np.zeros(shape)
+        self.last_t = np.zeros(shape)
+        self.rising = np.zeros(shape, bool)
+
+    def update(self, timestamps, values):
+        """Feed samples of shape (..., n) taken at `timestamps` seconds; returns the rising flag after each."""
+        import numpy as np
+
+        x = np.asarray(values, np.float64)
+        t = np.broadcast_to(np.asarray(timestamps, np.float64), x.shape)
+        step = max(SCAN_CHUNK, SCAN_BLOCK // max(1, self.count.size))
+        if x.shape[-1] <= step:
+            return self._update(np, t, x)
+        return np.concatenate([self._update(np, t[..., start:start + step], x[..., start:start + step])
+                               for start in range(0, x.shape[-1], step)], axis=-1)
+
+    def _update(self, np, t, x):
+        s = self.settings
+        if not x.shape[-1]:
+            return np.zeros(x.shape, bool)
+        # A device's first sample only seeds the baseline, like MetricDetector.update
+        fresh = self.count == 0
+        mean = np.where(fresh, x[..., 0], self.mean)
+        last_x = np.where(fresh, x[..., 0], self.last_x)
+        last_t = np.where(fresh, t[..., 0], self.last_t)
+
+        def before(first, series):
+            return np.concatenate([first[..., None], series[..., :-1]], axis=-1)
+
+        keep = 1 - s.alpha
+        means = _linear_scan(np, s.alpha * x, keep, mean)
+        d = x - before(mean, means)
+        variances = _linear_scan(np, keep * s.alpha * d * d, keep, self.variance)
+        deviations = _linear_scan(np, s.alpha * np.abs(x - means), keep, self.deviation)
+
+        scale = np.maximum(np.sqrt(before(self.variance, variances)), s.min_scale)
+        z = np.where(scale > 0, d / np.where(scale > 0, scale, 1.0), 0.0)
+        # CUSUM: h[i] = max(0, h[i-1] + y[i]) is the running sum minus its running minimum
+        sums = np.cumsum(np.clip(z, -s.z_limit, s.z_limit) - s.cusum_k, axis=-1)
+        cusum = sums - np.minimum(-self.cusum_high[..., None], np.minimum.accumulate(sums, axis=-1))
+
+        rising = cusum > s.cusum_h
+        if s.max_rate is not None:
+            step = x - before(last_x, x)
+            elapsed = t - before(last_t, t)
+            rate = np.where(elapsed > 0, step / np.where(elapsed > 0, elapsed, 1.0), 0.0)
+            jump_scale = np.maximum(MAD_TO_STD * before(self.deviation, deviations), s.min_scale)
+            rising |= (np.abs(step) > s.z_limit * jump_scale) & (rate > s.max_rate)
+        # The flag is left alone during the warmup
+        counts = self.count[..., None] + np.arange(1, x.shape[-1] + 1)
+        rising = np.where(counts > s.warmup, rising, self.rising[..., None])
+
+        self.count = counts[..., -1]
+        self.mean = means[..., -1]
+        self.variance = variances[..., -1]
+        self.deviation = deviations[..., -1]
+        self.cusum_high = cusum[..., -1]
+        self.last_x = x[..., -1]
+        self.last_t = t[..., -1]
+        self.rising = rising[..., -1]
+        return rising
+
+
+class DetectorSet:
+    """Thread-safe detectors for every metric of one device, plus its recent events."""
+
+    def __init__(self, metrics, **options):
+        self.metrics = list(metrics)
+        self.detectors = [detector_for(metric, **options) for metric in self.metrics]
+        self.counts = Counter()  # (metric, kind) -> events
+        self.recent = deque(maxlen=RECENT_EVENTS)  # (time, metric, kind, value)
+        self._lock = threading.Lock()
+
+    def update(self, t, values):
+        """Feed one sample of every metric; returns (metric, kind, value) for each event."""
+        events = []
+        with self._lock:
+            for metric, detector, x in zip(self.metrics, self.detectors, values):
+                for kind in detector.update(x, t):
+                    events.append((metric, kind, x))
+                    self.counts[metric, kind] += 1
+                    self.recent.append((t, metric, kind, x))
+        return events
+
+    def rising(self):
+        """Metric name -> whether it is currently rising."""
+        return {metric: detector.rising for metric, detector in zip(self.metrics, self.detectors)}
+
+    def snapshot(self):
+        with self._lock:
+            result = {metric: detector.snapshot() for metric, detector in zip(self.metrics, self.detectors)}
+            for metric in self.metrics:
+                result[metric]["events"] = {kind: count for (name, kind), count in self.counts.items() if name == metric}
+            result["recent"] = list(self.recent)
+        return result
+
+
+def describe(metric, kind, value):
+    return f"{metric} {EVENT_LABELS.get(kind, kind)} ({value:.1f})"
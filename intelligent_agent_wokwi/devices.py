@@ -0,0 +1,125 @@
+"""
+Per-device state for multi-device ingestion.
+
+Each device ID (see telemetry.device_from_topic) gets its own shard with a
+ring buffer, streaming statistics, anomaly detectors, storage and report
+counter. Shards are created on first use; the ingest pipeline routes every
+device to a single worker thread, so a shard is only ever written by one
+thread.
+"""
+import logging
+import threading
+import time
+
+import metrics
+import storage as storage_backends
+from detectors import DetectorSet
+from ring_buffer import RingBuffer, BUFFER_RETENTION
+from stats import StreamingStats, DEFAULT_WINDOWS
+
+
+# Configuration
+FLUSH_INTERVAL = storage_backends.FLUSH_INTERVAL  # Seconds between storage flushes
+
+log = logging.getLogger("devices")
+FLUSH_SECONDS = metrics.histogram("wokwi_storage_flush_seconds", "Time to flush one device's pending readings to disk")
+
+
+class DeviceShard:
+    def __init__(self, device_id, storage, buffer_retention=BUFFER_RETENTION, stats_windows=DEFAULT_WINDOWS):
+        self.device_id = device_id
+        self.buffer = RingBuffer(buffer_retention)
+        self.stats = StreamingStats(stats_windows)
+        self.detectors = DetectorSet(self.stats.metrics)
+        self.storage = storage
+        self.counter = 0  # Readings since the last count-triggered report
+
+    def add(self, timestamp_ns, temp, humidity, flow):
+        """Record one reading; returns the (metric, kind, value) anomalies it triggered."""
+        self.buffer.append(timestamp_ns, temp, humidity, flow)
+        self.stats.update(timestamp_ns, temp, humidity, flow)
+        events = self.detectors.update(timestamp_ns / 1e9, (temp, humidity, flow))
+        # Append to the storage batch (flushed to disk in the background)
+        self.storage.append(timestamp_ns, temp, humidity, flow)
+        self.counter += 1
+        return events
+
+    def restore(self, readings):
+        """
+        Rebuild the buffer, statistics and detectors from replayed readings
+        (oldest first) without triggering reports. Readings newer than the
+        last one in storage were lost from it in a crash and are appended
+        again.
+        """
+        # Only binary storage can tell what it already has; the Excel backend is not repaired
+        last_timestamp = getattr(self.storage, "last_timestamp", None)
+        stored_until = float("inf") if last_timestamp is None else last_timestamp()
+        if stored_until is None:
+            stored_until = -1  # Empty storage: everything was lost
+        for timestamp_ns, temp, humidity, flow in readings:
+            self.buffer.append(timestamp_ns, temp, humidity, flow)
+            self.stats.update(timestamp_ns, temp, humidity, flow)
+            self.detectors.update(timestamp_ns / 1e9, (temp, humidity, flow))
+            if timestamp_ns > stored_until:
+                self.storage.append(timestamp_ns, temp, humidity, flow)
+
+
+class DeviceRegistry:
+    """
+    Creates and owns device shards.
+
+    Binary storage for all devices is flushed by one background thread
+    instead of one flusher thread per device.
+    """
+
+    def __init__(self, storage_backend=storage_backends.STORAGE_BACKEND, buffer_retention=BUFFER_RETENTION,
+                 stats_windows=DEFAULT_WINDOWS, flush_interval=FLUSH_INTERVAL):
+        self.storage_backend = storage_backend
+        self.buffer_retention = buffer_retention
+        self.stats_windows = stats_windows
+        self.flush_interval = flush_interval
+        self._shards = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def start(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name="storage-flush", daemon=True)
+        self._flusher.start()
+
+    def get(self, device_id):
+        shard = self._shards.get(device_id)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(device_id)
+                if shard is None:
+                    options = {"background": False} if self.storage_backend == "binary" else {}
+                    storage = storage_backends.create_storage(self.storage_backend, device_id=device_id, **options)
+                    shard = DeviceShard(device_id, storage, self.buffer_retention, self.stats_windows)
+                    self._shards[device_id] = shard
+        return shard
+
+    def shards(self):
+        """Return a snapshot list of all shards."""
+        with self._lock:
+            return list(self._shards.values())
+
+    def flush(self):
+        for shard in self.shards():
+            started = time.perf_counter()
+            try:
+                shard.storage.flush()
+            except Exception as e:
+                log.error("Error flushing storage for %s: %s", shard.device_id, e)
+            FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._stopped.set()
+        if self._flusher:
+            self._flusher.join()
+        for shard in self.shards():
+            shard.storage.close()
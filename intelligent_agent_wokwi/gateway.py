@@ -0,0 +1,351 @@
+"""
+Actuator gateway for the Node-RED dashboard, served by the backend itself.
+
+It replaces the Node-RED flow in nodered/flows.json with the same
+endpoints on the same port, so web/index-nodered.html works unchanged:
+
+    POST /api/actuator   {"command": "ACT1:ON"} -> {"status": "ok", "command": ...}
+                         (commands must match ACT<n>:ON|OFF, anything else gets 400)
+    GET  /api/sensors    latest reading
+    GET  /ws/sensors     WebSocket feed of live readings (JSON text frames)
+
+The gateway runs an asyncio server on its own event loop thread inside the
+backend process. Readings are pushed from the ingest pipeline as soon as
+they are decoded and commands go straight to the backend's MQTT transport
+(backend_service.send_command), so neither takes a hop through a separate
+JS runtime. Each reading is serialised and framed once for all clients of
+its device (with no client only the newest reading is, for /api/sensors).
+Every connection gets a hub.HubClient queue, so a client that cannot keep
+up loses its oldest queued frames instead of slowing down the others, just
+as on the SSE hub.
+
+Both endpoints accept an optional device ('"device": ID' in the command,
+'?device=ID' on the feed); the default is the project's device, as in the
+Node-RED flow.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import struct
+import threading
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+from hub import HubClient
+from storage import is_valid_device_id
+
+
+# Configuration
+GATEWAY_PORT = 1880  # The port Node-RED used, so the dashboard needs no changes
+DEVICE_ID = "sayf_project"  # Device of the Node-RED flow (wokwi/sensors/sayf_project)
+CLIENT_QUEUE_SIZE = 1000  # Frames queued per WebSocket client before the oldest are dropped
+MAX_HEADER_SIZE = 16384
+MAX_BODY_SIZE = 65536  # Also the largest accepted WebSocket frame
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"  # RFC 6455 handshake constant
+COMMAND_PATTERN = re.compile(r"ACT\d+:(ON|OFF)")  # One actuator command; batching adds the newlines itself
+
+log = logging.getLogger("gateway")
+COMMANDS = metrics.counter("wokwi_gateway_commands_total", "Actuator commands received over HTTP")
+DROPPED = metrics.counter("wokwi_gateway_dropped_total", "Readings dropped for slow WebSocket clients")
+
+REASONS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+
+def ws_accept(key):
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key."""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def ws_frame(payload, opcode=0x1):
+    """A final, unmasked (server-to-client) WebSocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def reading_json(device_id, timestamp_ns, temp, humidity, flow):
+    # Same fields as the Node-RED flow: the sensor values plus an ISO timestamp
+    timestamp = datetime.fromtimestamp(timestamp_ns / 1e9, timezone.utc).isoformat().replace("+00:00", "Z")
+    return json.dumps({"device": device_id, "temp": temp, "humidity": humidity, "flow": flow,
+                       "timestamp": timestamp}, separators=(",", ":"))
+
+
+class Gateway:
+    def __init__(self, send_command, host="", port=GATEWAY_PORT, device_id=DEVICE_ID,
+                 queue_size=CLIENT_QUEUE_SIZE):
+        self.send_command = send_command
+        self.host = host
+        self.port = port
+        self.device_id = device_id
+        self.queue_size = queue_size
+        self.loop = None
+        self._server = None
+        self._clients = {}  # HubClient -> (asyncio.Event waking its sender task, the sender task)
+        self._lock = threading.Lock()  # Guards _clients, which publish() reads from other threads
+        self._writers = set()  # Every open connection, closed on stop()
+        self._latest = {}  # device -> JSON of its newest reading
+        self._thread = None
+        self._started = threading.Event()
+        self._error = None
+        metrics.gauge("wokwi_gateway_clients", "Open WebSocket feed connections", fn=lambda: len(self._clients))
+
+    def start(self):
+        """Serve on a background event loop; returns once the port is bound."""
+        self._thread = threading.Thread(target=self._run, name="gateway", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        if self._error:
+            raise self._error
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host or None, self.port, limit=MAX_HEADER_SIZE))
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("Gateway listening on port %d", self.port)
+        self._started.set()
+        loop = self.loop
+        loop.run_forever()
+        loop.close()
+
+    def stop(self):
+        loop, self.loop = self.loop, None  # Readings published from now on are ignored
+        if not loop or self._error:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+
+    async def _close(self):
+        self._server.close()
+        # Say goodbye to the feed clients, then drop every connection, including idle keep-alive ones
+        with self._lock:
+            clients = list(self._clients.items())
+        senders = []
+        for client, (wakeup, sender) in clients:
+            client.push(client.device, ws_frame(b"", 0x8))
+            wakeup.set()
+            senders.append(sender)
+        if senders:
+            await asyncio.wait(senders, timeout=1.0)
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def publish(self, device_id, readings):
+        """Broadcast decoded (timestamp_ns, temp, humidity, flow) readings; safe from any thread."""
+        loop = self.loop
+        if not loop or not readings:
+            return
+        latest = reading_json(device_id, *readings[-1])
+        self._latest[device_id] = latest
+        with self._lock:
+            clients = [(client, wakeup) for client, (wakeup, _) in self._clients.items() if client.device == device_id]
+        if not clients:
+            return
+        texts = [reading_json(device_id, *reading) for reading in readings[:-1]] + [latest]
+        frames = [ws_frame(text.encode()) for text in texts]
+        for client, _ in clients:
+            for frame in frames:
+                client.push(device_id, frame)
+        loop.call_soon_threadsafe(self._wake, [wakeup for _, wakeup in clients])
+
+    @staticmethod
+    def _wake(wakeups):
+        for wakeup in wakeups:
+            wakeup.set()
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        try:
+            while True:
+                request = await self._read_request(reader, writer)
+                if request is None:
+                    break
+                method, url, headers, body = request
+                if url.path == "/ws/sensors" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._feed(reader, writer, headers, parse_qs(url.query))
+                    break
+                status, payload = self._route(method, url.path, body)
+                self._respond(writer, status, payload, headers)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            log.error("Error handling gateway connection: %s", e)
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader, writer):
+        """Read one HTTP/1.1 request; None at the end of the connection or after an error reply."""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError:
+            self._respond(writer, 413, {"error": "Headers too large"}, {})
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            self._respond(writer, 400, {"error": "Bad request line"}, {})
+            return None
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_SIZE:
+            self._respond(writer, 413 if length > 0 else 400, {"error": "Invalid Content-Length"}, {})
+            return None
+        body = await reader.readexactly(length) if length else b""
+        return method, urlsplit(target), headers, body
+
+    def _route(self, method, path, body):
+        if path in ("/api/actuator", "/actuator"):
+            if method == "OPTIONS":
+                return 204, None
+            if method != "POST":
+                return 405, {"error": "Use POST"}
+            return self._command(body)
+        if path == "/api/sensors":
+            if method not in ("GET", "OPTIONS"):
+                return 405, {"error": "Use GET"}
+            latest = self._latest.get(self.device_id)
+            return 200, json.loads(latest) if latest else {"error": "No data available"}
+        return 404, {"error": "Not found"}
+
+    def _command(self, body):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            request = None
+        command = request.get("command") if isinstance(request, dict) else None
+        if not isinstance(command, str) or not COMMAND_PATTERN.fullmatch(command):
+            return 400, {"error": "Invalid command"}
+        device = request.get("device") or self.device_id
+        if not isinstance(device, str) or not is_valid_device_id(device):
+            return 400, {"error": "Invalid device"}
+        self.send_command(device, command)
+        COMMANDS.inc()
+        return 200, {"status": "ok", "command": command}
+
+    def _respond(self, writer, status, payload, request_headers):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        headers = dict(CORS_HEADERS)
+        if payload is not None:
+            headers["Content-Type"] = "application/json"
+        headers["Content-Length"] = str(len(body))
+        if request_headers.get("connection", "").lower() == "close":
+            headers["Connection"] = "close"
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode() + b"\r\n" + body)
+
+    async def _feed(self, reader, writer, headers, query):
+        key = headers.get("sec-websocket-key")
+        device = query.get("device", [self.device_id])[0]
+        if not key or not is_valid_device_id(device):
+            self._respond(writer, 400, {"error": "Invalid device" if key else "Missing Sec-WebSocket-Key"}, {})
+            return
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {ws_accept(key)}\r\n\r\n").encode())
+        client = HubClient(device, queue_size=self.queue_size)
+        wakeup = asyncio.Event()
+        sender = asyncio.ensure_future(self._send_frames(client, wakeup, writer))
+        with self._lock:
+            self._clients[client] = (wakeup, sender)
+        closing = False
+        try:
+            # Client frames are only read for control messages; text from the dashboard is ignored
+            while not sender.done():
+                opcode, payload = await self._read_frame(reader)
+                if opcode == 0x8:  # Close: echo it, then end the connection
+                    client.push(device, ws_frame(payload[:2], 0x8))
+                    wakeup.set()
+                    closing = True
+                    break
+                if opcode == 0x9:  # Ping
+                    client.push(device, ws_frame(payload, 0xA))
+                    wakeup.set()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                self._clients.pop(client, None)
+            try:
+                if closing:  # Let the sender flush the close echo first
+                    await asyncio.wait_for(asyncio.shield(sender), 1.0)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            client.close()
+            wakeup.set()
+            if not sender.done():
+                try:
+                    await asyncio.wait_for(sender, 1.0)
+                except (asyncio.TimeoutError, ConnectionError):
+                    pass
+
+    async def _send_frames(self, client, wakeup, writer):
+        # All frames queued since the last write go out in one write
+        dropped = 0
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            frames = client.next_frames(0)
+            if client.dropped > dropped:
+                DROPPED.inc(client.dropped - dropped)
+                dropped = client.dropped
+            if frames is None:  # Closed
+                return
+            if not frames:
+                continue
+            writer.write(b"".join(frames))
+            await writer.drain()
+            if frames[-1][0] == 0x88:  # A close frame was the last one
+                return
+
+    async def _read_frame(self, reader):
+        head = await reader.readexactly(2)
+        opcode = head[0] & 0x0F
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY_SIZE:
+            raise ValueError("WebSocket frame too large")
+        mask = await reader.readexactly(4) if head[1] & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
@@ -0,0 +1,350 @@
+"""
+Time-range queries over a device's binary storage segments.
+
+Each segment gets a sparse sidecar index (segment_NNNNNN.idx) with one
+entry per block of BLOCK_RECORDS records: the block's timestamp range and
+the count, min, max and sum of every metric. Segments are append-only, so
+a full block never changes and its entry is written once; the index is
+extended incrementally as new blocks fill up.
+
+A range query only reads the blocks whose timestamp range overlaps the
+request, and a downsampled query answers every block that falls inside a
+single output bucket from its summary without reading it. Loading a
+dashboard's history therefore costs about as much as the data it shows,
+not as much as the device's whole history. Readings still in the storage
+batch (up to one flush interval) are not visible until they are flushed.
+"""
+import os
+import struct
+import sys
+import threading
+import time
+
+import storage
+
+
+# Configuration
+BLOCK_RECORDS = 1024  # Records summarised by one index entry
+INDEX_SUFFIX = ".idx"
+
+# Metric names in record order (after the timestamp)
+METRICS = ["temperature", "humidity", "flow"]
+
+# Index entry: block number, record count, first/last timestamp, then min, max, sum per metric
+INDEX_ENTRY = struct.Struct("<IIqq" + "ddd" * len(METRICS))
+
+
+class Block:
+    """Summary of a run of consecutive records in one segment."""
+
+    def __init__(self, number, count, ts_min, ts_max, mins, maxs, sums):
+        self.number = number
+        self.count = count
+        self.ts_min = ts_min
+        self.ts_max = ts_max
+        self.mins = mins
+        self.maxs = maxs
+        self.sums = sums
+
+    @classmethod
+    def summarize(cls, number, records):
+        columns = list(zip(*records))
+        timestamps, values = columns[0], columns[1:]
+        return cls(
+            number,
+            len(records),
+            min(timestamps),
+            max(timestamps),
+            [min(column) for column in values],
+            [max(column) for column in values],
+            [sum(column) for column in values],
+        )
+
+    def pack(self):
+        stats = []
+        for low, high, total in zip(self.mins, self.maxs, self.sums):
+            stats.extend((low, high, total))
+        return INDEX_ENTRY.pack(self.number, self.count, self.ts_min, self.ts_max, *stats)
+
+    @classmethod
+    def unpack(cls, data):
+        number, count, ts_min, ts_max, *stats = INDEX_ENTRY.unpack(data)
+        return cls(number, count, ts_min, ts_max, list(stats[0::3]), list(stats[1::3]), list(stats[2::3]))
+
+
+class Segment:
+    """A segment file and the summaries of its blocks."""
+
+    def __init__(self, path, block_records):
+        self.path = path
+        self.index_path = path[:-len(storage.SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        self.block_records = block_records
+        self.blocks = []  # Persisted, immutable blocks
+        self.tail = None  # Summary of the trailing partial block (not persisted)
+        self.records = 0
+        self.ts_min = None  # Time range covered by the whole segment
+        self.ts_max = None
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        for offset in range(0, len(data) - len(data) % INDEX_ENTRY.size, INDEX_ENTRY.size):
+            block = Block.unpack(data[offset:offset + INDEX_ENTRY.size])
+            # Stop at anything unexpected (torn write, concurrent writer) and rebuild from there
+            if block.number != len(self.blocks) or block.count > self.block_records:
+                break
+            if self.blocks and self.blocks[-1].count < self.block_records:
+                break
+            self.blocks.append(block)
+        valid = len(self.blocks) * INDEX_ENTRY.size
+        if valid != len(data):
+            with open(self.index_path, "r+b") as f:
+                f.truncate(valid)
+
+    @property
+    def indexed_records(self):
+        if not self.blocks:
+            return 0
+        return (len(self.blocks) - 1) * self.block_records + self.blocks[-1].count
+
+    def refresh(self, sealed):
+        """
+        Summarise records appended since the last call. Full blocks (and the
+        last block of a sealed segment, which can no longer grow) are written
+        to the index file; a partial tail is only kept in memory.
+        """
+        records = os.path.getsize(self.path) // storage.RECORD.size
+        if records == self.records and (self.tail is None or not sealed):
+            return
+        start = self.indexed_records
+        if start > records:
+            # The index does not belong to this file (e.g. it was replaced): rebuild it
+            self.blocks = []
+            start = 0
+            os.remove(self.index_path)
+        new_blocks = []
+        with open(self.path, "rb") as f:
+            number = len(self.blocks)
+            self.tail = None
+            while start < records:
+                count = min(self.block_records, records - start)
+                f.seek(start * storage.RECORD.size)
+                block = Block.summarize(number, list(storage.RECORD.iter_unpack(f.read(count * storage.RECORD.size))))
+                if count == self.block_records or sealed:
+                    new_blocks.append(block)
+                else:
+                    self.tail = block
+                start += count
+                number += 1
+        if new_blocks:
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(block.pack() for block in new_blocks))
+            self.blocks.extend(new_blocks)
+        self.records = records
+        blocks = self.all_blocks()
+        if blocks:
+            self.ts_min = min(block.ts_min for block in blocks)
+            self.ts_max = max(block.ts_max for block in blocks)
+
+    def all_blocks(self):
+        return self.blocks + [self.tail] if self.tail else self.blocks
+
+    def read_block(self, f, block):
+        f.seek(block.number * self.block_records * storage.RECORD.size)
+        return storage.RECORD.iter_unpack(f.read(block.count * storage.RECORD.size))
+
+
+class HistoryIndex:
+    """Range and downsampling queries over one device's storage directory."""
+
+    def __init__(self, directory, block_records=BLOCK_RECORDS):
+        self.directory = directory
+        self.block_records = block_records
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Bring the index up to date with the segment files; returns the segments in order."""
+        with self._lock:
+            paths = storage.list_segments(self.directory)
+            segments = []
+            for i, path in enumerate(paths):
+                segment = self._segments.get(path)
+                if segment is None:
+                    segment = Segment(path, self.block_records)
+                segment.refresh(sealed=i < len(paths) - 1)
+                segments.append(segment)
+            # Forget segments removed by retention (see rollups.py)
+            self._segments = dict(zip(paths, segments))
+            return segments
+
+    def _overlapping(self, start_ns, end_ns):
+        """Yield (segment, blocks) for the blocks whose time range overlaps [start_ns, end_ns]."""
+        for segment in self.refresh():
+            if segment.ts_min is None or segment.ts_min > end_ns or segment.ts_max < start_ns:
+                continue
+            overlapping = [b for b in segment.all_blocks() if b.ts_max >= start_ns and b.ts_min <= end_ns]
+            if overlapping:
+                yield segment, overlapping
+
+    def query(self, start_ns, end_ns, limit=None):
+        """
+        Return (timestamp_ns, temp, humidity, flow) rows with start_ns <=
+        timestamp_ns <= end_ns, oldest first. With `limit`, only the oldest
+        `limit` rows are returned and blocks are read oldest first until no
+        remaining block can hold an older row, so the cost follows the limit
+        rather than the range.
+        """
+        blocks = [(segment, block) for segment, overlapping in self._overlapping(start_ns, end_ns)
+                  for block in overlapping]
+        if limit is not None:
+            blocks.sort(key=lambda item: item[1].ts_min)
+        rows = []
+        files = {}
+        try:
+            for segment, block in blocks:
+                if limit is not None and len(rows) >= limit:
+                    rows.sort(key=lambda row: row[0])
+                    del rows[limit:]
+                    if block.ts_min > rows[-1][0]:
+                        break
+                f = files.get(segment.path)
+                if f is None:
+                    f = files[segment.path] = open(segment.path, "rb")
+                records = segment.read_block(f, block)
+                if start_ns <= block.ts_min and block.ts_max <= end_ns:
+                    rows.extend(records)
+                else:
+                    rows.extend(r for r in records if start_ns <= r[0] <= end_ns)
+        finally:
+            for f in files.values():
+                f.close()
+        rows.sort(key=lambda row: row[0])
+        return rows if limit is None else rows[:limit]
+
+    def downsample(self, metric, start_ns, end_ns, points, exact=False, origin_ns=None, width=None):
+        """
+        Aggregate one metric over [start_ns, end_ns] into at most `points`
+        equal-width buckets. Returns (bucket_start_ns, min, max, avg, count)
+        tuples for the non-empty buckets, oldest first.
+
+        A block that crosses a bucket edge but is shorter than a bucket is
+        counted in the bucket holding its midpoint, so bucket edges are only
+        accurate to one block; with exact=True such blocks are read instead.
+        `origin_ns` and `width` place the buckets on another query's grid
+        (used by rollups.py to combine raw data with coarser tiers).
+        """
+        column = _metric_column(metric)
+        if points <= 0:
+            raise ValueError("points must be positive")
+        if width is None:
+            width = max((end_ns - start_ns + 1) / points, 1)
+        origin = start_ns if origin_ns is None else origin_ns
+        buckets = {}
+
+        def add(bucket, count, low, high, total):
+            current = buckets.get(bucket)
+            if current is None:
+                buckets[bucket] = [count, low, high, total]
+            else:
+                current[0] += count
+                current[1] = min(current[1], low)
+                current[2] = max(current[2], high)
+                current[3] += total
+
+        for segment, blocks in self._overlapping(start_ns, end_ns):
+            f = None
+            try:
+                for block in blocks:
+                    first = int((block.ts_min - origin) // width)
+                    last = int((block.ts_max - origin) // width)
+                    inside = start_ns <= block.ts_min and block.ts_max <= end_ns
+                    if inside and (first == last or (not exact and block.ts_max - block.ts_min <= width)):
+                        # Answer the block from its summary without reading it
+                        bucket = first if first == last else int(((block.ts_min + block.ts_max) / 2 - origin) // width)
+                        i = column - 1
+                        add(bucket, block.count, block.mins[i], block.maxs[i], block.sums[i])
+                        continue
+                    if f is None:
+                        f = open(segment.path, "rb")
+                    for record in segment.read_block(f, block):
+                        if start_ns <= record[0] <= end_ns:
+                            x = record[column]
+                            add(int((record[0] - origin) // width), 1, x, x, x)
+            finally:
+                if f is not None:
+                    f.close()
+
+        return [
+            (origin + int(bucket * width), low, high, total / count, count)
+            for bucket, (count, low, high, total) in sorted(buckets.items())
+        ]
+
+
+def _metric_column(metric):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    return METRICS.index(metric) + 1
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(device_id, data_dir=None):
+    """Return the shared HistoryIndex for a device's binary storage."""
+    directory = os.path.join(data_dir or storage.DATA_DIR, device_id)
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = HistoryIndex(directory)
+        return index
+
+
+def query_history(device_id, metric, start_ns, end_ns, points=None, data_dir=None):
+    """
+    History of one metric of a device between two epoch-ns timestamps.
+
+    Without `points`, returns raw (timestamp_ns, value) pairs. With
+    `points`, returns at most that many (bucket_start_ns, min, max, avg,
+    count) buckets.
+    """
+    index = get_index(device_id, data_dir)
+    if points:
+        return index.downsample(metric, start_ns, end_ns, points)
+    column = _metric_column(metric)
+    return [(row[0], row[column]) for row in index.query(start_ns, end_ns)]
+
+
+def latest_reading(device_id, data_dir=None):
+    """Return the newest stored (timestamp_ns, temp, humidity, flow) of a device, or None."""
+    directory = os.path.join(data_dir or storage.DATA_DIR, device_id)
+    for path in reversed(storage.list_segments(directory)):
+        records = os.path.getsize(path) // storage.RECORD.size
+        if records:
+            with open(path, "rb") as f:
+                f.seek((records - 1) * storage.RECORD.size)
+                return storage.RECORD.unpack(f.read(storage.RECORD.size))
+    return None
+
+
+if __name__ == "__main__":
+    # Usage: python history.py query <device_id> <metric> <hours> [points]
+    if len(sys.argv) < 5 or sys.argv[1] != "query":
+        print("Usage: python history.py query <device_id> <metric> <hours> [points]")
+        print(f"Devices: {', '.join(storage.list_devices()) or 'none'}; metrics: {', '.join(METRICS)}")
+        sys.exit(1)
+
+    device_id, metric, hours = sys.argv[2], sys.argv[3], float(sys.argv[4])
+    points = int(sys.argv[5]) if len(sys.argv) > 5 else 500
+    end_ns = time.time_ns()
+    started = time.perf_counter()
+    buckets = query_history(device_id, metric, end_ns - int(hours * 3600e9), end_ns, points)
+    elapsed = time.perf_counter() - started
+    print(f"{len(buckets)} bucket(s) of {metric} for {device_id} in {elapsed * 1000:.1f} ms")
+    for timestamp, low, high, avg, count in buckets[-20:]:
+        print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp / 1e9))}  "
+              f"min={low:.2f} max={high:.2f} avg={avg:.2f} n={count}")
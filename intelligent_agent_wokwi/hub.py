@@ -0,0 +1,268 @@
+"""
+Fan-out of live sensor readings to dashboards over Server-Sent Events.
+
+The hub holds a single MQTT subscription, however many dashboards are
+open, and broadcasts every reading to the connected clients:
+
+    GET /events[?device=ID][&rate=N]   text/event-stream of readings
+    GET /stats                         connected clients and counters
+
+Each reading is serialised once and the same bytes are queued for every
+client. A client that asks for `rate` events per second only gets the
+newest reading of each device per interval (older ones are dropped), and
+a client that cannot keep up loses its oldest queued readings instead of
+slowing down the others. On connect a client first receives a 'snapshot'
+event per device with the recent readings, so charts fill immediately.
+
+Run: python hub.py, then point the dashboard at http://localhost:8001/events
+(see HUB_EVENTS in web/app-nodered.js).
+"""
+import http.server
+import json
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+import logs
+from pipeline import decode_readings
+from telemetry import device_from_topic
+from transport import MqttTransport, CLIENT_ID
+
+
+# Configuration
+MQTT_BROKER = "test.mosquitto.org"
+MQTT_PORT = 1883
+TOPIC_SENSORS = "wokwi/sensors/+"
+TOPIC_SENSORS_BINARY = "wokwi/sensors/+/bin"
+HUB_PORT = 8001
+SNAPSHOT_SIZE = 20  # Recent readings per device sent to new clients (the dashboard charts show 20)
+CLIENT_QUEUE_SIZE = 1000  # Readings queued per client before the oldest are dropped
+MAX_RATE = 50.0  # Highest per-client rate (events per second) a client may ask for
+MIN_RATE = 0.1
+HEARTBEAT_INTERVAL = 15.0  # Seconds of silence before a keep-alive comment is sent
+RETRY_MS = 3000  # Reconnect delay suggested to EventSource clients
+
+log = logging.getLogger("hub")
+
+
+def _frame(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+class HubClient:
+    """
+    Outgoing event queue of one dashboard connection.
+
+    Without a rate every reading is queued; with a rate only the newest
+    reading per device is kept and the queue is released at most `rate`
+    times per second.
+    """
+
+    def __init__(self, device=None, rate=None, queue_size=CLIENT_QUEUE_SIZE):
+        self.device = device
+        self.interval = 1.0 / rate if rate else 0.0
+        self.queue_size = queue_size
+        self.sent = 0
+        self.dropped = 0
+        self._queue = deque()
+        self._latest = {}
+        self._next_send = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def push(self, device_id, frame):
+        if self.device is not None and device_id != self.device:
+            return
+        with self._cond:
+            if self.interval:
+                if device_id in self._latest:
+                    self.dropped += 1
+                self._latest[device_id] = frame
+            else:
+                if len(self._queue) >= self.queue_size:
+                    self._queue.popleft()
+                    self.dropped += 1
+                self._queue.append(frame)
+            self._cond.notify()
+
+    def next_frames(self, timeout):
+        """
+        Wait until frames may be sent and return them. Returns an empty list
+        if nothing was sent within `timeout` seconds, None once closed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                ready = self._queue or self._latest
+                if ready and now >= self._next_send:
+                    frames = list(self._queue) + list(self._latest.values())
+                    self._queue.clear()
+                    self._latest.clear()
+                    self._next_send = now + self.interval
+                    self.sent += len(frames)
+                    return frames
+                if now >= deadline:
+                    return []
+                self._cond.wait((min(self._next_send, deadline) if ready else deadline) - now)
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+
+class Hub:
+    """Keeps the recent readings per device and broadcasts new ones to clients."""
+
+    def __init__(self, snapshot_size=SNAPSHOT_SIZE, queue_size=CLIENT_QUEUE_SIZE):
+        self.snapshot_size = snapshot_size
+        self.queue_size = queue_size
+        self.published = 0
+        self._clients = set()
+        self._recent = {}
+        self._lock = threading.Lock()
+
+    def publish(self, device_id, readings):
+        """Broadcast decoded (timestamp_ns, temp, humidity, flow) readings of a device."""
+        for timestamp_ns, temp, humidity, flow in readings:
+            reading = {"device": device_id, "timestamp": timestamp_ns / 1e9,
+                       "temp": temp, "humidity": humidity, "flow": flow}
+            frame = _frame("reading", reading)
+            # Recording the reading and listing clients under one lock means a
+            # client connecting now gets it either in its snapshot or as an event
+            with self._lock:
+                recent = self._recent.get(device_id)
+                if recent is None:
+                    recent = self._recent[device_id] = deque(maxlen=self.snapshot_size)
+                recent.append(reading)
+                clients = list(self._clients)
+                self.published += 1
+            for client in clients:
+                client.push(device_id, frame)
+
+    def connect(self, device=None, rate=None):
+        """Register a client; returns it with the snapshot frames to send first."""
+        client = HubClient(device, rate, self.queue_size)
+        with self._lock:
+            self._clients.add(client)
+            snapshot = [
+                (device_id, list(recent)) for device_id, recent in self._recent.items()
+                if device is None or device_id == device
+            ]
+        frames = [_frame("snapshot", {"device": device_id, "readings": readings}) for device_id, readings in snapshot]
+        return client, frames
+
+    def disconnect(self, client):
+        with self._lock:
+            self._clients.discard(client)
+        client.close()
+
+    def close(self):
+        with self._lock:
+            clients, self._clients = self._clients, set()
+        for client in clients:
+            client.close()
+
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients)
+            devices = len(self._recent)
+        return {
+            "clients": len(clients),
+            "devices": devices,
+            "published": self.published,
+            "sent": sum(client.sent for client in clients),
+            "dropped": sum(client.dropped for client in clients),
+        }
+
+
+class HubRequestHandler(http.server.BaseHTTPRequestHandler):
+    hub = None
+
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/events":
+            try:
+                rate = float(query["rate"][0]) if "rate" in query else None
+            except ValueError:
+                self.send_error(400, "rate must be a number")
+                return
+            if rate is not None:
+                rate = min(max(rate, MIN_RATE), MAX_RATE)
+            self.stream(query.get("device", [None])[0], rate)
+        elif url.path == "/stats":
+            body = json.dumps(self.hub.stats()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def stream(self, device, rate):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        client, frames = self.hub.connect(device, rate)
+        try:
+            self.wfile.write(f"retry: {RETRY_MS}\n\n".encode() + b"".join(frames))
+            self.wfile.flush()
+            while True:
+                frames = client.next_frames(HEARTBEAT_INTERVAL)
+                if frames is None:
+                    break
+                self.wfile.write(b"".join(frames) if frames else b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.hub.disconnect(client)
+
+
+def main():
+    logs.setup()
+    hub = Hub()
+    HubRequestHandler.hub = hub
+
+    def on_message(client, userdata, msg):
+        try:
+            readings = decode_readings(msg.payload, time.time_ns())
+        except ValueError as e:
+            log.warning("Skipping invalid payload on %s: %s", msg.topic, e)
+            return
+        hub.publish(device_from_topic(msg.topic), readings)
+
+    # One connection keeps each device's readings in order; it reconnects and re-subscribes on its own,
+    # without a persistent session (dashboards want live readings, not a backlog)
+    mqtt = MqttTransport([TOPIC_SENSORS, TOPIC_SENSORS_BINARY], on_message, MQTT_BROKER, MQTT_PORT, pool_size=1,
+                         client_id=f"{CLIENT_ID}-hub", persistent=False).start()
+
+    httpd = http.server.ThreadingHTTPServer(("", HUB_PORT), HubRequestHandler)
+    print(f"\n{'='*60}")
+    print(f"Dashboard Hub Running")
+    print(f"{'='*60}")
+    print(f"Events: http://localhost:{HUB_PORT}/events[?device=<id>&rate=<per second>]")
+    print(f"Stats:  http://localhost:{HUB_PORT}/stats")
+    print(f"{'='*60}\n")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping hub...")
+        hub.close()
+        httpd.server_close()
+        mqtt.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Leveled, rate-limited console logging for the services.
+
+Per-reading output is logged at DEBUG and hidden by default (set
+WOKWI_LOG_LEVEL=DEBUG to see it). Warnings and errors that repeat, such as
+a device sending invalid payloads, are limited by RateLimitFilter to
+`burst` messages per `interval` seconds for each message template; the
+next message that gets through says how many were suppressed.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+
+
+# Configuration
+LOG_LEVEL = os.environ.get("WOKWI_LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+RATE_LIMIT_INTERVAL = 10.0  # Seconds
+RATE_LIMIT_BURST = 5  # Messages per template per interval
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops records whose (logger, message template) pair exceeded its budget."""
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST, clock=time.monotonic):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.clock = clock
+        self.suppressed = 0
+        self._windows = {}  # (logger name, template) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = self.clock()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window and window[2]:
+                    record.msg = f"{record.msg} [{window[2]} similar message(s) suppressed]"
+                window = self._windows[key] = [now, 0, 0]
+            if window[1] >= self.burst:
+                window[2] += 1
+                self.suppressed += 1
+                return False
+            window[1] += 1
+            return True
+
+
+def setup(level=LOG_LEVEL, stream=sys.stdout):
+    """Configure the root logger for a service's main(); safe to call more than once."""
+    root = logging.getLogger()
+    if not any(getattr(handler, "_wokwi", False) for handler in root.handlers):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, "%H:%M:%S"))
+        handler.addFilter(RateLimitFilter())
+        handler._wokwi = True
+        root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
@@ -1,6 +1,8 @@
 import network
 import time
 import json
+import struct
+from array import array
 from machine import Pin, ADC
 from umqtt.simple import MQTTClient
 import dht
@@ -21,6 +23,29 @@ MQTT_PORT = 1883
 MQTT_CLIENT_ID = "esp32_wokwi"
 TOPIC_SENSORS = b"wokwi/sensors/sayf_project"
 TOPIC_ACTUATORS = b"wokwi/actuators/sayf_project"
+# QoS 1: the broker acknowledges every reading and keeps it for the backend's
+# persistent session while the backend reconnects (QoS 0 readings are dropped then)
+SENSOR_QOS = 1
+
+# Payload Configuration
+# "json": {"temp": .., "humidity": .., "flow": ..} on TOPIC_SENSORS
+# "binary": fixed 17-byte record on TOPIC_SENSORS + b"/bin" (see telemetry.py)
+PAYLOAD_FORMAT = "json"
+DEVICE_NUM = 1  # Numeric device ID carried in binary records
+RECORD_VERSION = 2
+RECORD_FORMAT = "<BHIIhHh"  # version, device, seq, time in ms (mod 2**32), temp*100, humidity*100, flow*10
+TOPIC_SENSORS_BINARY = TOPIC_SENSORS + b"/bin"
+
+# Batch Configuration
+# Samples at SAMPLE_INTERVAL_MS into a preallocated buffer and publishes several
+# readings per message: JSON {"samples": [[age_ms, temp, humidity, flow], ...]}
+# or concatenated binary records. Actuator commands are polled every CHECK_INTERVAL_MS.
+BATCH_MODE = False
+SAMPLE_INTERVAL_MS = 250  # Potentiometer (water flow) sampling period
+DHT_INTERVAL_MS = 2000  # DHT22 needs at least 2 s between measurements
+BATCH_SIZE = 8  # Publish once this many samples are buffered...
+BATCH_INTERVAL_MS = 2000  # ...or once the oldest buffered sample is this old
+CHECK_INTERVAL_MS = 20  # Actuator command polling period
 
 # Initialize Hardware
 sensor = dht.DHT22(Pin(DHT_PIN))
@@ -32,6 +57,17 @@ led2 = Pin(LED2_PIN, Pin.OUT)
 led1.value(0)
 led2.value(0)
 
+# Preallocated binary record, reused for every publish
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+record = bytearray(RECORD_SIZE)
+
+# Preallocated sample buffer for batch mode
+sample_ticks = array('i', [0] * BATCH_SIZE)
+sample_temp = array('f', [0] * BATCH_SIZE)
+sample_humidity = array('f', [0] * BATCH_SIZE)
+sample_flow = array('f', [0] * BATCH_SIZE)
+batch_record = bytearray(RECORD_SIZE * BATCH_SIZE)
+
 # WiFi Connection
 def connect_wifi():
     wlan = network.WLAN(network.STA_IF)
@@ -51,15 +87,88 @@ def mqtt_callback(topic, msg):
     print(f"Message arrived [{topic.decode()}] {msg.decode()}")
     
     if topic == TOPIC_ACTUATORS:
-        message = msg.decode()
-        if message == "ACT1:ON":
-            led1.value(1)
-        elif message == "ACT1:OFF":
-            led1.value(0)
-        elif message == "ACT2:ON":
-            led2.value(1)
-        elif message == "ACT2:OFF":
-            led2.value(0)
+        # The backend batches commands into one message, one per line
+        for message in msg.decode().split("\n"):
+            message = message.strip()
+            if message == "ACT1:ON":
+                led1.value(1)
+            elif message == "ACT1:OFF":
+                led1.value(0)
+            elif message == "ACT2:ON":
+                led2.value(1)
+            elif message == "ACT2:OFF":
+                led2.value(0)
+
+# Batch Publishing
+def publish_batch(client, count, seq):
+    now = time.ticks_ms()
+    if PAYLOAD_FORMAT == "binary":
+        # One base time per batch; the millisecond ages keep the spacing between samples exact
+        stamp_ms = time.time() * 1000
+        for i in range(count):
+            age_ms = time.ticks_diff(now, sample_ticks[i])
+            struct.pack_into(RECORD_FORMAT, batch_record, i * RECORD_SIZE, RECORD_VERSION, DEVICE_NUM,
+                             (seq + i) & 0xFFFFFFFF, (stamp_ms - age_ms) & 0xFFFFFFFF, int(sample_temp[i] * 100),
+                             int(sample_humidity[i] * 100), int(sample_flow[i] * 10))
+        client.publish(TOPIC_SENSORS_BINARY, memoryview(batch_record)[:count * RECORD_SIZE], qos=SENSOR_QOS)
+    else:
+        samples = [[time.ticks_diff(now, sample_ticks[i]), sample_temp[i], sample_humidity[i], sample_flow[i]]
+                   for i in range(count)]
+        client.publish(TOPIC_SENSORS, json.dumps({"samples": samples}), qos=SENSOR_QOS)
+    print(f"Published batch of {count} samples")
+    return (seq + count) & 0xFFFFFFFF
+
+def run_batched(client):
+    seq = 0
+    count = 0
+    temperature = 0
+    humidity = 0
+    now = time.ticks_ms()
+    next_sample = now
+    next_dht = now
+    
+    while True:
+        try:
+            # Check for actuator commands on a fast cadence, independent of sampling
+            client.check_msg()
+            now = time.ticks_ms()
+            
+            if time.ticks_diff(now, next_sample) >= 0:
+                next_sample = time.ticks_add(next_sample, SAMPLE_INTERVAL_MS)
+                
+                # DHT22 is slow: reuse its last reading between measurements
+                if time.ticks_diff(now, next_dht) >= 0:
+                    next_dht = time.ticks_add(now, DHT_INTERVAL_MS)
+                    sensor.measure()
+                    temperature = sensor.temperature()
+                    humidity = sensor.humidity()
+                
+                sample_ticks[count] = now
+                sample_temp[count] = temperature
+                sample_humidity[count] = humidity
+                sample_flow[count] = int((pot.read() / 4095) * 100)
+                count += 1
+            
+            if count and (count >= BATCH_SIZE or time.ticks_diff(now, sample_ticks[0]) >= BATCH_INTERVAL_MS):
+                seq = publish_batch(client, count, seq)
+                count = 0
+            
+            time.sleep_ms(CHECK_INTERVAL_MS)
+            
+        except OSError as e:
+            print(f"Sensor error: {e}")
+            time.sleep(2)
+            
+        except Exception as e:
+            print(f"Error: {e}")
+            # Reconnect if connection lost
+            try:
+                client.connect()
+                client.subscribe(TOPIC_ACTUATORS)
+                print("Reconnected to MQTT")
+            except:
+                print("Reconnection failed, waiting...")
+                time.sleep(5)
 
 # Main Loop
 def main():
@@ -76,6 +185,10 @@ def main():
     
     print('Starting sensor readings...')
     time.sleep(2)
+    if BATCH_MODE:
+        run_batched(client)
+        return
+    seq = 0
     
     while True:
         try:
@@ -91,17 +204,25 @@ def main():
             pot_value = pot.read()
             water_flow = int((pot_value / 4095) * 100)
             
-            # Create JSON
-            data = {
-                "temp": temperature,
-                "humidity": humidity,
-                "flow": water_flow
-            }
-            json_str = json.dumps(data)
-            
-            # Publish to MQTT
-            client.publish(TOPIC_SENSORS, json_str)
-            print(json_str)
+            if PAYLOAD_FORMAT == "binary":
+                # Pack scaled readings into the preallocated record (no per-loop allocation)
+                struct.pack_into(RECORD_FORMAT, record, 0, RECORD_VERSION, DEVICE_NUM, seq,
+                                 (time.time() * 1000) & 0xFFFFFFFF, int(temperature * 100), int(humidity * 100),
+                                 water_flow * 10)
+                client.publish(TOPIC_SENSORS_BINARY, record, qos=SENSOR_QOS)
+                seq = (seq + 1) & 0xFFFFFFFF
+            else:
+                # Create JSON
+                data = {
+                    "temp": temperature,
+                    "humidity": humidity,
+                    "flow": water_flow
+                }
+                json_str = json.dumps(data)
+                
+                # Publish to MQTT
+                client.publish(TOPIC_SENSORS, json_str, qos=SENSOR_QOS)
+                print(json_str)
             
             time.sleep(2)
             
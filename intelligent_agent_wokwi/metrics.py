@@ -0,0 +1,297 @@
+"""
+Low-overhead metrics for the backend services.
+
+Counters, gauges, rate meters and histograms are registered in a Registry
+(module-level REGISTRY by default) and served by serve() as Prometheus
+text on /metrics or as JSON on /metrics.json.
+
+Hot paths pay at most a lock and an integer add. Histograms that time
+per-message work are sampled: sampled() is true for one call in
+`sample_every`, only that call is timed, and its observation is counted
+with weight `sample_every` so counts and sums still estimate the totals.
+Values that are already tracked elsewhere (queue depth, pipeline counters)
+are registered with a function and only read when the endpoint is scraped.
+"""
+import bisect
+import json
+import threading
+import time
+
+
+# Configuration
+METRICS_PORT = 8002
+SAMPLE_EVERY = 16  # Time one in this many calls of sampled per-message histograms
+RATE_WINDOW = 60  # Seconds averaged by rate meters
+# Histogram bucket upper bounds in seconds (10 us .. 2.5 s)
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.fn = fn  # Called at scrape time instead of tracking values
+        self._series = {}  # label values -> value
+        self._lock = threading.Lock()
+
+    def values(self):
+        """Current values as {label values: value}."""
+        if self.fn is not None:
+            value = self.fn()
+            return value if isinstance(value, dict) else {(): value}
+        with self._lock:
+            return dict(self._series)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._series[label_values] = value
+
+
+class Meter(_Metric):
+    """Events per second over the last `window` seconds (exported as a gauge)."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), window=RATE_WINDOW, clock=time.monotonic):
+        super().__init__(name, help, labels)
+        self.window = window
+        self.clock = clock
+
+    def mark(self, amount=1, *label_values):
+        second = int(self.clock())
+        with self._lock:
+            slots = self._series.get(label_values)
+            if slots is None:
+                slots = self._series[label_values] = []
+            if slots and slots[-1][0] == second:
+                slots[-1][1] += amount
+            else:
+                slots.append([second, amount])
+                if slots[0][0] <= second - self.window:
+                    slots.pop(0)
+
+    def values(self):
+        cutoff = int(self.clock()) - self.window
+        with self._lock:
+            return {
+                label_values: sum(count for second, count in slots if second > cutoff) / self.window
+                for label_values, slots in self._series.items()
+            }
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, sample_every=1):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.sample_every = max(1, sample_every)
+        self._calls = 0
+
+    def sampled(self):
+        """True for one call in sample_every; only those calls should be timed and observed."""
+        self._calls += 1  # Unlocked: a lost increment only shifts which call is sampled
+        return self._calls % self.sample_every == 0
+
+    def observe(self, value, *label_values):
+        """Record a sampled observation (weighted by sample_every)."""
+        weight = self.sample_every
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += weight
+            series[1] += value * weight
+            series[2] += weight
+
+    def values(self):
+        with self._lock:
+            return {label_values: (list(counts), total, count) for label_values, (counts, total, count) in self._series.items()}
+
+    def quantile(self, q, counts):
+        """Upper bound of the bucket holding quantile q (inf if it is past the last bucket)."""
+        rank = q * sum(counts)
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+    def timer(self, *label_values):
+        return _Timer(self, label_values)
+
+
+class _Timer:
+    """Context manager that observes the elapsed time of sampled calls."""
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter() if self.histogram.sampled() else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.started is not None:
+            self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is already registered as a {metric.kind}")
+            elif kwargs.get("fn") is not None:
+                metric.fn = kwargs["fn"]  # Re-registration rebinds the scrape function
+            return metric
+
+    def counter(self, name, help, labels=(), fn=None):
+        return self._register(Counter, name, help, labels, fn=fn)
+
+    def gauge(self, name, help, labels=(), fn=None):
+        return self._register(Gauge, name, help, labels, fn=fn)
+
+    def meter(self, name, help, labels=(), window=RATE_WINDOW):
+        return self._register(Meter, name, help, labels, window=window)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, sample_every=1):
+        return self._register(Histogram, name, help, labels, buckets=buckets, sample_every=sample_every)
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics():
+            try:
+                values = metric.values()
+            except Exception:
+                continue  # A scrape function whose source is not running yet
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for label_values, value in sorted(values.items()):
+                labels = [f'{name}="{_escape(label)}"' for name, label in zip(metric.labels, label_values)]
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_labels(labels)} {_number(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                    lines.append(f"{metric.name}_bucket{_labels(labels + [le])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{metric.name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-friendly dict; histograms are summarised."""
+        result = {}
+        for metric in self.metrics():
+            try:
+                values = metric.values()
+            except Exception:
+                continue
+            series = []
+            for label_values, value in sorted(values.items()):
+                if metric.kind == "histogram":
+                    counts, total, count = value
+                    value = {
+                        "count": count,
+                        "sum": total,
+                        "mean": total / count if count else 0.0,
+                        "p50": metric.quantile(0.5, counts),
+                        "p90": metric.quantile(0.9, counts),
+                        "p99": metric.quantile(0.99, counts),
+                    }
+                series.append({"labels": dict(zip(metric.labels, label_values)), "value": value})
+            result[metric.name] = {"type": metric.kind, "help": metric.help, "series": series}
+        return result
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Default registry used by the services' module-level metrics
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+meter = REGISTRY.meter
+histogram = REGISTRY.histogram
+
+
+def _handler_class(registry):
+    # http.server is imported on first use: most importers never serve metrics
+    import http.server
+    from urllib.parse import urlsplit
+
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            if path == "/metrics":
+                body = registry.prometheus().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body = json.dumps(registry.snapshot(), default=str).encode()
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes are periodic; don't log every one
+
+    return MetricsRequestHandler
+
+
+def serve(port=METRICS_PORT, registry=REGISTRY):
+    """Serve /metrics and /metrics.json on a daemon thread; returns the server (call shutdown() to stop)."""
+    import http.server
+
+    httpd = http.server.ThreadingHTTPServer(("", port), _handler_class(registry))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
@@ -0,0 +1,194 @@
+"""
+Staged ingest pipeline between the MQTT callback and persistence.
+
+The MQTT network thread only enqueues raw payloads into a bounded queue
+(submit never blocks). A worker thread drains the queue, decodes and
+validates the readings and hands them to a sink in batches sized by count
+or time, so JSON decoding, disk I/O and reporting never stall the MQTT loop.
+"""
+import logging
+import queue
+import threading
+import time
+
+import metrics
+import telemetry
+from storage import is_valid_device_id
+
+
+# Configuration
+QUEUE_SIZE = 10000  # Raw payloads buffered before new ones are dropped
+BATCH_SIZE = 500  # Maximum readings handed to the sink at once
+BATCH_TIMEOUT = 0.05  # Seconds to wait for a batch to fill up
+
+log = logging.getLogger("pipeline")
+
+# Sampled: timing every payload would cost more than decoding some of them
+DECODE_SECONDS = metrics.histogram("wokwi_ingest_decode_seconds", "Time to decode one raw payload",
+                                   sample_every=metrics.SAMPLE_EVERY)
+PERSIST_SECONDS = metrics.histogram("wokwi_ingest_persist_seconds", "Time for the sink to persist one batch")
+BATCH_READINGS = metrics.histogram("wokwi_ingest_batch_readings", "Readings per batch handed to the sink",
+                                   buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+
+
+def decode_readings(payload, timestamp_ns):
+    """
+    Decode a raw JSON or binary payload (single or batched) into a list of
+    (timestamp_ns, temp, humidity, flow) tuples, oldest first. Batched
+    samples are back-dated from the receive time by their age.
+    Raises ValueError if the payload is not a valid sensor reading.
+    """
+    readings = []
+    for data in telemetry.decode_samples(payload):
+        try:
+            readings.append((
+                timestamp_ns - int(data["age_ms"] * 1_000_000),
+                float(data.get("temp", 0)),
+                float(data.get("humidity", 0)),
+                float(data.get("flow", 0)),
+            ))
+        except (TypeError, ValueError):
+            raise ValueError("non-numeric sensor value")
+    return readings
+
+
+class _Worker:
+    """One pipeline stage worker with its own bounded queue and counters."""
+
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.counters = {
+            "received": 0,
+            "dropped": 0,
+            "invalid": 0,
+            "processed": 0,
+            "batches": 0,
+            "max_depth": 0,
+        }
+        # submit() runs on every MQTT network thread, so the counters it
+        # touches (received, dropped, invalid) are updated under this lock;
+        # the others have the worker thread as their only writer
+        self.lock = threading.Lock()
+        self.thread = None
+
+
+class IngestPipeline:
+    """
+    Routes raw payloads by key (e.g. device ID) to a pool of worker threads.
+
+    All payloads with the same key go to the same worker, so per-key order
+    is preserved and per-key state only needs to be touched by one thread.
+    The sink is called as sink(key, readings).
+    """
+
+    def __init__(self, sink, workers=1, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 batch_timeout=BATCH_TIMEOUT):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.workers = [_Worker(queue_size) for _ in range(workers)]
+        self._stopped = threading.Event()
+
+    def start(self):
+        for i, worker in enumerate(self.workers):
+            worker.thread = threading.Thread(target=self._run, args=(worker,), name=f"ingest-{i}", daemon=True)
+            worker.thread.start()
+
+    def stop(self):
+        """Stop the workers after the queued payloads have been processed."""
+        self._stopped.set()
+        for worker in self.workers:
+            if worker.thread:
+                worker.thread.join()
+
+    def submit(self, payload, key=None):
+        """
+        Enqueue a raw payload. Returns False if it was dropped because the
+        queue is full or the key is not a valid device ID.
+        """
+        worker = self.workers[hash(key) % len(self.workers)]
+        if key is not None and not is_valid_device_id(key):
+            with worker.lock:
+                worker.counters["invalid"] += 1
+            log.warning("Rejecting payload for invalid device ID %r", key)
+            return False
+        try:
+            worker.queue.put_nowait((key, time.time_ns(), payload))
+        except queue.Full:
+            with worker.lock:
+                worker.counters["dropped"] += 1
+            return False
+        with worker.lock:
+            worker.counters["received"] += 1
+        return True
+
+    def stats(self):
+        """Counters summed over all workers, plus the current total queue depth."""
+        stats = dict.fromkeys(self.workers[0].counters, 0)
+        for worker in self.workers:
+            for name, value in worker.counters.items():
+                if name == "max_depth":
+                    stats[name] = max(stats[name], value)
+                else:
+                    stats[name] += value
+        stats["depth"] = sum(worker.queue.qsize() for worker in self.workers)
+        return stats
+
+    def _next_batch(self, worker):
+        try:
+            items = [worker.queue.get(timeout=self.batch_timeout)]
+        except queue.Empty:
+            return []
+
+        depth = worker.queue.qsize() + 1
+        if depth > worker.counters["max_depth"]:
+            worker.counters["max_depth"] = depth
+
+        deadline = time.monotonic() + self.batch_timeout
+        while len(items) < self.batch_size:
+            try:
+                items.append(worker.queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(worker.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self, worker):
+        while not (self._stopped.is_set() and worker.queue.empty()):
+            items = self._next_batch(worker)
+            if not items:
+                continue
+
+            # Group decoded readings by key, preserving arrival order within a key
+            batches = {}
+            for key, timestamp_ns, payload in items:
+                started = time.perf_counter() if DECODE_SECONDS.sampled() else None
+                try:
+                    readings = decode_readings(payload, timestamp_ns)
+                except ValueError as e:
+                    with worker.lock:
+                        worker.counters["invalid"] += 1
+                    log.warning("Invalid payload from %s: %s", key, e)
+                    continue
+                if started is not None:
+                    DECODE_SECONDS.observe(time.perf_counter() - started)
+                if readings:  # An empty batch ({"samples": []}) has nothing to persist
+                    batches.setdefault(key, []).extend(readings)
+
+            for key, readings in batches.items():
+                started = time.perf_counter()
+                try:
+                    self.sink(key, readings)
+                except Exception as e:
+                    log.error("Error persisting batch for %s: %s", key, e)
+                PERSIST_SECONDS.observe(time.perf_counter() - started)
+                BATCH_READINGS.observe(len(readings))
+                worker.counters["processed"] += len(readings)
+                worker.counters["batches"] += 1
@@ -0,0 +1,183 @@
+"""
+Built-in sampling profiler for the long-running services.
+
+A daemon thread wakes every `interval` seconds, takes the current stack of
+every other thread (sys._current_frames) and counts it. Nothing is
+installed in the profiled threads, so the cost is one stack walk per thread
+per sample (about 1% of one core at the default 100 Hz) and it can stay on
+in production.
+
+Profiles are written every `dump_interval` seconds, on SIGUSR1 (where
+available) and when the profiler stops. Each dump covers the samples since
+the previous one and produces two files in `directory`:
+
+    profile_<time>.collapsed  "thread;module:function;... <samples>" lines,
+                              the input format of flamegraph.pl / speedscope
+    profile_<time>.txt        per-thread and per-function self/total time
+
+Frames are labelled by module, so time spent in pandas, openpyxl, json or
+string.Template (report HTML) shows up under those names. Stacks of idle
+threads (blocked in a wait or select) are skipped unless include_idle.
+
+Usage: python backend_service.py --profile [--profile-interval 60]
+       python agent.py [port] --profile
+       kill -USR1 <pid>   # dump now
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+
+# Configuration
+PROFILE_DIR = "profiles"
+SAMPLE_INTERVAL = 0.01  # Seconds between samples
+DUMP_INTERVAL = 60.0  # Seconds between scheduled dumps
+TOP_FUNCTIONS = 40  # Functions listed in the summary
+# Leaf frames of threads that are blocked waiting for work (C calls such as
+# select() have no frame, so their caller is the leaf). time.sleep() callers
+# cannot be told apart from busy code, so service loops wait on an Event.
+IDLE_LEAVES = {
+    "threading:wait",
+    "threading:_wait_for_tstate_lock",
+    "selectors:select",
+    "socketserver:serve_forever",
+    "queue:get",
+    "paho.mqtt.client:_loop",  # Waiting in select() for the broker
+}
+
+log = logging.getLogger("profiler")
+
+
+class SamplingProfiler:
+    def __init__(self, interval=SAMPLE_INTERVAL, directory=PROFILE_DIR, dump_interval=DUMP_INTERVAL,
+                 include_idle=False, clock=time.monotonic):
+        self.interval = interval
+        self.directory = directory
+        self.dump_interval = dump_interval
+        self.include_idle = include_idle
+        self.clock = clock
+        self.samples = 0  # Sampling rounds since the last dump
+        self._stacks = Counter()  # collapsed stack -> samples
+        self._labels = {}  # code object -> "module:function"
+        self._lock = threading.Lock()
+        self._started = None
+        self._stopped = threading.Event()
+        self._dump_requested = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._started = self.clock()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.request_dump())
+        return self
+
+    def stop(self):
+        """Stop sampling and write a final dump; returns its paths (or None if there were no samples)."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        return self.dump() if self._stacks else None
+
+    def request_dump(self):
+        """Ask the sampling thread to dump at its next wakeup (safe from a signal handler)."""
+        self._dump_requested.set()
+
+    def _label(self, frame):
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+        return label
+
+    def sample(self):
+        """Record the current stack of every thread except the profiler's own."""
+        names = {thread.ident: thread.name.replace(" ", "_") for thread in threading.enumerate()}
+        me = threading.get_ident()
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            if not stack or (not self.include_idle and stack[0] in IDLE_LEAVES):
+                continue
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stacks.append(";".join(reversed(stack)))
+        with self._lock:
+            self.samples += 1
+            self._stacks.update(stacks)
+
+    def collapsed(self):
+        """Samples in collapsed-stack format, one 'stack count' line per distinct stack."""
+        with self._lock:
+            return self._collapsed(dict(self._stacks))
+
+    def summary(self, top=TOP_FUNCTIONS):
+        """Per-thread sample counts and the functions with the most self and total samples."""
+        with self._lock:
+            stacks, rounds = dict(self._stacks), self.samples
+        return self._summary(stacks, rounds, top)
+
+    def _collapsed(self, stacks):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    def _summary(self, stacks, rounds, top=TOP_FUNCTIONS):
+        threads = Counter()
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(";")
+            threads[frames[0]] += count
+            self_counts[frames[-1]] += count
+            for label in set(frames[1:]):  # Recursion counts once per sample
+                total_counts[label] += count
+
+        elapsed = rounds * self.interval
+        lines = [f"Profile of pid {os.getpid()}: {rounds} samples (~{elapsed:.1f} s at {self.interval * 1000:g} ms)",
+                 "Percentages are of all samples; 100% = one thread busy the whole time", ""]
+        lines.append("  samples  thread")
+        for name, count in threads.most_common():
+            lines.append(f"  {count:7d}  {name}")
+        lines.append("")
+        lines.append("   self%  total%  function")
+        for label, count in total_counts.most_common(top):
+            lines.append(f"  {self_counts[label] * 100 / max(1, rounds):6.1f}  {count * 100 / max(1, rounds):6.1f}  {label}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self):
+        """Write the samples since the previous dump and start counting afresh; returns both paths."""
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+        with self._lock:
+            stacks, rounds = self._stacks, self.samples
+            self._stacks, self.samples = Counter(), 0
+        collapsed, summary = self._collapsed(stacks), self._summary(stacks, rounds)
+        with open(base + ".collapsed", "w") as f:
+            f.write(collapsed)
+        with open(base + ".txt", "w") as f:
+            f.write(summary)
+        return base + ".collapsed", base + ".txt"
+
+    def _run(self):
+        next_dump = self._started + self.dump_interval if self.dump_interval else None
+        while not self._stopped.wait(self.interval):
+            self.sample()
+            if self._dump_requested.is_set() or (next_dump is not None and self.clock() >= next_dump):
+                self._dump_requested.clear()
+                if next_dump is not None:
+                    next_dump = self.clock() + self.dump_interval
+                try:
+                    paths = self.dump()
+                except OSError as e:
+                    log.error("Error writing profile: %s", e)
+                else:
+                    log.info("Profile written to %s", paths[1])
@@ -0,0 +1,329 @@
+"""
+HTML sensor reports, rendered off the ingest path.
+
+The page and per-metric section templates are compiled once at import and
+filled in for any list of metrics. Reports are rendered by a single
+ReportWorker thread: triggers (every N readings, the periodic timer) only
+mark a device as pending, so concurrent triggers for the same device
+collapse into one render, and a device is rendered at most once per
+`min_interval`. Files are written to a temporary file and renamed into
+place, so readers never see a half-written report.
+
+Snapshots may carry the device's streaming detector state under
+"detectors" (see detectors.py): each section then shows whether the
+metric is rising, and recommendations flag drifts and jumps as soon as
+they are detected instead of only when a fixed limit is exceeded.
+"""
+import html
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+from string import Template
+
+import metrics
+from detectors import describe
+
+
+# Configuration
+REPORTS_DIR = "reports"
+MIN_SAMPLES = 30  # Readings required in the window before a report is written
+MIN_INTERVAL = 1.0  # Seconds between two reports of the same device
+TEMP_LIMIT = 30.0  # °C
+FLOW_LIMIT = 50.0  # L/h
+HUMIDITY_RANGE = (30.0, 70.0)  # %
+
+# (stats key, label, unit)
+METRICS = [
+    ("temperature", "Temperature", "°C"),
+    ("humidity", "Humidity", "%"),
+    ("flow", "Water Flow", "L/h"),
+]
+
+log = logging.getLogger("reports")
+RENDER_SECONDS = metrics.histogram("wokwi_report_render_seconds", "Time to render and write one report")
+
+PAGE = Template("""
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Sensor Data Report</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; background: #f5f5f5; }
+        .container { max-width: 900px; margin: 0 auto; background: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+        h1 { color: #333; border-bottom: 3px solid #38bdf8; padding-bottom: 10px; }
+        h2 { color: #555; margin-top: 30px; }
+        table { width: 100%; border-collapse: collapse; margin: 20px 0; }
+        th, td { padding: 12px; text-align: left; border-bottom: 1px solid #ddd; }
+        th { background-color: #38bdf8; color: white; }
+        .metric { background: #f8f9fa; padding: 15px; margin: 10px 0; border-left: 4px solid #38bdf8; }
+        .metric-name { font-weight: bold; color: #555; }
+        .metric-value { font-size: 1.2em; color: #333; }
+        .trend { display: inline-block; padding: 5px 10px; border-radius: 5px; font-weight: bold; }
+        .trend.up { background: #fef3c7; color: #92400e; }
+        .trend.down { background: #dbeafe; color: #1e40af; }
+        .footer { margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; color: #666; font-size: 0.9em; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Sensor Data Analysis Report</h1>
+        <p><strong>Device:</strong> $device</p>
+        <p><strong>Report Generated:</strong> $generated</p>
+        <p><strong>Data Range:</strong> $first to $last</p>
+        <p><strong>Total Samples:</strong> $count</p>
+$sections
+        <h2>Recommendations</h2>
+        <ul>
+$recommendations
+        </ul>
+
+        <div class="footer">
+            <p>This report was automatically generated by the Wokwi Intelligent Agent System.</p>
+            <p>For questions or concerns, please review the sensor data and agent logs.</p>
+        </div>
+    </div>
+</body>
+</html>
+""")
+
+SECTION = Template("""
+        <h2>$label Analysis</h2>
+        <div class="metric">
+            <div class="metric-name">Average $label</div>
+            <div class="metric-value">$avg $unit</div>
+        </div>
+        <table>
+            <tr>
+                <th>Metric</th>
+                <th>Value</th>
+            </tr>
+            <tr>
+                <td>Minimum</td>
+                <td>$min $unit</td>
+            </tr>
+            <tr>
+                <td>Maximum</td>
+                <td>$max $unit</td>
+            </tr>
+            <tr>
+                <td>Standard Deviation</td>
+                <td>$std $unit</td>
+            </tr>
+            <tr>
+                <td>Trend</td>
+                <td><span class="trend $trend_class">$trend</span></td>
+            </tr>
+            <tr>
+                <td>Detector</td>
+                <td>$detector</td>
+            </tr>
+        </table>
+""")
+
+
+def _format_time(timestamp_ns):
+    return datetime.fromtimestamp(timestamp_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _detector_state(stats, key):
+    return stats.get("detectors", {}).get(key, {}).get("state")
+
+
+def recommendations(stats):
+    temp, humidity, flow = stats["temperature"], stats["humidity"], stats["flow"]
+    # A rising temperature or flow is flagged before it reaches the fixed limit
+    overheating = temp['max'] >= TEMP_LIMIT or _detector_state(stats, "temperature") == "Rising"
+    leaking = flow['max'] >= FLOW_LIMIT or _detector_state(stats, "flow") == "Rising"
+    humidity_ok = (HUMIDITY_RANGE[0] <= humidity['avg'] <= HUMIDITY_RANGE[1]
+                   and _detector_state(stats, "humidity") not in ("Rising", "Falling"))
+    items = [
+        f"Temperature range: {temp['min']:.1f}°C to {temp['max']:.1f}°C - "
+        f"{'Review cooling systems' if overheating else 'Within normal range'}",
+        f"Humidity range: {humidity['min']:.1f}% to {humidity['max']:.1f}% - "
+        f"{'Optimal conditions' if humidity_ok else 'Consider humidity control'}",
+        f"Water flow range: {flow['min']:.1f} to {flow['max']:.1f} L/h - "
+        f"{'Check for leaks' if leaking else 'Normal operation'}",
+    ]
+    for t, metric, kind, value in reversed(stats.get("detectors", {}).get("recent", [])):
+        items.append(f"{datetime.fromtimestamp(t).strftime('%H:%M:%S')}: {describe(metric, kind, value)}")
+    return items
+
+
+def _detector_cell(detector, unit):
+    if not detector:
+        return "-"
+    if detector["state"] == "Learning":
+        return "Learning"
+    return f"{detector['state']} (z={detector['z']:+.1f}, {detector['rate']:+.2f} {unit}/s)"
+
+
+def render_report(device_id, stats, generated_at=None, metrics=METRICS):
+    """Render a stats snapshot (see StreamingStats.snapshot) as an HTML page."""
+    generated_at = generated_at or datetime.now()
+    sections = []
+    for key, label, unit in metrics:
+        values = stats[key]
+        trend = values.get("trend", "")
+        detector = stats.get("detectors", {}).get(key)
+        sections.append(SECTION.substitute(
+            label=label,
+            unit=unit,
+            avg=f"{values['avg']:.2f}",
+            min=f"{values['min']:.2f}",
+            max=f"{values['max']:.2f}",
+            std=f"{values['std']:.2f}",
+            trend=trend,
+            trend_class="up" if trend == "Increasing" else "down",
+            detector=html.escape(_detector_cell(detector, unit)),
+        ))
+    if all(key in stats for key in ("temperature", "humidity", "flow")):
+        items = recommendations(stats)
+    else:
+        items = []
+    return PAGE.substitute(
+        device=html.escape(str(device_id)),
+        generated=generated_at.strftime("%Y-%m-%d %H:%M:%S"),
+        first=_format_time(stats["first_ns"]),
+        last=_format_time(stats["last_ns"]),
+        count=stats["count"],
+        sections="".join(sections),
+        recommendations="\n".join(f"            <li>{item}</li>" for item in items),
+    )
+
+
+def write_atomic(path, text):
+    """Write text to path via a temporary file in the same directory and a rename."""
+    directory = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".report-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ReportWorker:
+    """
+    Renders reports on a dedicated thread.
+
+    request(device_id, source) is cheap and never blocks on rendering:
+    source is a callable returning the stats snapshot and is only called
+    when the report is actually rendered, so it always reflects the latest
+    readings. A device that is already pending is not queued twice, and a
+    device whose data has not changed since its last report is skipped.
+    """
+
+    def __init__(self, directory=REPORTS_DIR, min_samples=MIN_SAMPLES, min_interval=MIN_INTERVAL,
+                 metrics=METRICS, clock=time.monotonic):
+        self.directory = directory
+        self.min_samples = min_samples
+        self.min_interval = min_interval
+        self.metrics = metrics
+        self.clock = clock
+        self.rendered = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self._pending = {}  # device_id -> source, in request order
+        self._last_render = {}  # device_id -> clock time of the last render
+        self._last_data = {}  # device_id -> last_ns covered by the last report
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="report-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Render whatever is still pending, then stop the worker."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+
+    def request(self, device_id, source):
+        """Ask for a report of a device; returns False if it was merged into a pending one."""
+        with self._cond:
+            if device_id in self._pending:
+                self._pending[device_id] = source
+                self.coalesced += 1
+                return False
+            self._pending[device_id] = source
+            self._cond.notify()
+            return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            "pending": self.pending(),
+            "rendered": self.rendered,
+            "coalesced": self.coalesced,
+            "skipped": self.skipped,
+        }
+
+    def _next(self):
+        """Wait for the pending device that is due first and remove it from the queue."""
+        with self._cond:
+            while True:
+                if not self._pending:
+                    if self._stopped:
+                        return None, None
+                    self._cond.wait()
+                    continue
+                now = self.clock()
+                due, device_id = min(
+                    (self._last_render.get(device_id, float("-inf")) + self.min_interval, device_id)
+                    for device_id in self._pending
+                )
+                if due <= now or self._stopped:
+                    return device_id, self._pending.pop(device_id)
+                self._cond.wait(due - now)
+
+    def _run(self):
+        while True:
+            device_id, source = self._next()
+            if device_id is None:
+                return
+            try:
+                self.render(device_id, source())
+            except Exception as e:
+                log.error("[%s] Error generating report: %s", device_id, e)
+            self._last_render[device_id] = self.clock()
+
+    def render(self, device_id, stats):
+        """Render and write one report; returns its path or None if it was skipped."""
+        if stats["count"] < self.min_samples:
+            log.debug("[%s] Not enough data for report. Have %d, need %d", device_id, stats["count"], self.min_samples)
+            self.skipped += 1
+            return None
+        if self._last_data.get(device_id) == stats["last_ns"]:
+            # No new readings since the previous report
+            self.skipped += 1
+            return None
+
+        started = time.perf_counter()
+        now = datetime.now()
+        path = os.path.join(self.directory, f"report_{device_id}_{now.strftime('%Y%m%d_%H%M%S')}.html")
+        write_atomic(path, render_report(device_id, stats, now, self.metrics))
+        self._last_data[device_id] = stats["last_ns"]
+        self.rendered += 1
+        RENDER_SECONDS.observe(time.perf_counter() - started)
+
+        log.info("[%s] Report generated: %s (%s)", device_id, path, ", ".join(
+            f"{label}: {stats[key]['avg']:.2f} {unit} [{stats[key]['min']:.2f}..{stats[key]['max']:.2f}]"
+            for key, label, unit in self.metrics
+        ))
+        return path
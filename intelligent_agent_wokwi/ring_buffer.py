@@ -0,0 +1,113 @@
+"""
+Fixed-capacity ring buffer of recent sensor readings.
+
+Readings are stored in preallocated typed columns (int64 epoch-ns timestamps
+and float32 temperature/humidity/flow) so memory use is constant no matter
+how long the service runs. There is a single writer (the ingest worker);
+readers take lock-free, zero-copy views and can check afterwards whether
+the writer overwrote the data they looked at.
+"""
+from array import array
+
+
+# Configuration
+BUFFER_RETENTION = 100000  # Samples kept in memory (~1.6 MB)
+
+COLUMNS = ["timestamp_ns", "temperature", "humidity", "flow"]
+
+
+class RingView:
+    """
+    Zero-copy view of a window of the ring buffer.
+
+    Each column is exposed as one or two memoryview segments (two when the
+    window wraps around the end of the buffer).
+    """
+
+    def __init__(self, buffer, start, end):
+        self._buffer = buffer
+        self.start = start
+        self.end = end
+
+        capacity = buffer.capacity
+        first = start % capacity
+        length = end - start
+        if first + length <= capacity:
+            spans = [(first, first + length)]
+        else:
+            spans = [(first, capacity), (0, first + length - capacity)]
+        self.segments = {
+            name: [memoryview(column)[lo:hi] for lo, hi in spans]
+            for name, column in zip(COLUMNS, buffer.columns)
+        }
+
+    def __len__(self):
+        return self.end - self.start
+
+    def is_valid(self):
+        """True while none of the viewed slots have been overwritten by newer samples."""
+        return self._buffer.written - self._buffer.capacity <= self.start
+
+    def column(self, name):
+        """Return a column as a flat list (copies the data)."""
+        values = []
+        for segment in self.segments[name]:
+            values.extend(segment.tolist())
+        return values
+
+    def rows(self):
+        """Yield (timestamp_ns, temp, humidity, flow) tuples, oldest first."""
+        return zip(*(self.column(name) for name in COLUMNS))
+
+
+class RingBuffer:
+    def __init__(self, capacity=BUFFER_RETENTION):
+        self.capacity = capacity
+        self.timestamps = array("q", bytes(8 * capacity))
+        self.temperature = array("f", bytes(4 * capacity))
+        self.humidity = array("f", bytes(4 * capacity))
+        self.flow = array("f", bytes(4 * capacity))
+        self.columns = [self.timestamps, self.temperature, self.humidity, self.flow]
+        # Total samples ever written; published after the slot is filled
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, timestamp_ns, temp, humidity, flow):
+        """Store one reading, overwriting the oldest one when full (single writer only)."""
+        index = self.written % self.capacity
+        self.timestamps[index] = timestamp_ns
+        self.temperature[index] = temp
+        self.humidity[index] = humidity
+        self.flow[index] = flow
+        self.written += 1
+
+    def window(self, count=None):
+        """Return a view of the newest `count` readings (all retained readings by default)."""
+        end = self.written
+        available = min(end, self.capacity)
+        if count is None or count > available:
+            count = available
+        return RingView(self, end - count, end)
+
+    def since(self, timestamp_ns):
+        """Return a view of the retained readings newer than `timestamp_ns`."""
+        end = self.written
+        lo = max(end - self.capacity, 0)
+        hi = end
+        # Timestamps are appended in order, so binary search over the logical range
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[mid % self.capacity] > timestamp_ns:
+                hi = mid
+            else:
+                lo = mid + 1
+        return RingView(self, lo, end)
+
+    def latest(self):
+        """Return the newest reading as a tuple, or None if the buffer is empty."""
+        if self.written == 0:
+            return None
+        index = (self.written - 1) % self.capacity
+        return tuple(column[index] for column in self.columns)
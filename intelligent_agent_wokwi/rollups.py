@@ -0,0 +1,442 @@
+"""
+Tiered rollups and retention for long-term sensor history.
+
+Raw readings are aggregated into 1-minute, 1-hour and 1-day tiers, each
+stored next to the device's segments as a file of fixed-width rows
+(rollup_1m.bin, ...): bucket start, reading count, and the min, max, sum
+and sum of squares of every metric, so rows of a finer tier merge exactly
+into a coarser one and mean and standard deviation can be derived.
+
+A RollupWorker rolls every device once per `interval`: complete minutes
+are aggregated from the raw segments (through the history block index),
+complete hours from the 1-minute tier and complete days from the 1-hour
+tier. A bucket is complete ROLLUP_DELAY seconds after it ends; readings
+that arrive later than that only reach the raw data. The tier files are
+the only state, so a restart continues where the last run stopped.
+
+Each tier has its own retention, and raw segments are deleted once they
+are older than RAW_RETENTION and have been rolled up, so storage stays
+bounded. A downsampled query is answered from the coarsest tier whose
+buckets are no wider than the requested resolution, then from finer
+tiers and finally raw data for the recent part not rolled up yet: a
+month at 500 points reads ~720 hourly rows instead of millions of
+readings.
+"""
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import time
+
+import history
+import metrics
+import storage
+from history import METRICS
+
+
+# Configuration
+# (name, bucket width in seconds, retention in seconds or None to keep forever), finest first
+TIERS = [
+    ("1m", 60, 90 * 86400),
+    ("1h", 3600, 2 * 365 * 86400),
+    ("1d", 86400, None),
+]
+RAW_RETENTION = 30 * 86400  # Seconds raw segments are kept (None keeps them forever)
+ROLLUP_INTERVAL = 60  # Seconds between rollup runs
+ROLLUP_DELAY = 10  # Seconds after a bucket ends before it is rolled up
+COMPACT_INTERVAL = 3600  # Seconds between retention passes
+BACKFILL_CHUNK = 86400  # Seconds of raw readings aggregated per step
+TIER_PREFIX = "rollup_"
+TIER_SUFFIX = ".bin"
+
+# Row: bucket start, reading count, then min, max, sum, sum of squares per metric
+ROW = struct.Struct("<qI" + "dddd" * len(METRICS))
+
+log = logging.getLogger("rollups")
+ROLLUP_SECONDS = metrics.histogram("wokwi_rollup_seconds", "Time to roll up one device")
+
+
+class Aggregate:
+    """Count, min, max, sum and sum of squares of every metric over one bucket."""
+
+    __slots__ = ("start_ns", "count", "mins", "maxs", "sums", "squares")
+
+    def __init__(self, start_ns):
+        self.start_ns = start_ns
+        self.count = 0
+        self.mins = [math.inf] * len(METRICS)
+        self.maxs = [-math.inf] * len(METRICS)
+        self.sums = [0.0] * len(METRICS)
+        self.squares = [0.0] * len(METRICS)
+
+    def add(self, values):
+        self.count += 1
+        for i, x in enumerate(values):
+            if x < self.mins[i]:
+                self.mins[i] = x
+            if x > self.maxs[i]:
+                self.maxs[i] = x
+            self.sums[i] += x
+            self.squares[i] += x * x
+
+    def merge(self, other):
+        self.count += other.count
+        for i in range(len(METRICS)):
+            self.mins[i] = min(self.mins[i], other.mins[i])
+            self.maxs[i] = max(self.maxs[i], other.maxs[i])
+            self.sums[i] += other.sums[i]
+            self.squares[i] += other.squares[i]
+
+    def mean(self, i):
+        return self.sums[i] / self.count
+
+    def std(self, i):
+        """Sample standard deviation (ddof=1, as in stats.py)."""
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(max(self.squares[i] - self.sums[i] ** 2 / self.count, 0.0) / (self.count - 1))
+
+    def pack(self):
+        stats = []
+        for i in range(len(METRICS)):
+            stats.extend((self.mins[i], self.maxs[i], self.sums[i], self.squares[i]))
+        return ROW.pack(self.start_ns, self.count, *stats)
+
+    @classmethod
+    def unpack(cls, start_ns, count, *stats):
+        aggregate = cls(start_ns)
+        aggregate.count = count
+        aggregate.mins = list(stats[0::4])
+        aggregate.maxs = list(stats[1::4])
+        aggregate.sums = list(stats[2::4])
+        aggregate.squares = list(stats[3::4])
+        return aggregate
+
+
+class Tier:
+    """One tier file of a device: rows in bucket order, at most one per bucket."""
+
+    def __init__(self, directory, name, width, retention):
+        self.name = name
+        self.path = os.path.join(directory, f"{TIER_PREFIX}{name}{TIER_SUFFIX}")
+        self.width_ns = width * 1_000_000_000
+        self.retention = retention
+        self._lock = threading.Lock()
+
+    def _rows(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // ROW.size
+
+    def _read_row(self, f, i):
+        f.seek(i * ROW.size)
+        return ROW.unpack(f.read(ROW.size))
+
+    def first_start(self):
+        with self._lock:
+            if not self._rows():
+                return None
+            with open(self.path, "rb") as f:
+                return self._read_row(f, 0)[0]
+
+    def end(self):
+        """End of the last rolled-up bucket, or None if the tier is empty."""
+        with self._lock:
+            rows = self._rows()
+            if not rows:
+                return None
+            with open(self.path, "rb") as f:
+                return self._read_row(f, rows - 1)[0] + self.width_ns
+
+    def append(self, aggregates):
+        with self._lock:
+            with open(self.path, "ab") as f:
+                # Drop a torn trailing row left by a crash before appending
+                size = f.tell()
+                if size % ROW.size:
+                    f.truncate(size - size % ROW.size)
+                f.write(b"".join(aggregate.pack() for aggregate in aggregates))
+
+    def read(self, start_ns, end_ns):
+        """Return the aggregates whose bucket starts in [start_ns, end_ns)."""
+        with self._lock:
+            rows = self._rows()
+            if not rows:
+                return []
+            with open(self.path, "rb") as f:
+                # Rows are in bucket order: binary search for the first one
+                lo, hi = 0, rows
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self._read_row(f, mid)[0] < start_ns:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                f.seek(lo * ROW.size)
+                result = []
+                for row in ROW.iter_unpack(f.read((rows - lo) * ROW.size)):
+                    if row[0] >= end_ns:
+                        break
+                    result.append(Aggregate.unpack(*row))
+                return result
+
+    def compact(self, now_ns):
+        """Rewrite the tier without the rows past its retention; returns the number removed."""
+        if self.retention is None:
+            return 0
+        cutoff = now_ns - self.retention * 1_000_000_000
+        with self._lock:
+            rows = self._rows()
+            if not rows:
+                return 0
+            with open(self.path, "rb") as f:
+                if self._read_row(f, 0)[0] + self.width_ns > cutoff:
+                    return 0
+                data = f.read()  # From row 1 on
+            keep = [row for row in ROW.iter_unpack(data[:len(data) - len(data) % ROW.size])
+                    if row[0] + self.width_ns > cutoff]
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(b"".join(ROW.pack(*row) for row in keep))
+            os.replace(temp_path, self.path)
+            return rows - len(keep)
+
+
+def device_tiers(directory, tiers=TIERS):
+    return [Tier(directory, name, width, retention) for name, width, retention in tiers]
+
+
+def _floor(timestamp_ns, width_ns):
+    return timestamp_ns - timestamp_ns % width_ns
+
+
+def roll_device(directory, now_ns=None, tiers=TIERS, delay=ROLLUP_DELAY, index=None):
+    """Roll up every complete bucket of one device's raw data; returns the number of new rows per tier."""
+    now_ns = time.time_ns() if now_ns is None else now_ns
+    index = index or history.HistoryIndex(directory)
+    tier_files = device_tiers(directory, tiers)
+    added = {}
+
+    # Finest tier from the raw segments, a chunk at a time
+    finest = tier_files[0]
+    complete = _floor(now_ns - delay * 1_000_000_000, finest.width_ns)
+    start = finest.end()
+    if start is None:
+        segments = [segment for segment in index.refresh() if segment.ts_min is not None]
+        start = _floor(segments[0].ts_min, finest.width_ns) if segments else complete
+    count = 0
+    chunk = BACKFILL_CHUNK * 1_000_000_000
+    while start < complete:
+        end = min(start + chunk, complete)
+        buckets = {}
+        for timestamp_ns, *values in index.query(start, end - 1):
+            bucket = _floor(timestamp_ns, finest.width_ns)
+            aggregate = buckets.get(bucket)
+            if aggregate is None:
+                aggregate = buckets[bucket] = Aggregate(bucket)
+            aggregate.add(values)
+        finest.append([buckets[bucket] for bucket in sorted(buckets)])
+        count += len(buckets)
+        start = end
+    added[finest.name] = count
+
+    # Each coarser tier from the one below it
+    for finer, coarser in zip(tier_files, tier_files[1:]):
+        complete = _floor(now_ns - delay * 1_000_000_000, coarser.width_ns)
+        start = coarser.end()
+        if start is None:
+            first = finer.first_start()
+            start = _floor(first, coarser.width_ns) if first is not None else complete
+        buckets = {}
+        if start < complete:
+            for row in finer.read(start, complete):
+                bucket = _floor(row.start_ns, coarser.width_ns)
+                aggregate = buckets.get(bucket)
+                if aggregate is None:
+                    aggregate = buckets[bucket] = Aggregate(bucket)
+                aggregate.merge(row)
+            coarser.append([buckets[bucket] for bucket in sorted(buckets)])
+        added[coarser.name] = len(buckets)
+    return added
+
+
+def compact_device(directory, now_ns=None, tiers=TIERS, raw_retention=RAW_RETENTION):
+    """
+    Apply the retention policies: drop old tier rows, and delete raw segments
+    (and their block indexes) that are past raw_retention and fully rolled
+    up. The segment being written is never deleted. Returns the number of
+    raw segments removed.
+    """
+    now_ns = time.time_ns() if now_ns is None else now_ns
+    tier_files = device_tiers(directory, tiers)
+    for tier in tier_files:
+        removed = tier.compact(now_ns)
+        if removed:
+            log.info("Dropped %d %s row(s) past retention from %s", removed, tier.name, directory)
+    if raw_retention is None:
+        return 0
+
+    rolled_until = tier_files[0].end() or 0
+    cutoff = min(now_ns - raw_retention * 1_000_000_000, rolled_until)
+    removed = 0
+    for path in storage.list_segments(directory)[:-1]:
+        last = _last_timestamp(path)
+        if last is not None and last >= cutoff:
+            break  # Segments are in time order
+        os.remove(path)
+        index_path = path[:-len(storage.SEGMENT_SUFFIX)] + history.INDEX_SUFFIX
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        removed += 1
+    if removed:
+        log.info("Removed %d raw segment(s) past retention from %s", removed, directory)
+    return removed
+
+
+def _last_timestamp(path):
+    size = os.path.getsize(path)
+    records = size // storage.RECORD.size
+    if not records:
+        return None
+    with open(path, "rb") as f:
+        f.seek((records - 1) * storage.RECORD.size)
+        return storage.RECORD.unpack(f.read(storage.RECORD.size))[0]
+
+
+def downsample(directory, metric, start_ns, end_ns, points, tiers=TIERS, index=None):
+    """
+    Aggregate one metric over [start_ns, end_ns] into at most `points`
+    equal-width buckets, like history.HistoryIndex.downsample, but from the
+    coarsest tiers that are fine enough, with raw data only for the part
+    not rolled up yet. Bucket edges are accurate to one tier bucket.
+    """
+    if points <= 0:
+        raise ValueError("points must be positive")
+    column = history._metric_column(metric) - 1
+    width = max((end_ns - start_ns + 1) / points, 1)
+    buckets = {}
+
+    def add(bucket, count, low, high, total):
+        current = buckets.get(bucket)
+        if current is None:
+            buckets[bucket] = [count, low, high, total]
+        else:
+            current[0] += count
+            current[1] = min(current[1], low)
+            current[2] = max(current[2], high)
+            current[3] += total
+
+    # Each tier answers the whole buckets it has in the range; the edges and
+    # the part after it are left to the next finer tier, and finally raw data
+    usable = [tier for tier in reversed(device_tiers(directory, tiers)) if tier.width_ns <= width]
+    ends = [tier.end() for tier in usable]
+    index = index or history.HistoryIndex(directory)
+
+    def cover(low, high, level):
+        if low >= high:
+            return
+        if level == len(usable):
+            for bucket_start, low_value, high_value, avg, count in index.downsample(
+                    metric, low, high - 1, points, origin_ns=start_ns, width=width):
+                add(round((bucket_start - start_ns) / width), count, low_value, high_value, avg * count)
+            return
+        tier, tier_end = usable[level], ends[level]
+        first = -(-low // tier.width_ns) * tier.width_ns
+        last = min(_floor(high, tier.width_ns), tier_end or 0)
+        if first >= last:
+            cover(low, high, level + 1)
+            return
+        cover(low, first, level + 1)
+        for row in tier.read(first, last):
+            add(int((row.start_ns - start_ns) // width), row.count, row.mins[column], row.maxs[column],
+                row.sums[column])
+        cover(last, high, level + 1)
+
+    cover(start_ns, end_ns + 1, 0)
+    return [
+        (start_ns + int(bucket * width), low, high, total / count, count)
+        for bucket, (count, low, high, total) in sorted(buckets.items())
+    ]
+
+
+def query_history(device_id, metric, start_ns, end_ns, points=None, data_dir=None):
+    """
+    Same as history.query_history, but downsampled queries (with `points`)
+    are answered from the rollup tiers where they are fine enough.
+    """
+    if not points:
+        return history.query_history(device_id, metric, start_ns, end_ns, data_dir=data_dir)
+    directory = os.path.join(data_dir or storage.DATA_DIR, device_id)
+    return downsample(directory, metric, start_ns, end_ns, points, index=history.get_index(device_id, data_dir))
+
+
+class RollupWorker:
+    """Rolls up and compacts every device with binary storage on a background thread."""
+
+    def __init__(self, data_dir=None, interval=ROLLUP_INTERVAL, compact_interval=COMPACT_INTERVAL,
+                 clock=time.monotonic):
+        self.data_dir = data_dir
+        self.interval = interval
+        self.compact_interval = compact_interval
+        self.clock = clock
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_compact = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def run_once(self):
+        data_dir = self.data_dir or storage.DATA_DIR
+        compact = self._last_compact is None or self.clock() - self._last_compact >= self.compact_interval
+        for device_id in storage.list_devices(data_dir):
+            directory = os.path.join(data_dir, device_id)
+            started = time.perf_counter()
+            try:
+                roll_device(directory, index=history.get_index(device_id, data_dir))
+                if compact:
+                    compact_device(directory)
+            except Exception as e:
+                log.error("[%s] Error rolling up history: %s", device_id, e)
+            ROLLUP_SECONDS.observe(time.perf_counter() - started)
+        if compact:
+            self._last_compact = self.clock()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+
+if __name__ == "__main__":
+    # Usage: python rollups.py roll
+    #        python rollups.py query <device_id> <metric> <days> [points]
+    if len(sys.argv) >= 5 and sys.argv[1] == "query":
+        device_id, metric, days = sys.argv[2], sys.argv[3], float(sys.argv[4])
+        points = int(sys.argv[5]) if len(sys.argv) > 5 else 500
+        end_ns = time.time_ns()
+        started = time.perf_counter()
+        buckets = query_history(device_id, metric, end_ns - int(days * 86400e9), end_ns, points)
+        elapsed = time.perf_counter() - started
+        print(f"{len(buckets)} bucket(s) of {metric} for {device_id} in {elapsed * 1000:.1f} ms")
+        for timestamp, low, high, avg, count in buckets[-20:]:
+            print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp / 1e9))}  "
+                  f"min={low:.2f} max={high:.2f} avg={avg:.2f} n={count}")
+    elif len(sys.argv) == 2 and sys.argv[1] == "roll":
+        for device_id in storage.list_devices():
+            started = time.perf_counter()
+            added = roll_device(os.path.join(storage.DATA_DIR, device_id))
+            print(f"{device_id}: {added} new row(s) in {(time.perf_counter() - started) * 1000:.0f} ms")
+    else:
+        print("Usage: python rollups.py roll")
+        print("       python rollups.py query <device_id> <metric> <days> [points]")
+        print(f"Devices: {', '.join(storage.list_devices()) or 'none'}; metrics: {', '.join(METRICS)}")
+        sys.exit(1)
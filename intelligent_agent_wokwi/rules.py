@@ -0,0 +1,278 @@
+"""
+Actuator rules as data, evaluated per sample or vectorized over batches.
+
+A Rule switches an actuator on when `metric > threshold` and every extra
+condition holds, and off again once `metric < threshold - hysteresis` or a
+condition fails (a Schmitt trigger). The actuator follows that level but
+never switches again within `min_dwell` seconds of its last change.
+
+With an `early_threshold`, the rule also switches on above that lower
+level while the metric is rising (readings["<metric>_rising"], set from
+the streaming detectors in detectors.py), and does not switch off while
+it keeps rising: an overheating or a leak is acted on before the fixed
+threshold is reached.
+
+RuleState applies a rule one sample at a time (used by IntelligentAgent).
+evaluate_batch applies the same rules with NumPy to whole columns of
+readings, e.g. to replay stored history or to evaluate many devices at once.
+Columns may carry the rising flags; otherwise evaluate_batch derives them
+for the metric of each rule with an early threshold with
+detectors.RisingDetector, which gives the agent's flags a column at a time.
+"""
+import operator
+import os
+import sys
+import time
+
+from detectors import RisingDetector
+
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+
+class Rule:
+    def __init__(self, actuator, metric, threshold, hysteresis=0.0, min_dwell=0.0, conditions=(), alert=None,
+                 early_threshold=None):
+        self.actuator = actuator
+        self.metric = metric
+        self.threshold = threshold
+        self.early_threshold = early_threshold
+        self.hysteresis = hysteresis
+        self.min_dwell = min_dwell
+        # Extra (metric, op, value) conditions that must also hold to switch on
+        self.conditions = [(metric_name, OPERATORS[op], value) for metric_name, op, value in conditions]
+        self.alert = alert
+
+    def trigger_levels(self, readings):
+        """
+        Return (high, low): whether the rule requests on, and whether it requests off.
+        Works on scalar readings and element-wise on NumPy arrays.
+        """
+        x = readings[self.metric]
+        high = x > self.threshold
+        low = x < self.threshold - self.hysteresis
+        rising = readings.get(f"{self.metric}_rising") if self.early_threshold is not None else None
+        if rising is not None:
+            high = high | (rising & (x > self.early_threshold))
+            low = low & (~rising if hasattr(rising, "dtype") else not rising)
+        for metric_name, compare, value in self.conditions:
+            holds = compare(readings[metric_name], value)
+            high = high & holds
+            low = low | (~holds if hasattr(holds, "dtype") else not holds)
+        return high, low
+
+
+class RuleState:
+    """Applies a rule to one sample at a time and tracks the actuator state."""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.level = None
+        self.on = None  # Unknown until the first command is sent
+        self.changed_at = None
+
+    def update(self, readings, now):
+        """Feeds a dict of readings and returns True if the actuator state changed."""
+        high, low = self.rule.trigger_levels(readings)
+        if high:
+            self.level = True
+        elif self.level is None or low:
+            self.level = False
+
+        if self.level == self.on:
+            return False
+        if self.on is not None and now - self.changed_at < self.rule.min_dwell:
+            return False
+        self.on = self.level
+        self.changed_at = now
+        return True
+
+    def command(self):
+        return f"{self.rule.actuator}:{'ON' if self.on else 'OFF'}"
+
+
+class BatchState:
+    """
+    Vectorized equivalent of RuleState for arrays of devices.
+    level/on are int8 arrays (-1 unknown, 0 off, 1 on); changed_at is in seconds.
+    rising is the RisingDetector of rules with an early threshold.
+    """
+
+    def __init__(self, level, on, changed_at, rising=None):
+        self.level = level
+        self.on = on
+        self.changed_at = changed_at
+        self.rising = rising
+
+    @classmethod
+    def unknown(cls, shape):
+        import numpy as np
+
+        return cls(np.full(shape, -1, np.int8), np.full(shape, -1, np.int8), np.full(shape, -np.inf))
+
+
+def _schmitt_levels(np, high, low, initial):
+    """Forward-fill the on/off requests along the last axis, starting from `initial`."""
+    events = np.where(high, 1, np.where(low, 0, -1)).astype(np.int8)
+    # An unknown level that is neither raised nor lowered starts off, as in RuleState
+    start = np.where(initial < 0, 0, initial).astype(np.int8)[..., None]
+    events = np.concatenate([start, events], axis=-1)
+    index = np.where(events >= 0, np.arange(events.shape[-1]), 0)
+    np.maximum.accumulate(index, axis=-1, out=index)
+    return np.take_along_axis(events, index, axis=-1)[..., 1:]
+
+
+def _apply_dwell(np, times, levels, on, changed_at, min_dwell):
+    """
+    Actuator output: follow `levels` along the last axis, holding each state for min_dwell.
+    All devices advance together, one actuator change per step, so the loop runs
+    as often as the busiest device changes state, not once per sample or device.
+    """
+    shape = levels.shape
+    n = shape[-1]
+    times = np.broadcast_to(times, shape).reshape(-1, n)
+    levels = levels.reshape(-1, n)
+    initial = on.reshape(-1)
+    on = initial.copy()
+    changed_at = changed_at.reshape(-1).astype(np.float64)
+    rows = np.arange(len(levels))
+
+    # First index >= j holding each level (n if none), with a sentinel column for j = n
+    positions = np.arange(n, dtype=np.int32)
+    next_index = []
+    for value in (0, 1):
+        index = np.where(levels == value, positions, n)
+        index = np.minimum.accumulate(index[:, ::-1], axis=1)[:, ::-1]
+        next_index.append(np.concatenate([index, np.full((len(rows), 1), n, np.int32)], axis=1))
+    # One ascending array of all rows' times, so a single searchsorted finds each
+    # row's first sample at or after its dwell deadline
+    base = times[:, 0]
+    span = float((times[:, -1] - base).max()) + 1.0
+    flat = (times - base[:, None] + (rows * span)[:, None]).ravel()
+
+    events = np.full(levels.shape, -1, np.int8)
+    position = np.zeros(len(rows), np.int64)
+    while True:
+        deadline = np.clip(changed_at + min_dwell - base, 0.0, span - 0.5)
+        start = np.maximum(position, np.searchsorted(flat, deadline + rows * span) - rows * n)
+        start = np.where(on < 0, position, start)
+        # An unknown state takes the first level at once; otherwise switch at the first opposite level
+        switch = np.where(on < 0, position, np.where(on == 1, next_index[0][rows, start], next_index[1][rows, start]))
+        switching = switch < n
+        if not switching.any():
+            break
+        row, index = rows[switching], switch[switching]
+        on[row] = events[row, index] = levels[row, index]
+        changed_at[row] = times[row, index]
+        position = np.where(switching, switch, n)
+
+    # Forward-fill the switches from the state before the batch
+    index = np.where(events >= 0, positions, -1)
+    np.maximum.accumulate(index, axis=1, out=index)
+    output = np.where(index >= 0, np.take_along_axis(events, np.maximum(index, 0), axis=1), initial[:, None])
+    return output.reshape(shape), on.reshape(shape[:-1]), changed_at.reshape(shape[:-1])
+
+
+def evaluate_batch(rules, timestamps, columns, states=None):
+    """
+    Evaluate rules over columnar batches.
+
+    timestamps: seconds, array of shape (..., n_samples); leading axes are devices
+    columns: dict of metric name -> array with the same shape; "<metric>_rising"
+        columns are computed like the agent's detectors when missing
+    states: optional dict of actuator -> BatchState from a previous call
+
+    Returns (decisions, states): decisions maps each actuator to a bool array
+    with its state after every sample, states can be passed to the next call.
+    """
+    import numpy as np
+
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    columns = {name: np.asarray(values) for name, values in columns.items()}
+    shape = timestamps.shape[:-1]
+    states = dict(states or {})
+    decisions = {}
+    if timestamps.shape[-1] == 0:
+        return {rule.actuator: np.zeros(timestamps.shape, bool) for rule in rules}, states
+
+    for rule in rules:
+        state = states.get(rule.actuator) or BatchState.unknown(shape)
+        readings = columns
+        rising = state.rising
+        column = f"{rule.metric}_rising"
+        if rule.early_threshold is not None and column not in columns:
+            if rising is None:
+                rising = RisingDetector(shape, rule.metric)
+            readings = dict(columns)
+            readings[column] = rising.update(timestamps, columns[rule.metric])
+        high, low = rule.trigger_levels(readings)
+        levels = _schmitt_levels(np, high, low, state.level)
+
+        if rule.min_dwell > 0:
+            output, on, changed_at = _apply_dwell(np, timestamps, levels, state.on, state.changed_at, rule.min_dwell)
+        else:
+            output = levels
+            # Record the time of the last change so a later call with dwell stays consistent
+            previous = np.concatenate([state.on[..., None], levels[..., :-1]], axis=-1)
+            changes = output != previous
+            last = np.where(changes, np.arange(levels.shape[-1]), -1).max(axis=-1)
+            changed_at = np.where(last >= 0, np.take_along_axis(timestamps, np.maximum(last, 0)[..., None], -1)[..., 0],
+                                  state.changed_at)
+            on = levels[..., -1].copy()
+
+        states[rule.actuator] = BatchState(levels[..., -1].copy(), on, changed_at, rising)
+        decisions[rule.actuator] = output.astype(bool)
+
+    return decisions, states
+
+
+def transitions(decisions, timestamps):
+    """List (timestamp, command) for every state change in 1-D decisions, in time order."""
+    import numpy as np
+
+    events = []
+    for actuator, on in decisions.items():
+        changed = np.flatnonzero(np.diff(on.astype(np.int8), prepend=-1))
+        events.extend((timestamps[i], f"{actuator}:{'ON' if on[i] else 'OFF'}") for i in changed)
+    events.sort()
+    return events
+
+
+def load_history(device_id):
+    """Load a device's stored readings as NumPy columns without per-record parsing."""
+    import numpy as np
+    import storage
+
+    record = np.dtype([("timestamp_ns", "<i8"), ("temp", "<f4"), ("humidity", "<f4"), ("flow", "<f4")])
+    directory = os.path.join(storage.DATA_DIR, device_id)
+    if not os.path.isdir(directory):
+        raise ValueError(f"No stored data for device {device_id}")
+    parts = [
+        np.fromfile(path, dtype=record, count=os.path.getsize(path) // record.itemsize)
+        for path in storage.list_segments(directory)
+    ]
+    data = np.concatenate(parts) if parts else np.empty(0, record)
+    return data["timestamp_ns"] / 1e9, {name: data[name] for name in ("temp", "humidity", "flow")}
+
+
+if __name__ == "__main__":
+    # Usage: python rules.py replay <device_id>
+    if len(sys.argv) < 3 or sys.argv[1] != "replay":
+        print("Usage: python rules.py replay <device_id>")
+        sys.exit(1)
+
+    from agent import default_rules
+
+    timestamps, columns = load_history(sys.argv[2])
+    started = time.perf_counter()
+    decisions, _ = evaluate_batch(default_rules(), timestamps, columns)
+    elapsed = time.perf_counter() - started
+    events = transitions(decisions, timestamps)
+    print(f"Replayed {len(timestamps)} readings in {elapsed * 1000:.1f} ms: {len(events)} actuator transitions")
+    for timestamp, command in events[-20:]:
+        print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))}  {command}")
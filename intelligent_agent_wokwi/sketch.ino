@@ -51,14 +51,23 @@ void callback(char* topic, byte* payload, unsigned int length) {
   Serial.println(message);
 
   if (String(topic) == mqtt_topic_actuators) {
-    if (message == "ACT1:ON") {
-      digitalWrite(LED1_PIN, HIGH);
-    } else if (message == "ACT1:OFF") {
-      digitalWrite(LED1_PIN, LOW);
-    } else if (message == "ACT2:ON") {
-      digitalWrite(LED2_PIN, HIGH);
-    } else if (message == "ACT2:OFF") {
-      digitalWrite(LED2_PIN, LOW);
+    // The backend batches commands into one message, one per line
+    int start = 0;
+    while (start <= (int)message.length()) {
+      int end = message.indexOf('\n', start);
+      if (end < 0) end = message.length();
+      String command = message.substring(start, end);
+      command.trim();
+      if (command == "ACT1:ON") {
+        digitalWrite(LED1_PIN, HIGH);
+      } else if (command == "ACT1:OFF") {
+        digitalWrite(LED1_PIN, LOW);
+      } else if (command == "ACT2:ON") {
+        digitalWrite(LED2_PIN, HIGH);
+      } else if (command == "ACT2:OFF") {
+        digitalWrite(LED2_PIN, LOW);
+      }
+      start = end + 1;
     }
   }
 }
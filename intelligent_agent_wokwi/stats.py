@@ -0,0 +1,273 @@
+"""
+Incremental statistics over sliding windows of sensor readings.
+
+Every window is updated in O(1) amortized time per sample. Count windows
+keep their samples: mean and variance with Welford's algorithm (with
+removal for evicted samples) and min/max with monotonic deques. Time
+windows keep BUCKETS fixed-width buckets of mergeable aggregates instead,
+so their memory does not depend on the sample rate; their oldest edge
+moves in steps of one bucket (1/BUCKETS of the window). Trends are an
+EWMA of the sample-to-sample slope. Reports read the precomputed
+aggregates instead of rebuilding a DataFrame, so their cost does not
+depend on window size.
+"""
+import math
+import threading
+from collections import deque
+
+
+# Configuration
+METRICS = ["temperature", "humidity", "flow"]
+TREND_SPAN = 30  # Samples; EWMA smoothing factor is 2 / (span + 1)
+BUCKETS = 60  # Buckets per time window (1 s for 1m, 1 min for 1h, 24 min for 24h)
+
+# Window name -> (max samples, max age in seconds); None means unbounded.
+# Windows with only an age are bucketed; any sample limit keeps every sample.
+DEFAULT_WINDOWS = {
+    "last_30": (30, None),
+    "1m": (None, 60),
+    "1h": (None, 3600),
+    "24h": (None, 86400),
+}
+
+
+class RunningMoments:
+    """Welford mean/variance that supports removing previously added values."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x):
+        self.count -= 1
+        if self.count <= 0:
+            self.count = 0
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (x - self.mean), 0.0)
+
+    def merge(self, other):
+        """Add all values of another instance (Chan et al. parallel update)."""
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1, same as pandas)."""
+        if self.count < 2:
+            return 0.0
+        return (self.m2 / (self.count - 1)) ** 0.5
+
+
+class SlidingExtremes:
+    """Sliding-window min and max using monotonic deques of (seq, value)."""
+
+    def __init__(self):
+        self._min = deque()
+        self._max = deque()
+
+    def add(self, seq, x):
+        while self._min and self._min[-1][1] >= x:
+            self._min.pop()
+        self._min.append((seq, x))
+        while self._max and self._max[-1][1] <= x:
+            self._max.pop()
+        self._max.append((seq, x))
+
+    def evict(self, seq):
+        """Forget every value added with a sequence number <= seq."""
+        while self._min and self._min[0][0] <= seq:
+            self._min.popleft()
+        while self._max and self._max[0][0] <= seq:
+            self._max.popleft()
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else 0.0
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else 0.0
+
+
+class EwmaTrend:
+    """Exponentially weighted slope between consecutive samples."""
+
+    def __init__(self, span=TREND_SPAN):
+        self.alpha = 2.0 / (span + 1)
+        self.slope = 0.0
+        self.last = None
+
+    def add(self, x):
+        if self.last is not None:
+            self.slope += self.alpha * ((x - self.last) - self.slope)
+        self.last = x
+
+    @property
+    def direction(self):
+        return "Increasing" if self.slope > 0 else "Decreasing"
+
+
+class Window:
+    """Aggregates for one sliding window, bounded by sample count and/or age."""
+
+    def __init__(self, max_samples=None, max_age=None, metrics=METRICS):
+        self.max_samples = max_samples
+        self.max_age_ns = int(max_age * 1e9) if max_age is not None else None
+        self.metrics = metrics
+        self.samples = deque()
+        self.moments = [RunningMoments() for _ in metrics]
+        self.extremes = [SlidingExtremes() for _ in metrics]
+
+    def add(self, seq, timestamp_ns, values):
+        self.samples.append((seq, timestamp_ns, values))
+        for moments, extremes, x in zip(self.moments, self.extremes, values):
+            moments.add(x)
+            extremes.add(seq, x)
+
+        while self.samples and (
+            (self.max_samples is not None and len(self.samples) > self.max_samples)
+            or (self.max_age_ns is not None and timestamp_ns - self.samples[0][1] > self.max_age_ns)
+        ):
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        seq, _, values = self.samples.popleft()
+        for moments, extremes, x in zip(self.moments, self.extremes, values):
+            moments.remove(x)
+            extremes.evict(seq)
+
+    def snapshot(self):
+        result = {
+            "count": len(self.samples),
+            "first_ns": self.samples[0][1] if self.samples else None,
+            "last_ns": self.samples[-1][1] if self.samples else None,
+        }
+        for name, moments, extremes in zip(self.metrics, self.moments, self.extremes):
+            result[name] = {
+                "min": extremes.min,
+                "max": extremes.max,
+                "avg": moments.mean,
+                "std": moments.std,
+            }
+        return result
+
+
+class Bucket:
+    """Moments, min and max of every metric over the samples of one time bucket."""
+
+    __slots__ = ("start_ns", "first_ns", "last_ns", "moments", "mins", "maxs")
+
+    def __init__(self, start_ns, size):
+        self.start_ns = start_ns
+        self.first_ns = None
+        self.last_ns = None
+        self.moments = [RunningMoments() for _ in range(size)]
+        self.mins = [math.inf] * size
+        self.maxs = [-math.inf] * size
+
+    def add(self, timestamp_ns, values):
+        if self.first_ns is None:
+            self.first_ns = timestamp_ns
+        self.last_ns = timestamp_ns
+        for i, x in enumerate(values):
+            self.moments[i].add(x)
+            if x < self.mins[i]:
+                self.mins[i] = x
+            if x > self.maxs[i]:
+                self.maxs[i] = x
+
+
+class BucketedWindow:
+    """Aggregates for one time window, kept per bucket instead of per sample."""
+
+    def __init__(self, max_age, metrics=METRICS, buckets=BUCKETS):
+        self.max_age_ns = int(max_age * 1e9)
+        self.width_ns = max(self.max_age_ns // buckets, 1)
+        self.metrics = metrics
+        self.buckets = deque()
+
+    def add(self, seq, timestamp_ns, values):
+        start_ns = timestamp_ns - timestamp_ns % self.width_ns
+        if not self.buckets or start_ns > self.buckets[-1].start_ns:
+            self.buckets.append(Bucket(start_ns, len(self.metrics)))
+        # A late sample is counted in the newest bucket
+        self.buckets[-1].add(timestamp_ns, values)
+
+        # A bucket leaves the window once its newest sample is too old
+        while timestamp_ns - self.buckets[0].last_ns > self.max_age_ns:
+            self.buckets.popleft()
+
+    def snapshot(self):
+        moments = [RunningMoments() for _ in self.metrics]
+        mins = [math.inf] * len(self.metrics)
+        maxs = [-math.inf] * len(self.metrics)
+        for bucket in self.buckets:
+            for i in range(len(self.metrics)):
+                moments[i].merge(bucket.moments[i])
+                mins[i] = min(mins[i], bucket.mins[i])
+                maxs[i] = max(maxs[i], bucket.maxs[i])
+        result = {
+            "count": moments[0].count if moments else 0,
+            "first_ns": self.buckets[0].first_ns if self.buckets else None,
+            "last_ns": self.buckets[-1].last_ns if self.buckets else None,
+        }
+        for name, m, low, high in zip(self.metrics, moments, mins, maxs):
+            result[name] = {
+                "min": low if m.count else 0.0,
+                "max": high if m.count else 0.0,
+                "avg": m.mean,
+                "std": m.std,
+            }
+        return result
+
+
+def make_window(max_samples=None, max_age=None, metrics=METRICS):
+    if max_samples is None and max_age is not None:
+        return BucketedWindow(max_age, metrics)
+    return Window(max_samples, max_age, metrics)
+
+
+class StreamingStats:
+    """Thread-safe set of sliding windows plus per-metric trends, updated per sample."""
+
+    def __init__(self, windows=DEFAULT_WINDOWS, metrics=METRICS, trend_span=TREND_SPAN):
+        self.metrics = metrics
+        self.windows = {
+            name: make_window(max_samples, max_age, metrics)
+            for name, (max_samples, max_age) in windows.items()
+        }
+        self.trends = [EwmaTrend(trend_span) for _ in metrics]
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def update(self, timestamp_ns, *values):
+        with self._lock:
+            self._seq += 1
+            for window in self.windows.values():
+                window.add(self._seq, timestamp_ns, values)
+            for trend, x in zip(self.trends, values):
+                trend.add(x)
+
+    def snapshot(self, window):
+        """Return count, time range and min/max/avg/std/trend per metric for a window."""
+        with self._lock:
+            result = self.windows[window].snapshot()
+            for name, trend in zip(self.metrics, self.trends):
+                result[name]["trend"] = trend.direction
+        return result
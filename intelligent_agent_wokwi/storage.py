@@ -0,0 +1,306 @@
+"""
+Append-only storage backends for sensor readings.
+
+The default backend writes fixed-width binary records to rotating segment
+files. Appends only touch an in-memory batch; a background thread flushes
+batches to the end of the current segment, so the cost of storing a reading
+does not depend on how much history already exists. Excel is an on-demand
+export (see StorageBackend.export_to_excel), not the write path.
+"""
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+from datetime import datetime
+
+
+# Configuration
+DATA_DIR = "data"
+EXCEL_FILE = "sensor_data.xlsx"
+STORAGE_BACKEND = "binary"  # "binary" (append-only segments) or "excel" (legacy)
+SEGMENT_RECORDS = 100000  # Records per segment file before rotating
+FLUSH_INTERVAL = 1.0  # Seconds between background flushes
+FLUSH_BATCH_SIZE = 500  # Flush early once this many records are pending
+
+# Record layout: epoch-ns timestamp (int64) followed by temp, humidity, flow (float32)
+RECORD = struct.Struct("<qfff")
+SEGMENT_PREFIX = "segment_"
+SEGMENT_SUFFIX = ".bin"
+COLUMNS = ["Timestamp", "Temperature", "Humidity", "Water Flow"]
+# Device IDs become directory names, so only these characters are accepted
+DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+log = logging.getLogger("storage")
+
+
+def is_valid_device_id(device_id):
+    """True for IDs that are safe as a file name and an MQTT topic level."""
+    return isinstance(device_id, str) and DEVICE_ID_PATTERN.fullmatch(device_id) is not None
+
+
+def list_segments(directory):
+    """Return the binary segment file paths in `directory` in write order."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_segments(directory):
+    """
+    Yield the (timestamp_ns, temp, humidity, flow) records in `directory`,
+    oldest first. Only reads the files, so it is safe while a writer is
+    appending; a partially written last record is skipped.
+    """
+    for path in list_segments(directory):
+        with open(path, "rb") as f:
+            data = f.read()
+        usable = len(data) - len(data) % RECORD.size
+        yield from RECORD.iter_unpack(data[:usable])
+
+
+def write_excel(readings, path=EXCEL_FILE):
+    """Write (timestamp_ns, temp, humidity, flow) readings to an Excel workbook and return the row count."""
+    import pandas as pd
+
+    rows = [
+        (datetime.fromtimestamp(ts / 1e9).strftime("%Y-%m-%d %H:%M:%S"), temp, humidity, flow)
+        for ts, temp, humidity, flow in readings
+    ]
+    pd.DataFrame(rows, columns=COLUMNS).to_excel(path, index=False)
+    return len(rows)
+
+
+class StorageBackend:
+    """Common interface for sensor reading storage."""
+
+    def append(self, timestamp_ns, temp, humidity, flow):
+        raise NotImplementedError
+
+    def read(self):
+        """Yield (timestamp_ns, temp, humidity, flow) tuples, oldest first."""
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def export_to_excel(self, path=EXCEL_FILE):
+        """Write the full history to an Excel workbook and return the row count."""
+        return write_excel(self.read(), path)
+
+
+class BinaryLogStorage(StorageBackend):
+    """
+    Batched, append-only log of fixed-width records split into segment files.
+
+    With background=False no flusher thread is started; the owner calls
+    flush() periodically and full batches are flushed by append() itself.
+    """
+
+    def __init__(self, directory=DATA_DIR, segment_records=SEGMENT_RECORDS,
+                 flush_interval=FLUSH_INTERVAL, flush_batch_size=FLUSH_BATCH_SIZE, background=True):
+        self.directory = directory
+        self.segment_records = segment_records
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._open_last_segment()
+
+        self._flusher = None
+        if background:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def segments(self):
+        """Return the segment file paths in write order."""
+        return list_segments(self.directory)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}")
+
+    def _open_last_segment(self):
+        segments = self.segments()
+        if segments:
+            path = segments[-1]
+            self._segment_number = int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            # Drop a partially written trailing record left by a crash
+            size = os.path.getsize(path)
+            whole = size - size % RECORD.size
+            if whole != size:
+                with open(path, "r+b") as f:
+                    f.truncate(whole)
+            self._segment_count = whole // RECORD.size
+        else:
+            self._segment_number = 1
+            path = self._segment_path(self._segment_number)
+            self._segment_count = 0
+        self._file = open(path, "ab")
+
+    def _rotate(self):
+        self._file.close()
+        self._segment_number += 1
+        self._segment_count = 0
+        self._file = open(self._segment_path(self._segment_number), "ab")
+
+    def append(self, timestamp_ns, temp, humidity, flow):
+        record = RECORD.pack(timestamp_ns, temp, humidity, flow)
+        with self._lock:
+            self._pending.append(record)
+            pending = len(self._pending)
+        if pending >= self.flush_batch_size:
+            if self._flusher:
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            while batch:
+                room = self.segment_records - self._segment_count
+                if room <= 0:
+                    self._rotate()
+                    continue
+                chunk, batch = batch[:room], batch[room:]
+                self._file.write(b"".join(chunk))
+                self._segment_count += len(chunk)
+            self._file.flush()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("Error flushing storage: %s", e)
+
+    def last_timestamp(self):
+        """Timestamp of the newest reading on disk or pending, or None if there are none."""
+        with self._lock:
+            if self._pending:
+                return RECORD.unpack(self._pending[-1])[0]
+        for path in reversed(self.segments()):
+            size = os.path.getsize(path)
+            if size >= RECORD.size:
+                with open(path, "rb") as f:
+                    f.seek(size - size % RECORD.size - RECORD.size)
+                    return RECORD.unpack(f.read(RECORD.size))[0]
+        return None
+
+    def read(self):
+        if not self._closed:
+            self.flush()
+        yield from read_segments(self.directory)
+
+    def close(self):
+        self._closed = True
+        if self._flusher:
+            self._wakeup.set()
+            self._flusher.join()
+        self.flush()
+        self._file.close()
+
+
+class ExcelStorage(StorageBackend):
+    """Legacy backend that rewrites the whole workbook on every append (O(N) per reading)."""
+
+    def __init__(self, path=EXCEL_FILE):
+        self.path = path
+
+    def append(self, timestamp_ns, temp, humidity, flow):
+        import pandas as pd
+
+        timestamp = datetime.fromtimestamp(timestamp_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+        df_new = pd.DataFrame([(timestamp, temp, humidity, flow)], columns=COLUMNS)
+        if os.path.exists(self.path):
+            df_existing = pd.read_excel(self.path)
+            df_new = pd.concat([df_existing, df_new], ignore_index=True)
+        # Write a copy and rename it into place, so a crash mid-write cannot truncate the workbook
+        temp_path = f"{self.path}.tmp{os.path.splitext(self.path)[1]}"
+        df_new.to_excel(temp_path, index=False)
+        os.replace(temp_path, self.path)
+
+    def read(self):
+        import pandas as pd
+
+        if not os.path.exists(self.path):
+            return
+        df = pd.read_excel(self.path)
+        for row in df.itertuples(index=False):
+            ts = int(datetime.strptime(str(row[0]), "%Y-%m-%d %H:%M:%S").timestamp() * 1e9)
+            yield ts, row[1], row[2], row[3]
+
+
+def create_storage(kind=STORAGE_BACKEND, path=None, device_id=None, **options):
+    """
+    Create a storage backend by name.
+    With a device_id, each device gets its own directory (binary) or workbook (excel).
+    """
+    if device_id is not None and not is_valid_device_id(device_id):
+        raise ValueError(f"Invalid device ID: {device_id!r}")
+    if kind == "binary":
+        path = path or DATA_DIR
+        if device_id is not None:
+            path = os.path.join(path, device_id)
+        return BinaryLogStorage(path, **options)
+    if kind == "excel":
+        path = path or EXCEL_FILE
+        if device_id is not None:
+            root, ext = os.path.splitext(path)
+            path = f"{root}_{device_id}{ext}"
+        return ExcelStorage(path)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def list_devices(path=DATA_DIR):
+    """Return the IDs of devices that have binary storage under `path`."""
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+
+def export_device(device_id, output, path=DATA_DIR):
+    """
+    Export a device's binary history to Excel and return the row count.
+    Reads the segments without opening them for writing, so a running
+    backend is not disturbed and an unknown device raises ValueError
+    instead of getting an empty directory.
+    """
+    if device_id not in list_devices(path):
+        raise ValueError(f"Unknown device: {device_id}")
+    return write_excel(read_segments(os.path.join(path, device_id)), output)
+
+
+if __name__ == "__main__":
+    # Usage: python storage.py export <device_id> [output.xlsx]
+    if len(sys.argv) < 3 or sys.argv[1] != "export":
+        print("Usage: python storage.py export <device_id> [output.xlsx]")
+        print(f"Devices: {', '.join(list_devices()) or 'none'}")
+        sys.exit(1)
+
+    device_id = sys.argv[2]
+    output = sys.argv[3] if len(sys.argv) > 3 else f"sensor_data_{device_id}.xlsx"
+    try:
+        count = export_device(device_id, output)
+    except ValueError as e:
+        print(e)
+        print(f"Devices: {', '.join(list_devices()) or 'none'}")
+        sys.exit(1)
+    print(f"Exported {count} readings from {device_id} to {output}")
@@ -0,0 +1,119 @@
+"""
+Sensor payload encodings shared by the backend and the agent.
+
+Devices publish JSON on 'wokwi/sensors/<device_id>' or, in binary mode, a
+fixed 17-byte record on 'wokwi/sensors/<device_id>/bin'. Both formats
+decode to the same dict, so consumers can accept either one.
+
+In batch mode a single message carries several samples: JSON as
+{"samples": [[age_ms, temp, humidity, flow], ...]} (age_ms is how long
+before publishing the sample was taken), binary as concatenated records.
+
+Binary record (little-endian):
+    version (uint8), device number (uint16), sequence (uint32),
+    device time in milliseconds modulo 2**32 (uint32), temperature * 100
+    (int16), humidity * 100 (uint16), flow * 10 (int16)
+
+The device time only orders the samples of a batch: each sample's age is
+its distance to the newest record, exact to the millisecond. Version 1
+records (device time in whole seconds) are still accepted.
+"""
+import json
+import struct
+
+
+# Configuration
+VERSION = 2
+VERSIONS = {1: 1000, 2: 1}  # Record version -> milliseconds per device time unit
+BINARY_SUFFIX = "/bin"
+RECORD = struct.Struct("<BHIIhHh")
+TEMP_SCALE = 100
+HUMIDITY_SCALE = 100
+FLOW_SCALE = 10
+
+
+def is_binary_topic(topic):
+    return topic.endswith(BINARY_SUFFIX)
+
+
+def device_from_topic(topic):
+    """Return the device ID from 'wokwi/sensors/<device_id>' or 'wokwi/sensors/<device_id>/bin'."""
+    if is_binary_topic(topic):
+        topic = topic[:-len(BINARY_SUFFIX)]
+    return topic.rsplit("/", 1)[-1]
+
+
+def encode_binary(device_num, seq, timestamp_ms, temp, humidity, flow):
+    return RECORD.pack(
+        VERSION,
+        device_num,
+        seq & 0xFFFFFFFF,
+        int(timestamp_ms) & 0xFFFFFFFF,
+        round(temp * TEMP_SCALE),
+        round(humidity * HUMIDITY_SCALE),
+        round(flow * FLOW_SCALE),
+    )
+
+
+def decode_binary(payload):
+    if len(payload) != RECORD.size or payload[0] not in VERSIONS:
+        raise ValueError("not a binary sensor record")
+    version, device_num, seq, timestamp, temp, humidity, flow = RECORD.unpack(payload)
+    return {
+        "device": device_num,
+        "seq": seq,
+        "timestamp_ms": timestamp * VERSIONS[version],
+        "temp": temp / TEMP_SCALE,
+        "humidity": humidity / HUMIDITY_SCALE,
+        "flow": flow / FLOW_SCALE,
+    }
+
+
+def _is_binary(payload):
+    # JSON always starts with '{' or whitespace, never with the version byte
+    return isinstance(payload, (bytes, bytearray, memoryview)) and len(payload) and payload[0] in VERSIONS
+
+
+def decode(payload):
+    """
+    Decode a JSON or binary sensor payload (str or bytes) into a dict.
+    Raises ValueError if the payload is neither.
+    """
+    if _is_binary(payload):
+        return decode_binary(bytes(payload))
+    return json.loads(payload)
+
+
+def decode_samples(payload):
+    """
+    Decode a single or batched payload into a list of reading dicts, oldest first.
+    Every dict has an 'age_ms' key (0 for single readings).
+    Raises ValueError if the payload is not a sensor reading.
+    """
+    if _is_binary(payload):
+        payload = bytes(payload)
+        if len(payload) % RECORD.size:
+            raise ValueError("truncated binary batch")
+        samples = [
+            decode_binary(payload[offset:offset + RECORD.size])
+            for offset in range(0, len(payload), RECORD.size)
+        ]
+        newest = samples[-1]["timestamp_ms"]
+        for sample in samples:
+            # Modulo 2**32: the device time wraps every ~49.7 days
+            sample["age_ms"] = (newest - sample["timestamp_ms"]) & 0xFFFFFFFF
+        return samples
+
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        raise ValueError("payload is not a JSON object")
+    if "samples" not in data:
+        data["age_ms"] = 0
+        return [data]
+    try:
+        return [
+            {"age_ms": age_ms, "temp": temp, "humidity": humidity, "flow": flow}
+            for age_ms, temp, humidity, flow in data["samples"]
+        ]
+    except (TypeError, ValueError):
+        raise ValueError("malformed sample batch")
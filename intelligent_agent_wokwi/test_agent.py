@@ -1,8 +1,23 @@
+import os
+import select
+import threading
+import time
 import unittest
 from unittest.mock import MagicMock, patch
 import json
+import telemetry
 from agent import IntelligentAgent
 
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def reading(temp, flow):
+    return json.dumps({"temp": temp, "humidity": 50.0, "flow": flow})
+
 class TestIntelligentAgent(unittest.TestCase):
     def setUp(self):
         self.agent = IntelligentAgent('COM_MOCK', 115200)
@@ -32,10 +47,111 @@ class TestIntelligentAgent(unittest.TestCase):
         self.assertIn("ACT1:ON", commands)
         self.assertIn("ACT2:ON", commands)
 
+    def test_process_binary_record(self):
+        data = telemetry.encode_binary(1, 0, 0, 35.0, 50.0, 80.0)
+        commands = self.agent.process_data(data)
+        self.assertIn("ACT1:ON", commands)
+        self.assertIn("ACT2:ON", commands)
+
+    def test_only_emits_changes(self):
+        clock = FakeClock()
+        agent = IntelligentAgent('COM_MOCK', 115200, min_dwell=0, clock=clock)
+        self.assertEqual(agent.process_data(reading(25.0, 20.0)), ["ACT1:OFF", "ACT2:OFF"])
+        clock.now += 1
+        self.assertEqual(agent.process_data(reading(26.0, 21.0)), [])
+        clock.now += 1
+        self.assertEqual(agent.process_data(reading(35.0, 21.0)), ["ACT1:ON"])
+
+    def test_hysteresis(self):
+        clock = FakeClock()
+        agent = IntelligentAgent('COM_MOCK', 115200, min_dwell=0, clock=clock)
+        agent.process_data(reading(31.0, 20.0))
+        # Just below the threshold but within the hysteresis band: stay on
+        clock.now += 1
+        self.assertEqual(agent.process_data(reading(29.5, 20.0)), [])
+        clock.now += 1
+        self.assertEqual(agent.process_data(reading(28.5, 20.0)), ["ACT1:OFF"])
+
+    def test_min_dwell(self):
+        clock = FakeClock()
+        agent = IntelligentAgent('COM_MOCK', 115200, min_dwell=5.0, clock=clock)
+        agent.process_data(reading(35.0, 20.0))
+        clock.now += 2
+        self.assertEqual(agent.process_data(reading(25.0, 20.0)), [])
+        clock.now += 3
+        self.assertEqual(agent.process_data(reading(25.0, 20.0)), ["ACT1:OFF"])
+
+    def test_periodic_resync(self):
+        clock = FakeClock()
+        agent = IntelligentAgent('COM_MOCK', 115200, resync_interval=60.0, clock=clock)
+        agent.process_data(reading(35.0, 20.0))
+        clock.now += 30
+        self.assertEqual(agent.process_data(reading(35.0, 20.0)), [])
+        clock.now += 30
+        self.assertEqual(agent.process_data(reading(35.0, 20.0)), ["ACT1:ON", "ACT2:OFF"])
+
+    def test_rising_temperature_switches_on_early(self):
+        clock = FakeClock()
+        agent = IntelligentAgent('COM_MOCK', 115200, min_dwell=0, clock=clock)
+        for i in range(60):
+            clock.now += 1
+            agent.process_data(reading(24.0 + (i % 3) * 0.1, 20.0))
+        # Warming steadily: Actuator 1 turns on well before the 30 °C threshold
+        temp = 24.0
+        while temp < 30.0:
+            clock.now += 1
+            temp += 0.1
+            if "ACT1:ON" in agent.process_data(reading(temp, 20.0)):
+                break
+        self.assertLess(temp, 28.0)
+        self.assertTrue(agent.detectors.rising()["temp"])
+
     def test_invalid_json(self):
         data = "Not JSON"
         commands = self.agent.process_data(data)
         self.assertEqual(commands, [])
 
+    def test_empty_batch(self):
+        with self.assertNoLogs("agent", level="ERROR"):
+            self.assertEqual(self.agent.process_data('{"samples": []}'), [])
+
+    def test_handle_lines_coalesces_writes(self):
+        self.agent = IntelligentAgent('COM_MOCK', 115200, min_dwell=0)
+        self.agent.ser = MagicMock()
+        lines = [
+            json.dumps({"temp": 35.0, "flow": 20.0}).encode(),
+            b"",
+            json.dumps({"temp": 25.0, "flow": 80.0}).encode(),
+        ]
+        sent = self.agent.handle_lines(lines)
+        self.assertEqual(sent, ["ACT1:OFF", "ACT2:ON"])
+        self.agent.ser.write.assert_called_once_with(b"ACT1:OFF\nACT2:ON\n")
+
+    @unittest.skipUnless(hasattr(os, "openpty"), "requires a pseudo-terminal")
+    def test_run_against_pty(self):
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        agent = IntelligentAgent(os.ttyname(slave), 115200)
+        thread = threading.Thread(target=agent.run, daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while agent.ser is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        readings = [{"temp": 35.0, "flow": 80.0}]
+        os.write(master, "".join(json.dumps(r) + "\n" for r in readings).encode())
+
+        received = b""
+        while b"ACT2:ON\n" not in received and time.monotonic() < deadline:
+            if select.select([master], [], [], 0.1)[0]:
+                received += os.read(master, 1024)
+        agent.stop()
+        thread.join(2)
+
+        self.assertIn(b"ACT1:ON\n", received)
+        self.assertIn(b"ACT2:ON\n", received)
+        self.assertFalse(thread.is_alive())
+
 if __name__ == '__main__':
     unittest.main()
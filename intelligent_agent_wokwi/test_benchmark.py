@@ -0,0 +1,38 @@
+import unittest
+from benchmark import FakeBroker, FakeClient, measure_startup, run_benchmark, topic_matches
+
+class TestBenchmark(unittest.TestCase):
+    def test_topic_matches(self):
+        self.assertTrue(topic_matches("wokwi/sensors/+", "wokwi/sensors/dev1"))
+        self.assertFalse(topic_matches("wokwi/sensors/+", "wokwi/sensors/dev1/bin"))
+        self.assertTrue(topic_matches("wokwi/sensors/+/bin", "wokwi/sensors/dev1/bin"))
+        self.assertTrue(topic_matches("wokwi/#", "wokwi/actuators/dev1"))
+        self.assertFalse(topic_matches("wokwi/actuators/dev1", "wokwi/actuators"))
+
+    def test_fake_client_delivers_to_subscribers(self):
+        broker = FakeBroker()
+        received = []
+        client = FakeClient(broker)
+        client.on_message = lambda c, userdata, msg: received.append((msg.topic, msg.payload))
+        client.subscribe("wokwi/sensors/+")
+        client.loop_start()
+        FakeClient(broker).publish("wokwi/sensors/a", "x")
+        FakeClient(broker).publish("wokwi/other/a", "y")
+        client.loop_stop()
+        self.assertEqual(received, [("wokwi/sensors/a", b"x")])
+
+    def test_small_run_processes_every_reading(self):
+        results = run_benchmark(devices=2, rate=20, duration=0.5, batch=3, startup=False)
+        self.assertEqual(results["ingest"]["processed"], results["load"]["readings"])
+        self.assertEqual(results["ingest"]["dropped"], 0)
+        self.assertGreater(results["agent"]["commands"], 0)
+        self.assertIn("p99", results["agent"]["latency_ms"])
+
+    def test_cold_start_skips_heavy_imports(self):
+        startup = measure_startup()
+        self.assertGreater(startup["first_ingest_ms"], startup["import_ms"])
+        # The MQTT client, pandas and numpy are not needed to import and start ingesting
+        self.assertEqual(startup["heavy_modules"], [])
+
+if __name__ == '__main__':
+    unittest.main()
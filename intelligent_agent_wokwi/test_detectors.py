@@ -0,0 +1,80 @@
+import random
+import unittest
+import numpy as np
+from detectors import DetectorSet, MetricDetector, RisingDetector, detector_for
+
+class TestMetricDetector(unittest.TestCase):
+    def test_quiet_on_noise(self):
+        rng = random.Random(1)
+        detector = detector_for("temperature")
+        events = []
+        for i in range(2000):
+            events.extend(detector.update(24.0 + rng.gauss(0, 0.2), i))
+        self.assertNotIn("drift_up", events)
+        self.assertNotIn("rate_up", events)
+        self.assertEqual(detector.state, "Stable")
+
+    def test_drift_detected_early(self):
+        rng = random.Random(2)
+        detector = detector_for("temperature")
+        for i in range(300):
+            detector.update(24.0 + rng.gauss(0, 0.2), i)
+        # Warming by 0.02 °C per second: the drift shows long before 30 °C
+        for i in range(300):
+            x = 24.0 + i * 0.02 + rng.gauss(0, 0.2)
+            if "drift_up" in detector.update(x, 300 + i):
+                break
+        self.assertLess(x, 26.0)
+        self.assertTrue(detector.rising)
+
+    def test_jump_and_spike(self):
+        rng = random.Random(3)
+        detector = detector_for("flow")
+        for i in range(200):
+            detector.update(20.0 + rng.gauss(0, 1), i * 0.25)
+        events = detector.update(45.0, 50.0)
+        self.assertIn("rate_up", events)
+        self.assertIn("spike_up", events)
+        self.assertTrue(detector.rising)
+
+    def test_warmup(self):
+        detector = MetricDetector(warmup=10, max_rate=1.0)
+        self.assertEqual(detector.update(0.0, 0), [])
+        self.assertEqual(detector.update(100.0, 1), [])
+        self.assertEqual(detector.state, "Learning")
+
+class TestRisingDetector(unittest.TestCase):
+    def test_matches_metric_detector(self):
+        rng = np.random.default_rng(4)
+        n = 2000
+        timestamps = np.cumsum(rng.choice([0.0, 0.5, 1.0], (3, n)), axis=1)
+        # Noise, a slow warming from the middle and a few jumps
+        values = (20 + rng.normal(0, 0.3, (3, n)) + np.maximum(0, np.arange(n) - 1000) * 0.01
+                  + np.cumsum((rng.random((3, n)) < 0.002) * 10, axis=1))
+        detector = RisingDetector((3,), "flow")
+        rising = np.concatenate([detector.update(timestamps[:, :700], values[:, :700]),
+                                 detector.update(timestamps[:, 700:], values[:, 700:])], axis=1)
+        for row in range(3):
+            expected = detector_for("flow")
+            flags = []
+            for t, x in zip(timestamps[row].tolist(), values[row].tolist()):
+                expected.update(x, t)
+                flags.append(expected.rising)
+            self.assertEqual(rising[row].tolist(), flags)
+            self.assertTrue(any(flags))
+
+class TestDetectorSet(unittest.TestCase):
+    def test_events_and_snapshot(self):
+        detectors = DetectorSet(["temperature", "flow"], warmup=5)
+        for i in range(50):
+            self.assertEqual(detectors.update(i, (24.0, 20.0 + i % 2 * 0.1)), [])
+        self.assertEqual(detectors.update(50, (24.0, 60.0)), [("flow", "spike_up", 60.0), ("flow", "rate_up", 60.0)])
+        snapshot = detectors.snapshot()
+        self.assertEqual(snapshot["flow"]["state"], "Rising")
+        self.assertEqual(snapshot["flow"]["events"], {"spike_up": 1, "rate_up": 1})
+        self.assertEqual(snapshot["temperature"]["state"], "Stable")
+        self.assertEqual(snapshot["recent"][-1], (50, "flow", "rate_up", 60.0))
+        self.assertEqual(detectors.rising(), {"temperature": False, "flow": True})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import storage
+from devices import DeviceRegistry
+
+class TestDeviceRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patcher = patch.object(storage, "DATA_DIR", self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_shards_are_isolated(self):
+        registry = DeviceRegistry(buffer_retention=10)
+        with patch("storage.create_storage", wraps=storage.create_storage) as create:
+            a = registry.get("a")
+            b = registry.get("b")
+            self.assertIs(registry.get("a"), a)
+            self.assertEqual(create.call_count, 2)
+
+        for i in range(5):
+            a.add(i, 20.0 + i, 50.0, 10.0)
+        b.add(0, 30.0, 40.0, 60.0)
+        registry.close()
+
+        self.assertEqual(a.counter, 5)
+        self.assertEqual(len(b.buffer), 1)
+        self.assertEqual(a.stats.snapshot("last_30")["temperature"]["max"], 24.0)
+        self.assertEqual([row[0] for row in a.storage.read()], list(range(5)))
+        self.assertEqual(storage.list_devices(self.directory), ["a", "b"])
+
+if __name__ == '__main__':
+    unittest.main()
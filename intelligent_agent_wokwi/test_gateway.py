@@ -0,0 +1,127 @@
+import http.client
+import json
+import os
+import socket
+import struct
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+import gateway as gateway_module
+from gateway import Gateway, ws_accept, ws_frame
+from hub import HubClient
+
+def read_frame(sock):
+    head = sock.recv(2, socket.MSG_WAITALL)
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", sock.recv(2, socket.MSG_WAITALL))[0]
+    return head[0] & 0x0F, sock.recv(length, socket.MSG_WAITALL) if length else b""
+
+class TestGateway(unittest.TestCase):
+    def setUp(self):
+        self.send_command = MagicMock()
+        self.gateway = Gateway(self.send_command, host="127.0.0.1", port=0).start()
+        self.addCleanup(self.gateway.stop)
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.gateway.port, timeout=5)
+        self.addCleanup(connection.close)
+        connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        data = response.read()
+        return response, json.loads(data) if data else None
+
+    def test_actuator_endpoint(self):
+        response, body = self.request("POST", "/api/actuator", {"command": "ACT1:ON"})
+        self.assertEqual((response.status, body), (200, {"status": "ok", "command": "ACT1:ON"}))
+        self.assertEqual(response.getheader("Access-Control-Allow-Origin"), "*")
+        self.send_command.assert_called_once_with("sayf_project", "ACT1:ON")
+
+        response, body = self.request("POST", "/actuator", {"command": "ACT2:OFF", "device": "dev2"})
+        self.assertEqual(response.status, 200)
+        self.send_command.assert_called_with("dev2", "ACT2:OFF")
+
+        response, body = self.request("POST", "/api/actuator", {"cmd": "ACT1:ON"})
+        self.assertEqual((response.status, body), (400, {"error": "Invalid command"}))
+        # Newlines would smuggle extra commands into the batched MQTT message
+        for command in ("ACT1:ON\nACT2:ON", "ACT1:ON\n", "act1:on", "ACT1:DIM", 1):
+            response, body = self.request("POST", "/api/actuator", {"command": command})
+            self.assertEqual((response.status, body), (400, {"error": "Invalid command"}))
+        response, body = self.request("POST", "/api/actuator", {"command": "ACT1:ON", "device": "+"})
+        self.assertEqual((response.status, body), (400, {"error": "Invalid device"}))
+        # CORS preflight of the dashboard's JSON POST
+        response, body = self.request("OPTIONS", "/api/actuator")
+        self.assertEqual(response.status, 204)
+        self.assertIn("POST", response.getheader("Access-Control-Allow-Methods"))
+        self.assertEqual(self.send_command.call_count, 2)
+
+    def test_feed_rejects_invalid_device(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.gateway.port, timeout=5)
+        self.addCleanup(connection.close)
+        connection.request("GET", "/ws/sensors?device=a/%23", headers={
+            "Upgrade": "websocket", "Connection": "Upgrade", "Sec-WebSocket-Key": "dGhlIHNhbXBsZSBub25jZQ=="})
+        response = connection.getresponse()
+        self.assertEqual((response.status, json.loads(response.read())), (400, {"error": "Invalid device"}))
+
+    def test_websocket_feed(self):
+        _, body = self.request("GET", "/api/sensors")
+        self.assertEqual(body, {"error": "No data available"})
+
+        sock = socket.create_connection(("127.0.0.1", self.gateway.port), timeout=5)
+        self.addCleanup(sock.close)
+        key = "dGhlIHNhbXBsZSBub25jZQ=="
+        sock.sendall(("GET /ws/sensors HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        head = b""
+        while not head.endswith(b"\r\n\r\n"):
+            head += sock.recv(1)
+        self.assertTrue(head.startswith(b"HTTP/1.1 101"))
+        self.assertIn(b"Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=", head)
+        self.assertEqual(ws_accept(key), "s3pPLMBiTxaQ9kYGzzhZRbK+xOo=")
+
+        deadline = time.monotonic() + 2
+        while not self.gateway._clients and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.gateway.publish("other", [(0, 1.0, 2.0, 3.0)])
+        self.gateway.publish("sayf_project", [(0, 24.5, 50.0, 10.0), (1_000_000_000, 25.0, 51.0, 11.0)])
+        readings = [json.loads(read_frame(sock)[1]) for _ in range(2)]
+        self.assertEqual(readings[0], {"device": "sayf_project", "temp": 24.5, "humidity": 50.0, "flow": 10.0,
+                                       "timestamp": "1970-01-01T00:00:00Z"})
+        self.assertEqual(readings[1]["temp"], 25.0)
+
+        # Masked ping from the client is answered with a pong
+        mask = os.urandom(4)
+        sock.sendall(bytes([0x89, 0x80 | 2]) + mask + bytes(b ^ mask[i] for i, b in enumerate(b"hi")))
+        self.assertEqual(read_frame(sock), (0xA, b"hi"))
+
+        _, body = self.request("GET", "/api/sensors")
+        self.assertEqual(body["temp"], 25.0)
+        # Stopping closes the feed with a close frame
+        self.gateway.stop()
+        self.assertEqual(read_frame(sock)[0], 0x8)
+
+class TestPublish(unittest.TestCase):
+    def setUp(self):
+        self.gateway = Gateway(MagicMock(), host="127.0.0.1", port=0, queue_size=2).start()
+        self.addCleanup(self.gateway.stop)
+
+    def test_only_latest_reading_is_encoded_without_clients(self):
+        readings = [(i * 1_000_000_000, 20.0 + i, 50.0, 10.0) for i in range(100)]
+        with patch.object(gateway_module, "reading_json", wraps=gateway_module.reading_json) as encode:
+            self.gateway.publish("sayf_project", readings)
+        self.assertEqual(encode.call_count, 1)
+        self.assertEqual(json.loads(self.gateway._latest["sayf_project"])["temp"], 119.0)
+
+    def test_slow_client_drops_oldest(self):
+        client = HubClient("a", queue_size=2)
+        self.gateway._clients[client] = (MagicMock(), None)
+        self.gateway.publish("a", [(i, float(i), 0.0, 0.0) for i in range(3)])
+        frames = client.next_frames(0)
+        self.assertEqual([json.loads(frame[2:])["temp"] for frame in frames], [1.0, 2.0])
+        self.assertEqual(client.dropped, 1)
+        self.gateway._clients.clear()
+        self.assertEqual(ws_frame(b"x" * 200)[:4], bytes([0x81, 126, 0, 200]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import history
+import storage
+
+class TestHistoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = storage.BinaryLogStorage(self.directory, segment_records=100, background=False)
+        self.addCleanup(self.store.close)
+
+    def write(self, start, count):
+        for i in range(start, start + count):
+            self.store.append(i * 1000, float(i), 50.0 + i % 7, 10.0)
+        self.store.flush()
+
+    def test_range_query_matches_full_scan(self):
+        self.write(0, 250)
+        index = history.HistoryIndex(self.directory, block_records=16)
+        rows = index.query(37_000, 180_000)
+        expected = [row for row in self.store.read() if 37_000 <= row[0] <= 180_000]
+        self.assertEqual(rows, expected)
+        # Full blocks (and the last block of sealed segments) are persisted
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "segment_000001.idx")))
+
+    def test_limited_query_reads_only_needed_blocks(self):
+        self.write(0, 250)
+        index = history.HistoryIndex(self.directory, block_records=16)
+        index.query(0, 10**9)  # Build the index
+        with patch.object(history.Segment, "read_block", autospec=True,
+                          side_effect=history.Segment.read_block) as read_block:
+            rows = index.query(37_000, 10**9, limit=20)
+        self.assertEqual(rows, index.query(37_000, 10**9)[:20])
+        # Rows 37..56 lie in blocks 32-47 and 48-63
+        self.assertEqual(read_block.call_count, 2)
+
+    def test_index_is_extended_incrementally(self):
+        self.write(0, 40)
+        index = history.HistoryIndex(self.directory, block_records=16)
+        self.assertEqual(len(index.query(0, 10**9)), 40)
+        self.write(40, 30)
+        self.assertEqual(len(index.query(0, 10**9)), 70)
+
+        # A fresh index reuses the persisted blocks and only reads the tail
+        reopened = history.HistoryIndex(self.directory, block_records=16)
+        with patch.object(history.Block, "summarize", wraps=history.Block.summarize) as summarize:
+            self.assertEqual(len(reopened.query(0, 10**9)), 70)
+            self.assertEqual(summarize.call_count, 1)
+
+    def test_downsample_uses_block_summaries(self):
+        self.write(0, 256)
+        index = history.HistoryIndex(self.directory, block_records=4)
+        index.refresh()
+        with patch.object(history.Segment, "read_block", wraps=history.Segment.read_block, autospec=True) as read:
+            buckets = index.downsample("temperature", 0, 255_999, 4)
+            # 64-sample buckets are made of whole 4-record blocks: nothing is read
+            self.assertEqual(read.call_count, 0)
+        self.assertEqual([b[4] for b in buckets], [64, 64, 64, 64])
+        self.assertEqual(buckets[0][:4], (0, 0.0, 63.0, 31.5))
+        self.assertEqual(buckets[3][0], 192_000)
+
+    def test_downsample_partial_blocks(self):
+        self.write(0, 100)
+        index = history.HistoryIndex(self.directory, block_records=16)
+        buckets = index.downsample("humidity", 10_000, 29_999, 2)
+        values = [50.0 + i % 7 for i in range(10, 30)]
+        self.assertEqual(buckets[0], (10_000, min(values[:10]), max(values[:10]), sum(values[:10]) / 10, 10))
+        self.assertEqual(buckets[1][4], 10)
+
+    def test_query_history(self):
+        self.write(0, 20)
+        with patch.object(storage, "DATA_DIR", os.path.dirname(self.directory)):
+            device_id = os.path.basename(self.directory)
+            self.assertEqual(history.query_history(device_id, "flow", 5_000, 6_000), [(5_000, 10.0), (6_000, 10.0)])
+            self.assertEqual(len(history.query_history(device_id, "flow", 0, 19_999, points=5)), 5)
+            with self.assertRaises(ValueError):
+                history.query_history(device_id, "pressure", 0, 1)
+
+if __name__ == '__main__':
+    unittest.main()
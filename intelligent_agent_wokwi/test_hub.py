@@ -0,0 +1,74 @@
+import http.client
+import threading
+import unittest
+from hub import Hub, HubClient, HubRequestHandler
+import hub as hub_module
+
+class TestHub(unittest.TestCase):
+    def test_snapshot_then_live_readings(self):
+        hub = Hub(snapshot_size=2)
+        hub.publish("a", [(1_000_000_000 * i, 20.0 + i, 50.0, 10.0) for i in range(3)])
+        hub.publish("b", [(0, 30.0, 40.0, 5.0)])
+
+        client, frames = hub.connect(device="a")
+        self.assertEqual(len(frames), 1)
+        self.assertIn(b'"readings":[{"device":"a","timestamp":1.0', frames[0])
+
+        hub.publish("b", [(5, 31.0, 40.0, 5.0)])
+        hub.publish("a", [(4_000_000_000, 24.0, 50.0, 10.0)])
+        frames = client.next_frames(0)
+        self.assertEqual(len(frames), 1)
+        self.assertTrue(frames[0].startswith(b"event: reading\ndata: {\"device\":\"a\""))
+        self.assertEqual(client.next_frames(0), [])
+
+        hub.disconnect(client)
+        self.assertIsNone(client.next_frames(1))
+        self.assertEqual(hub.stats()["clients"], 0)
+
+    def test_rate_limited_client_keeps_latest_per_device(self):
+        client = HubClient(rate=0.5)
+        client.push("a", b"1")
+        self.assertEqual(client.next_frames(0), [b"1"])
+        client.push("a", b"2")
+        client.push("a", b"3")
+        client.push("b", b"4")
+        # Next release is two seconds away
+        self.assertEqual(client.next_frames(0.05), [])
+        client._next_send = 0
+        self.assertEqual(client.next_frames(0), [b"3", b"4"])
+        self.assertEqual(client.dropped, 1)
+
+    def test_slow_client_drops_oldest(self):
+        client = HubClient(queue_size=2)
+        for frame in (b"1", b"2", b"3"):
+            client.push("a", frame)
+        self.assertEqual(client.next_frames(0), [b"2", b"3"])
+        self.assertEqual(client.dropped, 1)
+
+    def test_event_stream(self):
+        hub = Hub()
+        hub.publish("a", [(0, 20.0, 50.0, 10.0)])
+        handler = type("Handler", (HubRequestHandler,), {"hub": hub, "log_message": lambda *args: None})
+        httpd = hub_module.http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        self.addCleanup(hub.close)
+
+        connection = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1], timeout=5)
+        self.addCleanup(connection.close)
+        connection.request("GET", "/events")
+        response = connection.getresponse()
+        self.assertEqual(response.getheader("Content-Type"), "text/event-stream")
+        self.assertEqual(response.readline(), b"retry: 3000\n")
+        response.readline()
+        self.assertEqual(response.readline(), b"event: snapshot\n")
+        response.readline()
+        response.readline()
+
+        hub.publish("a", [(1_000_000_000, 21.0, 50.0, 10.0)])
+        self.assertEqual(response.readline(), b"event: reading\n")
+        self.assertIn(b'"temp":21.0', response.readline())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import logging
+import unittest
+from logs import RateLimitFilter
+
+def record(msg, name="test"):
+    return logging.LogRecord(name, logging.WARNING, __file__, 1, msg, ("x",), None)
+
+class TestRateLimitFilter(unittest.TestCase):
+    def test_limits_each_template_per_interval(self):
+        now = [0.0]
+        limiter = RateLimitFilter(interval=10, burst=2, clock=lambda: now[0])
+        passed = [limiter.filter(record("Invalid payload from %s")) for _ in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        # Other templates have their own budget
+        self.assertTrue(limiter.filter(record("Error flushing %s")))
+
+        now[0] = 10.0
+        next_record = record("Invalid payload from %s")
+        self.assertTrue(limiter.filter(next_record))
+        self.assertIn("3 similar message(s) suppressed", next_record.getMessage())
+        self.assertEqual(limiter.suppressed, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import unittest
+import urllib.request
+import metrics
+from metrics import Registry
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_and_scrape_function(self):
+        readings = self.registry.counter("readings_total", "Readings", ["device"])
+        readings.inc(3, "a")
+        readings.inc(2, "a")
+        readings.inc(1, "b")
+        self.registry.gauge("depth", "Queue depth", fn=lambda: 7)
+        text = self.registry.prometheus()
+        self.assertIn('readings_total{device="a"} 5', text)
+        self.assertIn('readings_total{device="b"} 1', text)
+        self.assertIn("# TYPE depth gauge\ndepth 7", text)
+        # Registering again returns the same metric
+        self.assertIs(self.registry.counter("readings_total", "Readings", ["device"]), readings)
+
+    def test_sampled_histogram_is_weighted(self):
+        histogram = self.registry.histogram("decode_seconds", "Decode time", sample_every=4)
+        timed = 0
+        for _ in range(100):
+            if histogram.sampled():
+                histogram.observe(0.0002)
+                timed += 1
+        self.assertEqual(timed, 25)
+        summary = self.registry.snapshot()["decode_seconds"]["series"][0]["value"]
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["sum"], 0.02)
+        self.assertEqual(summary["p50"], 0.00025)
+        text = self.registry.prometheus()
+        self.assertIn('decode_seconds_bucket{le="0.0001"} 0', text)
+        self.assertIn('decode_seconds_bucket{le="0.00025"} 100', text)
+        self.assertIn('decode_seconds_bucket{le="+Inf"} 100', text)
+        self.assertIn("decode_seconds_count 100", text)
+
+    def test_meter_rate_over_window(self):
+        now = [100.0]
+        meter = metrics.Meter("rate", "Rate", ["device"], window=10, clock=lambda: now[0])
+        for second in range(20):
+            now[0] = 100.0 + second
+            meter.mark(5, "a")
+        # Only the last 10 seconds count
+        self.assertEqual(meter.values(), {("a",): 5.0})
+        now[0] += 60
+        self.assertEqual(meter.values(), {("a",): 0.0})
+
+    def test_failing_scrape_function_is_skipped(self):
+        self.registry.gauge("broken", "Not running yet", fn=lambda: None.stats())
+        self.registry.counter("ok_total", "Fine").inc()
+        self.assertNotIn("broken", self.registry.prometheus())
+        self.assertEqual(list(self.registry.snapshot()), ["ok_total"])
+
+    def test_endpoint(self):
+        self.registry.counter("hits_total", "Hits").inc(2)
+        server = metrics.serve(0, self.registry)
+        try:
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+            with urllib.request.urlopen(base + "/metrics") as response:
+                self.assertIn(b"hits_total 2", response.read())
+            with urllib.request.urlopen(base + "/metrics.json") as response:
+                data = json.loads(response.read())
+            self.assertEqual(data["hits_total"]["series"][0]["value"], 2)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,53 +1,65 @@
-import paho.mqtt.client as mqtt
 import json
 import time
 import random
 
 BROKER = "test.mosquitto.org"
 TOPIC = "wokwi/sensors/sayf_project"
+SCENARIO_LENGTH = 40  # Readings per cycle of scenarios (also used by benchmark.py)
 
-client = mqtt.Client()
-client.connect(BROKER, 1883, 60)
-
-print("Sending 35 messages to trigger report generation...")
-print("This will send varied data to test all recommendation scenarios\n")
-
-for i in range(35):
+def scenario_reading(i, rng=random):
+    """Reading number i of a repeating cycle that triggers every recommendation."""
+    i %= SCENARIO_LENGTH
     # Vary the data to trigger different recommendations
     if i < 10:
         # Normal values
         data = {
-            "temp": random.uniform(20, 25),
-            "humidity": random.uniform(40, 60),
-            "flow": random.uniform(20, 40)
+            "temp": rng.uniform(20, 25),
+            "humidity": rng.uniform(40, 60),
+            "flow": rng.uniform(20, 40)
         }
     elif i < 20:
         # High temperature
         data = {
-            "temp": random.uniform(31, 35),
-            "humidity": random.uniform(40, 60),
-            "flow": random.uniform(20, 40)
+            "temp": rng.uniform(31, 35),
+            "humidity": rng.uniform(40, 60),
+            "flow": rng.uniform(20, 40)
         }
     elif i < 30:
         # Low humidity
         data = {
-            "temp": random.uniform(20, 25),
-            "humidity": random.uniform(20, 28),
-            "flow": random.uniform(20, 40)
+            "temp": rng.uniform(20, 25),
+            "humidity": rng.uniform(20, 28),
+            "flow": rng.uniform(20, 40)
         }
     else:
         # High water flow
         data = {
-            "temp": random.uniform(20, 25),
-            "humidity": random.uniform(40, 60),
-            "flow": random.uniform(55, 65)
+            "temp": rng.uniform(20, 25),
+            "humidity": rng.uniform(40, 60),
+            "flow": rng.uniform(55, 65)
         }
-    
-    client.publish(TOPIC, json.dumps(data))
-    print(f"Sent message {i+1}/35: Temp={data['temp']:.1f}°C, Humidity={data['humidity']:.1f}%, Flow={data['flow']:.1f}L/h")
-    time.sleep(0.5)
-
-print("\n✓ Finished sending 35 messages.")
-print("✓ Report should be generated after message 30")
-print("✓ Check the 'reports' directory for the generated HTML report")
-client.disconnect()
+    return data
+
+def main():
+    from transport import MqttTransport, CLIENT_ID  # Not needed by importers that only want scenario_reading
+
+    # QoS 1: queued while (re)connecting instead of dropped
+    transport = MqttTransport(broker=BROKER, pool_size=1, client_id=f"{CLIENT_ID}-publisher").start()
+
+    print("Sending 35 messages to trigger report generation...")
+    print("This will send varied data to test all recommendation scenarios\n")
+
+    for i in range(35):
+        data = scenario_reading(i)
+        info = transport.publish(TOPIC, json.dumps(data), qos=1)
+        print(f"Sent message {i+1}/35: Temp={data['temp']:.1f}°C, Humidity={data['humidity']:.1f}%, Flow={data['flow']:.1f}L/h")
+        time.sleep(0.5)
+
+    info.wait_for_publish(10)
+    print("\n✓ Finished sending 35 messages.")
+    print("✓ Report should be generated after message 30")
+    print("✓ Check the 'reports' directory for the generated HTML report")
+    transport.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import threading
+import unittest
+from pipeline import IngestPipeline, decode_readings
+
+class TestIngestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+
+    def sink(self, key, readings):
+        self.batches.append(readings)
+
+    def test_decode_reading(self):
+        payload = json.dumps({"temp": 25.0, "humidity": 50.0, "flow": 20}).encode()
+        self.assertEqual(decode_readings(payload, 7), [(7, 25.0, 50.0, 20.0)])
+        self.assertEqual(decode_readings(b'{"temp": 21}', 1), [(1, 21.0, 0.0, 0.0)])
+
+    def test_decode_batch(self):
+        payload = json.dumps({"samples": [[500, 20.0, 50.0, 10], [0, 21.0, 51.0, 11]]})
+        self.assertEqual(decode_readings(payload, 1_000_000_000), [
+            (500_000_000, 20.0, 50.0, 10.0),
+            (1_000_000_000, 21.0, 51.0, 11.0),
+        ])
+
+    def test_decode_rejects_invalid(self):
+        for payload in (b"Not JSON", b"[1, 2]", b'{"temp": "hot"}', b'{"samples": [[1, 2]]}'):
+            with self.assertRaises(ValueError):
+                decode_readings(payload, 0)
+
+    def test_batches_and_counts(self):
+        pipeline = IngestPipeline(self.sink, batch_size=10, batch_timeout=0.01)
+        for i in range(25):
+            pipeline.submit(json.dumps({"temp": i, "humidity": 50, "flow": 20}).encode())
+        pipeline.submit(b"Not JSON")
+        pipeline.submit(b'{"samples": []}')
+        pipeline.start()
+        pipeline.stop()
+
+        temps = [reading[1] for batch in self.batches for reading in batch]
+        self.assertEqual(temps, [float(i) for i in range(25)])
+        self.assertTrue(all(0 < len(batch) <= 10 for batch in self.batches))
+        stats = pipeline.stats()
+        self.assertEqual(stats["received"], 27)
+        self.assertEqual(stats["processed"], 25)
+        self.assertEqual(stats["invalid"], 1)
+        self.assertEqual(stats["depth"], 0)
+
+    def test_counts_submits_from_several_threads(self):
+        pipeline = IngestPipeline(self.sink, queue_size=100000)
+        threads = [threading.Thread(target=lambda: [pipeline.submit(b'{"temp": 1}') for _ in range(5000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(pipeline.stats()["received"], 20000)
+
+    def test_rejects_invalid_device_ids(self):
+        pipeline = IngestPipeline(self.sink)
+        for key in ("..", "a/b", "", "dev 1"):
+            self.assertFalse(pipeline.submit(b'{"temp": 1}', key=key))
+        self.assertTrue(pipeline.submit(b'{"temp": 1}', key="sayf_project-2"))
+        stats = pipeline.stats()
+        self.assertEqual((stats["invalid"], stats["received"]), (4, 1))
+
+    def test_drops_when_full(self):
+        pipeline = IngestPipeline(self.sink, queue_size=2)
+        results = [pipeline.submit(b'{"temp": 1}') for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(pipeline.stats()["dropped"], 1)
+
+    def test_routes_keys_to_workers(self):
+        received = {}
+
+        def sink(key, readings):
+            received.setdefault(key, []).extend(reading[1] for reading in readings)
+
+        pipeline = IngestPipeline(sink, workers=4, batch_timeout=0.01)
+        pipeline.start()
+        for i in range(50):
+            for device in ("a", "b", "c"):
+                pipeline.submit(json.dumps({"temp": i}).encode(), key=device)
+        pipeline.stop()
+
+        self.assertEqual(set(received), {"a", "b", "c"})
+        for temps in received.values():
+            self.assertEqual(temps, [float(i) for i in range(50)])
+        self.assertEqual(pipeline.stats()["processed"], 150)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from profiler import SamplingProfiler
+
+def busy_loop(stop):
+    total = 0
+    while not stop.is_set():
+        total += sum(range(1000))
+    return total
+
+class TestSamplingProfiler(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_samples_busy_thread(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,), name="busy worker")
+        worker.start()
+        profiler = SamplingProfiler(interval=0.001, directory=self.dir, dump_interval=None)
+        for _ in range(20):
+            profiler.sample()
+            time.sleep(0.001)
+        stop.set()
+        worker.join()
+
+        collapsed = profiler.collapsed()
+        self.assertIn("busy_worker;threading:_bootstrap", collapsed)
+        self.assertIn("test_profiler:busy_loop", collapsed)
+        for line in collapsed.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+        self.assertIn("test_profiler:busy_loop", profiler.summary())
+
+    def test_idle_threads_are_skipped(self):
+        stop = threading.Event()
+        idle = threading.Thread(target=stop.wait, name="idle")
+        idle.start()
+        try:
+            time.sleep(0.01)
+            profiler = SamplingProfiler(directory=self.dir)
+            profiler.sample()
+            self.assertNotIn("idle;", profiler.collapsed())
+            profiler.include_idle = True
+            profiler.sample()
+            self.assertIn("idle;", profiler.collapsed())
+        finally:
+            stop.set()
+            idle.join()
+
+    def test_report_timer_is_idle(self):
+        import backend_service
+        timer = threading.Thread(target=backend_service.generate_timed_reports, name="report-timer")
+        timer.start()
+        try:
+            time.sleep(0.01)
+            profiler = SamplingProfiler(directory=self.dir)
+            profiler.sample()
+            self.assertNotIn("report-timer;", profiler.collapsed())
+        finally:
+            backend_service.shutdown.set()
+            timer.join()
+            backend_service.shutdown.clear()
+
+    def test_requested_dump_writes_files_and_resets(self):
+        profiler = SamplingProfiler(interval=0.001, directory=self.dir, dump_interval=None, include_idle=True)
+        profiler.start()
+        profiler.request_dump()
+        deadline = time.monotonic() + 5
+        while not os.listdir(self.dir) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        profiler.stop()
+        names = sorted(os.listdir(self.dir))
+        self.assertTrue(any(name.endswith(".collapsed") for name in names))
+        self.assertTrue(any(name.endswith(".txt") for name in names))
+        with open(os.path.join(self.dir, [n for n in names if n.endswith(".txt")][0])) as f:
+            self.assertIn("self%  total%  function", f.read())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import reports
+from detectors import DetectorSet
+from stats import StreamingStats
+
+def make_stats(count=30, start=0):
+    stats = StreamingStats({"last_30": (30, None)})
+    for i in range(start, start + count):
+        stats.update(i * 1_000_000_000, 20.0 + i, 50.0, 10.0)
+    return stats.snapshot("last_30")
+
+class TestRenderReport(unittest.TestCase):
+    def test_renders_every_metric(self):
+        page = reports.render_report("dev<1>", make_stats(), datetime(2024, 1, 1))
+        self.assertIn("dev&lt;1&gt;", page)
+        self.assertIn("Report Generated:</strong> 2024-01-01 00:00:00", page)
+        for _, label, _ in reports.METRICS:
+            self.assertIn(f"<h2>{label} Analysis</h2>", page)
+        self.assertIn("<td>49.00 °C</td>", page)
+        self.assertIn("Review cooling systems", page)
+
+    def test_detector_findings(self):
+        stats = make_stats(count=5)  # 20-24 °C: below the fixed limit
+        detectors = DetectorSet(["temperature", "humidity", "flow"], warmup=0)
+        detectors.update(0, (20.0, 50.0, 10.0))
+        detectors.update(1, (20.0, 50.0, 10.0))
+        detectors.update(2, (20.0, 50.0, 40.0))
+        stats["detectors"] = detectors.snapshot()
+        items = reports.recommendations(stats)
+        self.assertIn("Within normal range", items[0])
+        self.assertIn("Check for leaks", items[2])
+        self.assertIn("flow rising faster than its rate limit (40.0)", items[3])
+        page = reports.render_report("dev", stats)
+        self.assertIn("<td>Rising (z=", page)
+
+    def test_custom_metrics(self):
+        page = reports.render_report("dev", make_stats(), metrics=[("flow", "Flow", "L/h")])
+        self.assertIn("Average Flow", page)
+        self.assertNotIn("Temperature Analysis", page)
+
+class TestReportWorker(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_concurrent_triggers_are_coalesced(self):
+        worker = reports.ReportWorker(self.directory, min_interval=0)
+        calls = []
+        source = lambda: calls.append(1) or make_stats()
+        self.assertTrue(worker.request("a", source))
+        self.assertFalse(worker.request("a", source))
+        self.assertTrue(worker.request("b", source))
+        worker.start()
+        worker.stop()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(worker.stats(), {"pending": 0, "rendered": 2, "coalesced": 1, "skipped": 0})
+        # Only finished reports, no leftover temporary files
+        names = sorted(os.listdir(self.directory))
+        self.assertEqual(len(names), 2)
+        self.assertTrue(all(name.startswith("report_") and name.endswith(".html") for name in names))
+
+    def test_skips_unchanged_and_short_windows(self):
+        worker = reports.ReportWorker(self.directory)
+        stats = make_stats()
+        self.assertIsNotNone(worker.render("a", stats))
+        self.assertIsNone(worker.render("a", stats))
+        self.assertIsNone(worker.render("b", make_stats(count=5)))
+        self.assertEqual(worker.skipped, 2)
+
+    def test_rate_limits_each_device(self):
+        now = [100.0]
+        worker = reports.ReportWorker(self.directory, min_interval=60, clock=lambda: now[0])
+        rendered = threading.Event()
+        with patch.object(worker, "render", side_effect=lambda *args: rendered.set()):
+            worker.start()
+            worker.request("a", make_stats)
+            self.assertTrue(rendered.wait(1))
+            rendered.clear()
+            worker.request("a", make_stats)
+            # Not due for another minute
+            self.assertFalse(rendered.wait(0.1))
+            self.assertEqual(worker.pending(), 1)
+            worker.stop()
+        # Pending reports are flushed on stop
+        self.assertTrue(rendered.is_set())
+
+    def test_write_atomic_replaces_file(self):
+        path = os.path.join(self.directory, "report.html")
+        reports.write_atomic(path, "old")
+        reports.write_atomic(path, "new")
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "new")
+        self.assertEqual(os.listdir(self.directory), ["report.html"])
+
+if __name__ == '__main__':
+    unittest.main()
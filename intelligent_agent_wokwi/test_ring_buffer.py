@@ -0,0 +1,45 @@
+import unittest
+from ring_buffer import RingBuffer
+
+class TestRingBuffer(unittest.TestCase):
+    def test_append_and_window(self):
+        buffer = RingBuffer(4)
+        for i in range(3):
+            buffer.append(i, 20.0 + i, 50.0, 10.0)
+        self.assertEqual(len(buffer), 3)
+        view = buffer.window()
+        self.assertEqual(view.column("timestamp_ns"), [0, 1, 2])
+        self.assertEqual(view.column("temperature"), [20.0, 21.0, 22.0])
+        self.assertEqual(len(view.segments["temperature"]), 1)
+
+    def test_wraps_and_keeps_newest(self):
+        buffer = RingBuffer(4)
+        for i in range(10):
+            buffer.append(i, float(i), 0.0, 0.0)
+        self.assertEqual(len(buffer), 4)
+        view = buffer.window(3)
+        self.assertEqual(view.column("timestamp_ns"), [7, 8, 9])
+        self.assertEqual(list(buffer.window().rows())[0], (6, 6.0, 0.0, 0.0))
+        self.assertEqual(len(buffer.window().segments["flow"]), 2)
+        self.assertEqual(buffer.latest(), (9, 9.0, 0.0, 0.0))
+
+    def test_view_detects_overwrite(self):
+        buffer = RingBuffer(4)
+        for i in range(4):
+            buffer.append(i, 0.0, 0.0, 0.0)
+        view = buffer.window(2)
+        self.assertTrue(view.is_valid())
+        for i in range(4, 7):
+            buffer.append(i, 0.0, 0.0, 0.0)
+        self.assertFalse(view.is_valid())
+
+    def test_since(self):
+        buffer = RingBuffer(8)
+        for i in range(12):
+            buffer.append(i * 10, 0.0, 0.0, 0.0)
+        self.assertEqual(buffer.since(85).column("timestamp_ns"), [90, 100, 110])
+        self.assertEqual(len(buffer.since(0)), 8)
+        self.assertEqual(len(buffer.since(500)), 0)
+
+if __name__ == '__main__':
+    unittest.main()
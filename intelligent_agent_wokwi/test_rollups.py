@@ -0,0 +1,95 @@
+import os
+import shutil
+import statistics
+import tempfile
+import unittest
+from unittest.mock import patch
+import history
+import rollups
+import storage
+
+SECOND = 1_000_000_000
+TIERS = [("10s", 10, None), ("100s", 100, None)]
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = storage.BinaryLogStorage(self.directory, segment_records=100, background=False)
+        self.addCleanup(self.store.close)
+
+    def write(self, start, count):
+        # One reading per second
+        for i in range(start, start + count):
+            self.store.append(i * SECOND, float(i % 37), 50.0 + i % 7, 10.0)
+        self.store.flush()
+
+    def roll(self, now_s):
+        return rollups.roll_device(self.directory, now_ns=now_s * SECOND, tiers=TIERS, delay=0)
+
+    def test_tiers_match_direct_computation(self):
+        self.write(0, 1000)
+        self.assertEqual(self.roll(1000), {"10s": 100, "100s": 10})
+        tiers = rollups.device_tiers(self.directory, TIERS)
+        row = tiers[1].read(300 * SECOND, 400 * SECOND)[0]
+        values = [float(i % 37) for i in range(300, 400)]
+        self.assertEqual((row.start_ns, row.count), (300 * SECOND, 100))
+        self.assertEqual((row.mins[0], row.maxs[0], row.mean(0)), (min(values), max(values), statistics.mean(values)))
+        self.assertAlmostEqual(row.std(0), statistics.stdev(values))
+
+        # Only complete buckets are rolled up, and each only once
+        self.write(1000, 25)
+        self.assertEqual(self.roll(1025), {"10s": 2, "100s": 0})
+        self.assertEqual(tiers[0].end(), 1020 * SECOND)
+
+    def test_query_uses_coarsest_tier_then_raw(self):
+        self.write(0, 1000)
+        self.roll(950)
+        index = history.HistoryIndex(self.directory, block_records=16)
+        with patch.object(history.HistoryIndex, "downsample", wraps=index.downsample) as raw:
+            buckets = rollups.downsample(self.directory, "temperature", 0, 999 * SECOND, 5, tiers=TIERS, index=index)
+            # 200 s buckets come from the 100 s tier up to 900 s, the 10 s tier up to 950 s, then raw data
+            self.assertEqual(raw.call_count, 1)
+            self.assertEqual(raw.call_args[0][1:3], (950 * SECOND, 999 * SECOND))
+        expected = index.downsample("temperature", 0, 999 * SECOND, 5, exact=True)
+        self.assertEqual(len(buckets), 5)
+        for got, want in zip(buckets, expected):
+            self.assertEqual(got[0], want[0])
+            self.assertEqual(got[4], want[4])
+            self.assertEqual(got[1:3], want[1:3])
+            self.assertAlmostEqual(got[3], want[3])
+
+    def test_unaligned_query_edges_use_finer_data(self):
+        self.write(0, 1000)
+        self.roll(1000)
+        index = history.HistoryIndex(self.directory, block_records=16)
+        buckets = rollups.downsample(self.directory, "humidity", 55 * SECOND, 854 * SECOND, 1, tiers=TIERS,
+                                     index=index)
+        values = [50.0 + i % 7 for i in range(55, 855)]
+        self.assertEqual(buckets[0][4], len(values))
+        self.assertAlmostEqual(buckets[0][3], statistics.mean(values))
+
+    def test_compaction_removes_rolled_up_raw_segments(self):
+        self.write(0, 1000)
+        segments = storage.list_segments(self.directory)
+        self.assertEqual(len(segments), 10)
+        # Nothing is deleted before it is rolled up
+        self.assertEqual(rollups.compact_device(self.directory, 2000 * SECOND, TIERS, raw_retention=500), 0)
+        self.roll(1000)
+        self.assertEqual(rollups.compact_device(self.directory, 1000 * SECOND, TIERS, raw_retention=500), 5)
+        self.assertEqual(storage.list_segments(self.directory), segments[5:])
+        self.assertFalse(os.path.exists(segments[0][:-len(storage.SEGMENT_SUFFIX)] + history.INDEX_SUFFIX))
+        # The old range is still answered from the tiers
+        buckets = rollups.downsample(self.directory, "flow", 0, 500 * SECOND - 1, 5, tiers=TIERS)
+        self.assertEqual([b[4] for b in buckets], [100] * 5)
+
+    def test_tier_retention(self):
+        self.write(0, 1000)
+        self.roll(1000)
+        tier = rollups.Tier(self.directory, "10s", 10, 300)
+        self.assertEqual(tier.compact(1000 * SECOND), 70)
+        self.assertEqual(tier.first_start(), 700 * SECOND)
+        self.assertEqual(tier.end(), 1000 * SECOND)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import random
+import unittest
+import numpy as np
+from detectors import detector_for
+from rules import Rule, RuleState, evaluate_batch, transitions
+
+RULES = [
+    Rule("ACT1", "temp", 30.0, hysteresis=1.0, min_dwell=5.0),
+    Rule("ACT2", "flow", 50.0, hysteresis=5.0),
+    Rule("ACT3", "humidity", 70.0, hysteresis=2.0, min_dwell=3.0, conditions=[("temp", ">", 25.0)]),
+]
+
+def random_history(seed, n):
+    rng = random.Random(seed)
+    timestamps = np.cumsum([rng.choice([1, 1, 2, 3]) for _ in range(n)]).astype(float)
+    columns = {
+        "temp": np.array([rng.uniform(27, 33) for _ in range(n)]),
+        "humidity": np.array([rng.uniform(65, 75) for _ in range(n)]),
+        "flow": np.array([rng.uniform(40, 60) for _ in range(n)]),
+    }
+    return timestamps, columns
+
+def scalar_decisions(rules, timestamps, columns):
+    states = [RuleState(rule) for rule in rules]
+    decisions = {rule.actuator: [] for rule in rules}
+    for i, now in enumerate(timestamps):
+        readings = {name: values[i] for name, values in columns.items()}
+        for state in states:
+            state.update(readings, now)
+            decisions[state.rule.actuator].append(state.on)
+    return decisions
+
+class TestRules(unittest.TestCase):
+    def test_batch_matches_scalar_path(self):
+        timestamps, columns = random_history(1, 500)
+        batch, _ = evaluate_batch(RULES, timestamps, columns)
+        expected = scalar_decisions(RULES, timestamps, columns)
+        for actuator, on in batch.items():
+            self.assertEqual(on.tolist(), expected[actuator], actuator)
+
+    def test_state_carries_across_calls(self):
+        timestamps, columns = random_history(2, 300)
+        whole, _ = evaluate_batch(RULES, timestamps, columns)
+        first, states = evaluate_batch(RULES, timestamps[:120], {k: v[:120] for k, v in columns.items()})
+        second, _ = evaluate_batch(RULES, timestamps[120:], {k: v[120:] for k, v in columns.items()}, states)
+        for actuator in whole:
+            self.assertEqual(whole[actuator].tolist(), first[actuator].tolist() + second[actuator].tolist())
+
+    def test_many_devices_at_once(self):
+        histories = [random_history(seed, 100) for seed in range(5)]
+        timestamps = np.stack([h[0] for h in histories])
+        columns = {name: np.stack([h[1][name] for h in histories]) for name in ("temp", "humidity", "flow")}
+        batch, _ = evaluate_batch(RULES, timestamps, columns)
+        for device, (device_times, device_columns) in enumerate(histories):
+            expected = scalar_decisions(RULES, device_times, device_columns)
+            for actuator in batch:
+                self.assertEqual(batch[actuator][device].tolist(), expected[actuator])
+
+    def test_combined_condition(self):
+        rule = Rule("ACT3", "humidity", 70.0, conditions=[("temp", ">", 25.0)])
+        state = RuleState(rule)
+        state.update({"humidity": 80.0, "temp": 20.0}, 0)
+        self.assertFalse(state.on)
+        state.update({"humidity": 80.0, "temp": 26.0}, 1)
+        self.assertTrue(state.on)
+
+    def test_early_threshold_while_rising(self):
+        rule = Rule("ACT1", "temp", 30.0, hysteresis=1.0, early_threshold=27.0)
+        state = RuleState(rule)
+        state.update({"temp": 28.0, "temp_rising": False}, 0)
+        self.assertFalse(state.on)
+        state.update({"temp": 28.0, "temp_rising": True}, 1)
+        self.assertTrue(state.on)
+        # Held on while still rising, released once it stops below the hysteresis band
+        state.update({"temp": 27.5, "temp_rising": True}, 2)
+        self.assertTrue(state.on)
+        state.update({"temp": 27.5, "temp_rising": False}, 3)
+        self.assertFalse(state.on)
+
+        columns = {"temp": np.array([28.0, 28.0, 27.5, 27.5]), "temp_rising": np.array([False, True, True, False])}
+        decisions, _ = evaluate_batch([rule], np.arange(4.0), columns)
+        self.assertEqual(decisions["ACT1"].tolist(), [False, True, True, False])
+
+    def test_batch_derives_rising_like_the_agent(self):
+        rng = random.Random(5)
+        rules = [Rule("ACT1", "temp", 30.0, hysteresis=1.0, min_dwell=5.0, early_threshold=27.0)]
+        timestamps = np.arange(600.0)
+        # Flat, then warming towards 29 °C: the early threshold switches on before 30 °C
+        columns = {"temp": np.array([24.0 + max(0.0, i - 300) * 0.02 + rng.gauss(0, 0.2) for i in range(600)])}
+        detector = detector_for("temp")
+        states = [RuleState(rule) for rule in rules]
+        expected = []
+        for t, x in zip(timestamps, columns["temp"]):
+            detector.update(x, t)
+            states[0].update({"temp": x, "temp_rising": detector.rising}, t)
+            expected.append(states[0].on)
+        self.assertLess(columns["temp"][expected.index(True)], 28.0)
+
+        whole, _ = evaluate_batch(rules, timestamps, columns)
+        self.assertEqual(whole["ACT1"].tolist(), expected)
+        # Detector state carries across calls
+        first, carried = evaluate_batch(rules, timestamps[:400], {"temp": columns["temp"][:400]})
+        second, _ = evaluate_batch(rules, timestamps[400:], {"temp": columns["temp"][400:]}, carried)
+        self.assertEqual(first["ACT1"].tolist() + second["ACT1"].tolist(), expected)
+
+    def test_transitions(self):
+        timestamps = np.array([0.0, 10.0, 11.0, 20.0])
+        columns = {"temp": np.array([20.0, 35.0, 20.0, 20.0]), "humidity": np.zeros(4), "flow": np.zeros(4)}
+        decisions, _ = evaluate_batch(RULES[:1], timestamps, columns)
+        # The switch back off at t=11 is held back by the 5 s dwell until t=20
+        events = [(float(t), command) for t, command in transitions(decisions, timestamps)]
+        self.assertEqual(events, [(0.0, "ACT1:OFF"), (10.0, "ACT1:ON"), (20.0, "ACT1:OFF")])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import random
+import statistics
+import unittest
+from stats import BUCKETS, RunningMoments, StreamingStats
+
+class TestStreamingStats(unittest.TestCase):
+    def test_running_moments_add_remove(self):
+        moments = RunningMoments()
+        for x in [1.0, 2.0, 4.0, 8.0]:
+            moments.add(x)
+        moments.remove(1.0)
+        self.assertAlmostEqual(moments.mean, statistics.mean([2.0, 4.0, 8.0]))
+        self.assertAlmostEqual(moments.std, statistics.stdev([2.0, 4.0, 8.0]))
+
+    def test_count_window_matches_batch(self):
+        rng = random.Random(42)
+        stats = StreamingStats({"last_30": (30, None)})
+        values = []
+        for i in range(200):
+            reading = (rng.uniform(20, 35), rng.uniform(20, 80), rng.uniform(0, 100))
+            values.append(reading)
+            stats.update(i * 1_000_000_000, *reading)
+
+        snapshot = stats.snapshot("last_30")
+        self.assertEqual(snapshot["count"], 30)
+        self.assertEqual(snapshot["first_ns"], 170 * 1_000_000_000)
+        for index, name in enumerate(["temperature", "humidity", "flow"]):
+            window = [reading[index] for reading in values[-30:]]
+            self.assertAlmostEqual(snapshot[name]["min"], min(window))
+            self.assertAlmostEqual(snapshot[name]["max"], max(window))
+            self.assertAlmostEqual(snapshot[name]["avg"], statistics.mean(window))
+            self.assertAlmostEqual(snapshot[name]["std"], statistics.stdev(window))
+
+    def test_time_window_evicts_by_age(self):
+        stats = StreamingStats({"1m": (None, 60)})
+        for second in range(0, 120, 10):
+            stats.update(second * 1_000_000_000, float(second), 0.0, 0.0)
+
+        snapshot = stats.snapshot("1m")
+        # Samples at 50..110 s are within 60 s of the newest one
+        self.assertEqual(snapshot["count"], 7)
+        self.assertEqual(snapshot["temperature"]["min"], 50.0)
+        self.assertEqual(snapshot["temperature"]["max"], 110.0)
+
+    def test_time_window_is_bucketed(self):
+        rng = random.Random(7)
+        stats = StreamingStats({"1m": (None, 60)})
+        values = []
+        # 50 Hz for five minutes: the window keeps buckets, not 3000 samples
+        for i in range(15000):
+            reading = (rng.uniform(20, 35), rng.uniform(20, 80), rng.uniform(0, 100))
+            values.append(reading)
+            stats.update(i * 20_000_000, *reading)
+
+        window = stats.windows["1m"]
+        self.assertLessEqual(len(window.buckets), BUCKETS + 1)
+        snapshot = stats.snapshot("1m")
+        # The oldest edge is rounded to the 1 s bucket
+        self.assertEqual(snapshot["first_ns"], 239 * 1_000_000_000)
+        recent = values[-snapshot["count"]:]
+        self.assertEqual(len(recent), 3050)
+        for index, name in enumerate(["temperature", "humidity", "flow"]):
+            column = [reading[index] for reading in recent]
+            self.assertAlmostEqual(snapshot[name]["min"], min(column))
+            self.assertAlmostEqual(snapshot[name]["max"], max(column))
+            self.assertAlmostEqual(snapshot[name]["avg"], statistics.mean(column))
+            self.assertAlmostEqual(snapshot[name]["std"], statistics.stdev(column))
+
+    def test_trend_direction(self):
+        stats = StreamingStats({"last_30": (30, None)})
+        for i in range(30):
+            stats.update(i, 20.0 + i * 0.1, 60.0 - i * 0.5, 30.0)
+        snapshot = stats.snapshot("last_30")
+        self.assertEqual(snapshot["temperature"]["trend"], "Increasing")
+        self.assertEqual(snapshot["humidity"]["trend"], "Decreasing")
+
+if __name__ == '__main__':
+    unittest.main()
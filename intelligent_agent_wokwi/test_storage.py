@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+from storage import BinaryLogStorage, RECORD, create_storage, export_device, is_valid_device_id, read_segments
+
+class TestBinaryLogStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_and_read(self):
+        store = BinaryLogStorage(self.directory)
+        store.append(1_000, 25.0, 50.0, 20.0)
+        store.append(2_000, 26.5, 51.0, 21.0)
+        rows = list(store.read())
+        store.close()
+        self.assertEqual(rows, [(1_000, 25.0, 50.0, 20.0), (2_000, 26.5, 51.0, 21.0)])
+
+    def test_segments_rotate(self):
+        store = BinaryLogStorage(self.directory, segment_records=3)
+        for i in range(7):
+            store.append(i, float(i), 0.0, 0.0)
+        store.close()
+        self.assertEqual(len(store.segments()), 3)
+        self.assertEqual(os.path.getsize(store.segments()[0]), 3 * RECORD.size)
+
+    def test_rejects_unsafe_device_ids(self):
+        self.assertTrue(is_valid_device_id("sayf_project"))
+        for device_id in ("..", "a/b", "", "x" * 65, None):
+            self.assertFalse(is_valid_device_id(device_id))
+        with self.assertRaises(ValueError):
+            create_storage(path=self.directory, device_id="..")
+
+    def test_export_is_read_only(self):
+        store = BinaryLogStorage(os.path.join(self.directory, "dev1"), background=False)
+        store.append(1_000, 25.0, 50.0, 20.0)
+        store.flush()
+        # A record the backend is still writing
+        segment = store.segments()[-1]
+        with open(segment, "ab") as f:
+            f.write(b"\x00" * 5)
+        self.assertEqual(list(read_segments(store.directory)), [(1_000, 25.0, 50.0, 20.0)])
+        self.assertEqual(os.path.getsize(segment), RECORD.size + 5)
+        store.close()
+
+        with self.assertRaises(ValueError):
+            export_device("dev2", os.path.join(self.directory, "out.xlsx"), path=self.directory)
+        self.assertEqual(os.listdir(self.directory), ["dev1"])
+
+    def test_reopen_continues_log(self):
+        store = BinaryLogStorage(self.directory, segment_records=4)
+        for i in range(3):
+            store.append(i, 0.0, 0.0, 0.0)
+        store.close()
+
+        # Simulate a torn write at the end of the last segment
+        with open(store.segments()[-1], "ab") as f:
+            f.write(b"\x00" * 5)
+
+        store = BinaryLogStorage(self.directory, segment_records=4)
+        for i in range(3, 6):
+            store.append(i, 0.0, 0.0, 0.0)
+        timestamps = [row[0] for row in store.read()]
+        store.close()
+        self.assertEqual(timestamps, list(range(6)))
+        self.assertEqual(len(store.segments()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import json
+import unittest
+import telemetry
+from pipeline import decode_readings
+
+class TestTelemetry(unittest.TestCase):
+    def test_binary_roundtrip(self):
+        payload = telemetry.encode_binary(7, 42, 1_700_000_000_123, 24.56, 51.2, 37)
+        self.assertEqual(len(payload), 17)
+        data = telemetry.decode(payload)
+        self.assertEqual(data["device"], 7)
+        self.assertEqual(data["seq"], 42)
+        self.assertEqual(data["timestamp_ms"], 1_700_000_000_123 % 2**32)
+        self.assertAlmostEqual(data["temp"], 24.56)
+        self.assertAlmostEqual(data["humidity"], 51.2)
+        self.assertAlmostEqual(data["flow"], 37.0)
+
+    def test_json_still_decodes(self):
+        payload = json.dumps({"temp": 25.0, "humidity": 50.0, "flow": 20})
+        self.assertEqual(telemetry.decode(payload)["temp"], 25.0)
+        self.assertEqual(telemetry.decode(payload.encode())["flow"], 20)
+
+    def test_rejects_truncated_record(self):
+        payload = telemetry.encode_binary(1, 0, 0, 20.0, 50.0, 10.0)
+        with self.assertRaises(ValueError):
+            telemetry.decode(payload[:-1])
+
+    def test_device_from_topic(self):
+        self.assertEqual(telemetry.device_from_topic("wokwi/sensors/sayf_project"), "sayf_project")
+        self.assertEqual(telemetry.device_from_topic("wokwi/sensors/sayf_project/bin"), "sayf_project")
+        self.assertTrue(telemetry.is_binary_topic("wokwi/sensors/sayf_project/bin"))
+
+    def test_binary_batch(self):
+        payload = b"".join(
+            telemetry.encode_binary(1, seq, 2**32 - 250 + seq * 250, 20.0 + seq, 50.0, 10.0) for seq in range(3)
+        )
+        samples = telemetry.decode_samples(payload)
+        self.assertEqual([sample["seq"] for sample in samples], [0, 1, 2])
+        # Sub-second spacing survives, across the wrap of the device time
+        self.assertEqual([sample["age_ms"] for sample in samples], [500, 250, 0])
+        self.assertEqual([reading[0] for reading in decode_readings(payload, 10**9)],
+                         [500_000_000, 750_000_000, 10**9])
+
+    def test_version_1_records(self):
+        payload = b"".join(
+            telemetry.RECORD.pack(1, 1, seq, 100 + seq * 2, 2000, 5000, 100) for seq in range(3)
+        )
+        self.assertEqual([sample["age_ms"] for sample in telemetry.decode_samples(payload)], [4000, 2000, 0])
+
+    def test_pipeline_decodes_binary(self):
+        payload = telemetry.encode_binary(1, 0, 0, 31.5, 40.0, 55.5)
+        self.assertEqual(decode_readings(payload, 9), [(9, 31.5, 40.0, 55.5)])
+
+if __name__ == '__main__':
+    unittest.main()
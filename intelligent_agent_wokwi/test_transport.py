@@ -0,0 +1,90 @@
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from benchmark import FakeBroker, FakeClient
+from transport import MqttTransport, default_client_id, MAX_INFLIGHT, RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+class TestMqttTransport(unittest.TestCase):
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.received = []
+        self.lock = threading.Lock()
+
+    def on_message(self, client, userdata, msg):
+        with self.lock:
+            self.received.append((client, msg.topic))
+
+    def test_pool_shares_the_subscription(self):
+        transport = MqttTransport(["wokwi/sensors/+"], self.on_message, pool_size=2, group="g",
+                                  client_factory=self.broker.client_factory).start()
+        self.addCleanup(transport.stop)
+        self.assertEqual(transport.subscriptions(), [("$share/g/wokwi/sensors/+", 1)])
+        # A second group (another service) gets its own copy of every message
+        other = []
+        listener = MqttTransport(["wokwi/sensors/+"], lambda c, u, msg: other.append(msg.topic), pool_size=2,
+                                 group="other", client_factory=self.broker.client_factory).start()
+        self.addCleanup(listener.stop)
+        for i in range(10):
+            FakeClient(self.broker).publish(f"wokwi/sensors/dev{i}", "x")
+        self.assertTrue(wait_for(lambda: len(self.received) == 10 and len(other) == 10))
+        # Each message went to one connection of the group, spread over both
+        self.assertEqual({client for client, _ in self.received}, set(transport.clients))
+        self.assertEqual(transport.connected, 2)
+
+    def test_client_settings_and_resubscribe(self):
+        client = MagicMock()
+        transport = MqttTransport(["a/+"], self.on_message, pool_size=1, client_id="svc",
+                                  client_factory=lambda client_id, clean_session: client)
+        transport.start()
+        client.max_inflight_messages_set.assert_called_once_with(MAX_INFLIGHT)
+        client.reconnect_delay_set.assert_called_once_with(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+        client.connect_async.assert_called_once()
+        # Every (re)connect subscribes again; a refused connection does not
+        transport._on_connect(client, None, {}, 0)
+        transport._on_disconnect(client, None, 7)
+        transport._on_connect(client, None, {}, 5)
+        transport._on_connect(client, None, {}, 0)
+        self.assertEqual(client.subscribe.call_count, 2)
+        client.subscribe.assert_called_with([("a/+", 1)])
+        transport.stop()
+        client.disconnect.assert_called_once()
+
+    def test_commands_are_batched_per_topic(self):
+        # Commands arriving while the first one waits for its acknowledgement are merged
+        broker = FakeBroker(ack_delay=0.2)
+        actuator = FakeClient(broker)
+        actuator.on_message = lambda c, u, msg: self.received.append(msg.payload)
+        actuator.subscribe("wokwi/actuators/+")
+        actuator.loop_start()
+        self.addCleanup(actuator.loop_stop)
+        transport = MqttTransport(pool_size=1, client_factory=broker.client_factory).start()
+
+        transport.publish_command("wokwi/actuators/dev1", "ACT1:ON")
+        self.assertTrue(wait_for(lambda: self.received == [b"ACT1:ON"]))
+        transport.publish_command("wokwi/actuators/dev1", "ACT2:ON")
+        transport.publish_command("wokwi/actuators/dev1", "ACT1:OFF")
+        transport.publish_command("wokwi/actuators/dev1", "ACT2:OFF")
+        transport.publish_command("wokwi/actuators/dev2", "ACT1:ON")
+        transport.stop()
+        self.assertTrue(wait_for(lambda: len(self.received) == 3))
+        self.assertEqual(self.received, [b"ACT1:ON", b"ACT1:OFF\nACT2:OFF", b"ACT1:ON"])
+
+    def test_instance_in_client_ids(self):
+        ids = []
+        factory = lambda client_id, clean_session: ids.append(client_id) or MagicMock()
+        MqttTransport(["a/+"], pool_size=2, client_id=f"{default_client_id('b')}-backend",
+                      client_factory=factory).start().stop()
+        host = socket.gethostname()
+        self.assertEqual(ids, [f"wokwi-{host}-b-backend-0", f"wokwi-{host}-b-backend-1"])
+        self.assertEqual(default_client_id(""), f"wokwi-{host}")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+import storage
+from devices import DeviceRegistry
+from wal import WriteAheadLog, encode_frame, iter_frames
+
+def readings(start, count):
+    return [(start + i, 20.0 + i, 50.0, 10.0) for i in range(count)]
+
+class TestWriteAheadLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_replay_after_reopen(self):
+        log = WriteAheadLog(self.directory).open()
+        log.write("a", readings(0, 3))
+        log.write("b", readings(10, 2))
+        log.write("a", readings(3, 1))
+        log.close()
+
+        replayed = list(WriteAheadLog(self.directory).replay())
+        self.assertEqual([device for device, _ in replayed], ["a", "b", "a"])
+        self.assertEqual(replayed[0][1], readings(0, 3))
+        self.assertEqual(replayed[2][1], readings(3, 1))
+
+    def test_torn_and_corrupt_tail_is_truncated(self):
+        log = WriteAheadLog(self.directory).open()
+        log.write("a", readings(0, 2))
+        log.close()
+        path = log.segments()[-1]
+        good = os.path.getsize(path)
+        frame = encode_frame("a", readings(2, 2))
+        with open(path, "ab") as f:
+            f.write(frame[:-3])  # Crash in the middle of a write
+
+        log = WriteAheadLog(self.directory).open()
+        self.assertEqual(os.path.getsize(path), good)
+        log.write("a", readings(4, 1))
+        log.close()
+        self.assertEqual([r for _, batch in log.replay() for r in batch], readings(0, 2) + readings(4, 1))
+
+        # A flipped bit fails the checksum: replay stops before that frame
+        data = bytearray(open(path, "rb").read())
+        data[-1] ^= 0xFF
+        frames = list(iter_frames(bytes(data)))
+        self.assertEqual(len(frames), 1)
+
+    def test_group_commit_shares_fsyncs(self):
+        log = WriteAheadLog(self.directory).open()
+        syncs = []
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            syncs.append(fd)
+            threading.Event().wait(0.01)
+            real_fsync(fd)
+
+        with patch("wal.os.fsync", slow_fsync):
+            threads = [threading.Thread(target=log.write, args=(f"d{i}", readings(i * 100, 5))) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        log.close()
+        self.assertLess(len(syncs), 8)
+        self.assertEqual(sum(len(batch) for _, batch in log.replay()), 40)
+
+    def test_rotation_compaction_and_tail_replay(self):
+        now = [1_000_000.0]
+        log = WriteAheadLog(self.directory, segment_bytes=200, retention=3600, clock=lambda: now[0]).open()
+        for i in range(10):
+            log.write("a", readings(i * 1000, 5))
+        self.assertGreater(len(log.segments()), 3)
+        # Only the segments holding readings since 7000 are opened
+        with patch("builtins.open", wraps=open) as opened:
+            replayed = [r for _, batch in log.replay(since_ns=7000) for r in batch]
+        read_paths = {call.args[0] for call in opened.call_args_list if call.args[1:] == ("rb",)}
+        self.assertEqual([r[0] for r in replayed], [t for i in range(7, 10) for t in range(i * 1000, i * 1000 + 5)])
+        self.assertLess(len(read_paths), len(log.segments()))
+
+        count = len(log.segments())
+        old = log.segments()[0]
+        os.utime(old, (now[0] - 7200, now[0] - 7200))
+        self.assertEqual(log.compact(), 1)
+        self.assertEqual(len(log.segments()), count - 1)
+        self.assertFalse(os.path.exists(old))
+        log.close()
+
+    def test_restore_reappends_readings_missing_from_storage(self):
+        data_dir = os.path.join(self.directory, "data")
+        with patch.object(storage, "DATA_DIR", data_dir):
+            registry = DeviceRegistry(buffer_retention=100)
+            shard = registry.get("a")
+            for reading in readings(0, 3):
+                shard.add(*reading)
+            registry.close()  # Only the first three readings reached storage
+
+            registry = DeviceRegistry(buffer_retention=100)
+            shard = registry.get("a")
+            shard.restore(readings(0, 5))
+            registry.close()
+        self.assertEqual(len(shard.buffer), 5)
+        self.assertEqual(shard.counter, 0)
+        self.assertEqual(shard.stats.snapshot("last_30")["count"], 5)
+        self.assertEqual([row[0] for row in shard.storage.read()], list(range(5)))
+
+if __name__ == '__main__':
+    unittest.main()
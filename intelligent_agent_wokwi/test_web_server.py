@@ -0,0 +1,87 @@
+import gzip
+import http.client
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+import storage
+from web import server
+
+class TestDashboardServer(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        store = storage.create_storage(path=self.data_dir, device_id="dev1", background=False)
+        for i in range(100):
+            store.append(i * 1_000_000_000, 20.0 + i, 50.0, 10.0)
+        store.close()
+
+        handler = type("Handler", (server.DashboardRequestHandler,), {"data_dir": self.data_dir})
+        handler.log_message = lambda *args: None
+        self.httpd = server.http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.addCleanup(self.httpd.server_close)
+        self.addCleanup(self.httpd.shutdown)
+
+    def request(self, path, headers=None):
+        connection = http.client.HTTPConnection("127.0.0.1", self.httpd.server_address[1])
+        self.addCleanup(connection.close)
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+
+    def test_static_gzip_and_conditional_get(self):
+        response, body = self.request("/style.css", {"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        with open(server.os.path.join(server.DIRECTORY, "style.css"), "rb") as f:
+            self.assertEqual(gzip.decompress(body), f.read())
+
+        etag = response.getheader("ETag")
+        response, body = self.request("/style.css", {"If-None-Match": etag})
+        self.assertEqual(response.status, 304)
+        self.assertEqual(body, b"")
+
+        response, _ = self.request("/style.css", {"If-Modified-Since": response.getheader("Last-Modified")})
+        self.assertEqual(response.status, 304)
+
+    def test_unknown_files_are_not_served(self):
+        self.assertEqual(self.request("/server.py")[0].status, 404)
+        self.assertEqual(self.request("/../README.md")[0].status, 404)
+
+    def test_latest_and_history(self):
+        response, body = self.request("/api/latest")
+        self.assertEqual(response.status, 200)
+        latest = json.loads(body)["devices"]["dev1"]
+        self.assertEqual((latest["timestamp"], latest["temperature"]), (99.0, 119.0))
+
+        response, body = self.request("/api/history?device=dev1&metric=temperature&start=0&end=99&points=10")
+        data = json.loads(body)
+        self.assertEqual(len(data["points"]), 10)
+        self.assertEqual(data["points"][0], [0.0, 20.0, 29.0, 24.5, 10])
+
+        response, body = self.request("/api/readings?device=dev1&since=97000")
+        data = json.loads(body)
+        self.assertEqual(data["readings"], [[98000, 118.0, 50.0, 10.0], [99000, 119.0, 50.0, 10.0]])
+        self.assertFalse(data["more"])
+
+        # Paging continues from the nanosecond cursor, inside a millisecond
+        store = storage.create_storage(path=self.data_dir, device_id="dev1", background=False)
+        for i in range(5):
+            store.append(200_000_000_000 + i * 100, float(i), 50.0, 10.0)
+        store.close()
+        with patch.object(server, "MAX_SYNC_READINGS", 3):
+            data = json.loads(self.request("/api/readings?device=dev1&since=199999")[1])
+            self.assertEqual([reading[1] for reading in data["readings"]], [0.0, 1.0, 2.0])
+            self.assertEqual(data["next_ns"], "200000000200")
+            data = json.loads(self.request("/api/readings?device=dev1&since_ns=" + data["next_ns"])[1])
+        self.assertEqual([reading[1] for reading in data["readings"]], [3.0, 4.0])
+        self.assertFalse(data["more"])
+
+        self.assertEqual(self.request("/api/history?device=nope")[0].status, 404)
+        self.assertEqual(self.request("/api/history?device=dev1&metric=pressure")[0].status, 400)
+
+if __name__ == '__main__':
+    unittest.main()
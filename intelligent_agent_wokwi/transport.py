@@ -0,0 +1,206 @@
+"""
+Shared MQTT transport for the services.
+
+MqttTransport owns a small pool of client connections to the broker:
+
+  - With more than one connection the sensor topics are subscribed as a
+    shared subscription ($share/<group>/<topic>), so the broker spreads the
+    fleet's messages over the connections and their network threads
+    instead of pushing everything through one socket. Each service uses
+    its own group and therefore still receives every message once.
+    Readings of one device may then arrive slightly out of order; use
+    pool_size=1 where strict order matters.
+  - Subscriptions use QoS 1 on a persistent session (clean_session=False,
+    stable client IDs), so messages published with QoS 1 (the firmware's
+    readings, see SENSOR_QOS in main.py) during a broker blip are kept by
+    the broker and delivered after the reconnect; QoS 0 messages are not. Client
+    IDs include the host name and WOKWI_INSTANCE, which must differ between
+    instances of a service on one host (the broker disconnects a client
+    when another one connects with the same ID).
+  - Reconnects are retried by paho with exponential backoff between
+    RECONNECT_MIN_DELAY and RECONNECT_MAX_DELAY seconds, and every
+    (re)connect re-subscribes.
+  - The inflight window and the outgoing queue are sized for fleet
+    traffic; publishes made while disconnected wait in that queue.
+  - Actuator commands are batched per topic: a command batch is held back
+    until the broker has acknowledged the previous one (QoS 1, at most
+    ACK_TIMEOUT seconds), and commands arriving meanwhile are merged (the
+    newest command per actuator wins) into one newline-separated message.
+    An idle transport sends a command immediately, so batching only costs
+    latency when commands arrive faster than the broker round trip.
+
+paho is imported when the first connection is made, so importing this
+module stays cheap.
+"""
+import logging
+import os
+import socket
+import threading
+
+import metrics
+
+
+# Configuration
+MQTT_BROKER = "test.mosquitto.org"
+MQTT_PORT = 1883
+KEEPALIVE = 60  # Seconds
+POOL_SIZE = 2  # Connections sharing the subscriptions
+SUBSCRIBE_QOS = 1
+COMMAND_QOS = 1
+PERSISTENT_SESSION = True  # Broker keeps QoS 1 messages for us while we reconnect
+MAX_INFLIGHT = 100  # Unacknowledged QoS 1 messages per connection (paho default: 20)
+MAX_QUEUED = 10000  # Outgoing messages buffered per connection while disconnected (0 = unlimited)
+RECONNECT_MIN_DELAY = 1  # Seconds; doubled after every failed attempt
+RECONNECT_MAX_DELAY = 60
+ACK_TIMEOUT = 5.0  # Seconds to wait for a command batch's acknowledgement before sending the next one
+INSTANCE = os.environ.get("WOKWI_INSTANCE", "")  # Distinguishes several instances on one host
+
+log = logging.getLogger("transport")
+CONNECTS = metrics.counter("wokwi_mqtt_connects_total", "MQTT connections established (including reconnects)")
+DISCONNECTS = metrics.counter("wokwi_mqtt_disconnects_total", "Unexpected MQTT disconnects")
+COMMANDS = metrics.counter("wokwi_mqtt_commands_total", "Actuator commands published")
+COMMAND_MESSAGES = metrics.counter("wokwi_mqtt_command_messages_total",
+                                   "MQTT messages carrying actuator commands (fewer than commands when batched)")
+
+
+def default_client_id(instance=INSTANCE):
+    """Client ID prefix of this host (and instance); services append their name."""
+    return f"wokwi-{socket.gethostname()}" + (f"-{instance}" if instance else "")
+
+
+CLIENT_ID = default_client_id()
+
+
+def paho_client(client_id, clean_session):
+    """Default client factory: a paho client (MQTT 3.1.1 callbacks, as used by the services)."""
+    import paho.mqtt.client as mqtt
+
+    return mqtt.Client(client_id=client_id, clean_session=clean_session)
+
+
+def shared_topic(topic, group):
+    return f"$share/{group}/{topic}"
+
+
+class MqttTransport:
+    def __init__(self, topics=(), on_message=None, broker=MQTT_BROKER, port=MQTT_PORT, pool_size=POOL_SIZE,
+                 group=None, client_id=CLIENT_ID, qos=SUBSCRIBE_QOS, persistent=PERSISTENT_SESSION,
+                 client_factory=paho_client):
+        self.topics = list(topics)
+        self.on_message = on_message
+        self.broker = broker
+        self.port = port
+        self.pool_size = max(1, pool_size)
+        self.group = group or client_id
+        self.client_id = client_id
+        self.qos = qos
+        self.persistent = persistent
+        self.client_factory = client_factory
+        self.clients = []
+        self.connected = 0
+        self._commands = {}  # topic -> {actuator: command}, in arrival order
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._publisher = None
+
+    def subscriptions(self):
+        """(topic filter, qos) pairs each connection subscribes to."""
+        if self.pool_size > 1:
+            return [(shared_topic(topic, self.group), self.qos) for topic in self.topics]
+        return [(topic, self.qos) for topic in self.topics]
+
+    def start(self):
+        """Open the connections in the background; they keep retrying until stop()."""
+        self._stopped = False
+        for i in range(self.pool_size):
+            # Stable IDs so a persistent session is resumed after a restart
+            client = self.client_factory(f"{self.client_id}-{i}", not (self.persistent and self.topics))
+            client.max_inflight_messages_set(MAX_INFLIGHT)
+            client.max_queued_messages_set(MAX_QUEUED)
+            client.reconnect_delay_set(RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY)
+            client.on_connect = self._on_connect
+            client.on_disconnect = self._on_disconnect
+            if self.on_message:
+                client.on_message = self.on_message
+            client.connect_async(self.broker, self.port, KEEPALIVE)
+            client.loop_start()
+            self.clients.append(client)
+        self._publisher = threading.Thread(target=self._publish_loop, name="mqtt-commands", daemon=True)
+        self._publisher.start()
+        log.info("Connecting %d client(s) to %s:%d", self.pool_size, self.broker, self.port)
+        return self
+
+    def stop(self):
+        """Send pending commands, then disconnect every connection."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._publisher:
+            self._publisher.join()
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+        self.clients = []
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            log.warning("MQTT connection refused (rc=%s); retrying", rc)
+            return
+        with self._cond:
+            self.connected += 1
+        CONNECTS.inc()
+        log.info("Connected to MQTT broker %s:%d", self.broker, self.port)
+        # Subscriptions are (re)made on every connect: a new session starts without them
+        if self.topics:
+            client.subscribe(self.subscriptions())
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._cond:
+            self.connected = max(0, self.connected - 1)
+        if rc != 0:
+            DISCONNECTS.inc()
+            log.warning("Lost the MQTT connection (rc=%s); reconnecting with backoff", rc)
+
+    def _client_for(self, topic):
+        # One connection per topic keeps the messages of a topic in order
+        return self.clients[hash(topic) % len(self.clients)]
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """Publish now (queued by paho while disconnected)."""
+        return self._client_for(topic).publish(topic, payload, qos, retain)
+
+    def publish_command(self, topic, command):
+        """Queue an 'ACTn:STATE' command; batched with other commands for the topic."""
+        actuator = command.split(":", 1)[0]
+        with self._cond:
+            commands = self._commands.get(topic)
+            if commands is None:
+                commands = self._commands[topic] = {}
+            commands.pop(actuator, None)  # Keep the order of the newest commands
+            commands[actuator] = command
+            self._cond.notify()
+
+    def _publish_loop(self):
+        while True:
+            with self._cond:
+                while not self._commands and not self._stopped:
+                    self._cond.wait()
+                if not self._commands:
+                    return
+                batches, self._commands = self._commands, {}
+            sent = []
+            for topic, commands in batches.items():
+                try:
+                    sent.append(self.publish(topic, "\n".join(commands.values()), COMMAND_QOS))
+                except Exception as e:
+                    log.error("Error publishing commands to %s: %s", topic, e)
+                    continue
+                COMMANDS.inc(len(commands))
+                COMMAND_MESSAGES.inc()
+            # Commands that arrive until the broker acknowledges these are merged into the next batch
+            for info in sent:
+                try:
+                    info.wait_for_publish(ACK_TIMEOUT)
+                except (RuntimeError, ValueError) as e:
+                    # Not connected or queue full: paho keeps (or dropped) the message, go on
+                    log.debug("Command batch not acknowledged: %s", e)
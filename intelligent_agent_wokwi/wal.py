@@ -0,0 +1,252 @@
+"""
+Write-ahead log for the ingest path.
+
+Every batch of readings is appended to the log and made durable with
+fsync before it is applied to the in-memory buffers, statistics and the
+(lazily flushed) binary storage. After a crash, start-up replays the tail
+of the log to rebuild the buffers and statistics and to re-append
+readings that never reached storage.
+
+Layout: one log shared by all devices, split into segment files
+wal_<number>.log. Each frame is
+
+    <length: uint32> <crc32: uint32> <device id length: uint8> <device id> <records>
+
+where records are storage.RECORD structs and the CRC covers everything
+after the header. A torn or corrupt frame at the end of the log (a crash
+mid-write) is truncated away on open.
+
+Group commit: append() only writes into the file buffer; commit() fsyncs
+once for everything appended so far, so concurrent ingest workers that
+commit at the same time share one fsync, and there is one fsync per
+batch rather than per message.
+
+Retention: segments are rotated at `segment_bytes`, and closed segments
+last written more than `retention` seconds ago are deleted at rotation
+(their readings have long been flushed to storage by then). Replay only
+opens the newest segments that cover the requested time range, so
+restarts stay fast however many segments are kept.
+"""
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+import metrics
+from storage import RECORD
+
+
+# Configuration
+WAL_DIR = "wal"
+SEGMENT_BYTES = 16 * 1024 * 1024  # Rotate segments at this size
+RETENTION = 24 * 3600  # Seconds closed segments are kept
+SEGMENT_PREFIX = "wal_"
+SEGMENT_SUFFIX = ".log"
+
+HEADER = struct.Struct("<II")  # Payload length, CRC32 of the payload
+MAX_DEVICE_ID = 255  # Bytes (UTF-8)
+
+log = logging.getLogger("wal")
+SYNC_SECONDS = metrics.histogram("wokwi_wal_sync_seconds", "Time for one WAL group commit fsync")
+COMMITS = metrics.counter("wokwi_wal_commits_total", "WAL commits requested (one per batch)")
+SYNCS = metrics.counter("wokwi_wal_syncs_total", "WAL fsyncs performed (fewer than commits when they are grouped)")
+
+
+def encode_frame(device_id, readings):
+    """One log frame holding a batch of (timestamp_ns, temp, humidity, flow) readings for a device."""
+    device = device_id.encode("utf-8")
+    if len(device) > MAX_DEVICE_ID:
+        raise ValueError(f"device id longer than {MAX_DEVICE_ID} bytes: {device_id!r}")
+    payload = bytes([len(device)]) + device + b"".join(RECORD.pack(*reading) for reading in readings)
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def iter_frames(data):
+    """
+    Yield (offset, device_id, records bytes) for each valid frame in `data`.
+    Stops at the first torn or corrupt frame; the offset after the last
+    valid frame is returned by the generator (StopIteration.value).
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset + HEADER.size <= len(view):
+        length, crc = HEADER.unpack_from(view, offset)
+        start = offset + HEADER.size
+        payload = view[start:start + length]
+        if len(payload) < length or length < 1 or zlib.crc32(payload) != crc:
+            break
+        device_length = payload[0]
+        records = payload[1 + device_length:]
+        if len(records) % RECORD.size:
+            break
+        yield offset, bytes(payload[1:1 + device_length]).decode("utf-8"), records
+        offset = start + length
+    return offset
+
+
+class WriteAheadLog:
+    def __init__(self, directory=WAL_DIR, segment_bytes=SEGMENT_BYTES, retention=RETENTION, clock=time.time):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention = retention
+        self.clock = clock
+        self._file = None
+        self._number = 0
+        self._written = 0  # Bytes appended in this process (log sequence number)
+        self._synced = 0  # Bytes known to be on disk
+        self._lock = threading.Lock()  # Appends
+        self._sync_lock = threading.Lock()  # fsync and rotation
+
+    def segments(self):
+        """Return the segment file paths, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}")
+
+    def open(self):
+        """Open the newest segment for appending, truncating a torn tail left by a crash."""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.segments()
+        if segments:
+            path = segments[-1]
+            self._number = int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            with open(path, "rb") as f:
+                data = f.read()
+            valid = _valid_length(data)
+            if valid != len(data):
+                log.warning("Truncating %d byte(s) of torn or corrupt log at the end of %s", len(data) - valid, path)
+                with open(path, "r+b") as f:
+                    f.truncate(valid)
+                    os.fsync(f.fileno())
+        else:
+            self._number = 1
+            path = self._segment_path(self._number)
+        self._file = open(path, "ab")
+        return self
+
+    def append(self, device_id, readings):
+        """Buffer a batch for a device; returns the position to pass to commit()."""
+        frame = encode_frame(device_id, readings)
+        with self._lock:
+            self._file.write(frame)
+            self._written += len(frame)
+            return self._written
+
+    def commit(self, position):
+        """Block until everything appended up to `position` is on disk."""
+        COMMITS.inc()
+        with self._sync_lock:
+            if self._synced >= position:
+                return  # Covered by another worker's fsync
+            started = time.perf_counter()
+            with self._lock:
+                self._file.flush()
+                target = self._written
+                size = self._file.tell()
+            os.fsync(self._file.fileno())
+            self._synced = target
+            SYNCS.inc()
+            SYNC_SECONDS.observe(time.perf_counter() - started)
+            if size >= self.segment_bytes:
+                self._rotate()
+
+    def write(self, device_id, readings):
+        """Append and commit one batch."""
+        self.commit(self.append(device_id, readings))
+
+    def _rotate(self):
+        # Called with _sync_lock held; frames appended since the last fsync are synced before closing
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._file.close()
+            self._number += 1
+            self._file = open(self._segment_path(self._number), "ab")
+        self.compact()
+
+    def compact(self):
+        """Delete closed segments last written more than `retention` seconds ago."""
+        cutoff = self.clock() - self.retention
+        removed = 0
+        for path in self.segments()[:-1]:
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError as e:
+                log.error("Error removing log segment %s: %s", path, e)
+        return removed
+
+    def replay(self, since_ns=None):
+        """
+        Yield (device_id, readings) batches in log order, where readings are
+        (timestamp_ns, temp, humidity, flow) tuples. With since_ns, segments
+        that end before it are not read and older readings are skipped.
+        """
+        for path in self._segments_since(since_ns):
+            with open(path, "rb") as f:
+                data = f.read()
+            frames = iter_frames(data)
+            for _, device_id, records in frames:
+                readings = RECORD.iter_unpack(records)
+                if since_ns is not None:
+                    readings = [reading for reading in readings if reading[0] >= since_ns]
+                    if not readings:
+                        continue
+                else:
+                    readings = list(readings)
+                yield device_id, readings
+
+    def _segments_since(self, since_ns):
+        segments = self.segments()
+        if since_ns is None:
+            return segments
+        # Walk back from the newest segment until one starts before since_ns
+        for i in range(len(segments) - 1, -1, -1):
+            first = _first_timestamp(segments[i])
+            if first is not None and first <= since_ns:
+                return segments[i:]
+        return segments
+
+    def close(self):
+        with self._sync_lock:
+            if self._file:
+                with self._lock:
+                    self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+def _valid_length(data):
+    frames = iter_frames(data)
+    while True:
+        try:
+            next(frames)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _first_timestamp(path):
+    """Timestamp of the first reading in a segment, read from its first frame only."""
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        length, _ = HEADER.unpack(header)
+        device_length = f.read(1)
+        if not device_length or length < 1 + device_length[0] + RECORD.size:
+            return None
+        f.seek(device_length[0], os.SEEK_CUR)
+        record = f.read(RECORD.size)
+    return RECORD.unpack(record)[0] if len(record) == RECORD.size else None
@@ -1,16 +1,24 @@
 // Configuration
-const NODERED_WS = 'ws://localhost:1880/ws/sensors';
-const NODERED_API = 'http://localhost:1880/api';
+// Actuator gateway of the backend (python backend_service.py, see gateway.py);
+// the Node-RED flow in nodered/flows.json serves the same endpoints on the same port
+const GATEWAY_WS = 'ws://localhost:1880/ws/sensors';
+const GATEWAY_API = 'http://localhost:1880/api';
+// Set to the fan-out hub (python hub.py) to share one broker subscription
+// between all open dashboards, e.g. 'http://localhost:8001/events?rate=2'
+const HUB_EVENTS = null;
+// Readings stored by the backend (python web/server.py), fetched after an outage
+const DEVICE_ID = 'sayf_project'; // Device whose readings are cached and synced
+const SYNC_API = `/api/readings?device=${DEVICE_ID}`;
 
 // State
 let isAgentRunning = true;
-let chartData = {
-    labels: [],
-    temp: [],
-    humidity: [],
-    flow: []
-};
-const MAX_DATA_POINTS = 20;
+const CHART_WINDOW_MS = 60 * 1000; // Time span shown in the charts (can be hours)
+const MAX_CHART_POINTS = 300; // Longer windows are decimated to about this many points
+const HISTORY_CAPACITY = 262144; // Samples kept in memory (~1.5 h at 50 Hz, 5 MB)
+const MAX_LOG_ENTRIES = 200;
+const samples = new SeriesRing(HISTORY_CAPACITY, ['temp', 'humidity', 'flow']);
+let latestData = null;
+let pendingRecommendations = null;
 
 // DOM Elements
 const tempValue = document.getElementById('temp-value');
@@ -25,6 +33,7 @@ const toggleAgentBtn = document.getElementById('toggle-agent');
 const commonChartOptions = {
     responsive: true,
     maintainAspectRatio: false,
+    animation: false,
     plugins: {
         legend: { display: false }
     },
@@ -44,10 +53,10 @@ const commonChartOptions = {
 const tempChart = new Chart(document.getElementById('tempChart'), {
     type: 'line',
     data: {
-        labels: chartData.labels,
+        labels: [],
         datasets: [{
             label: 'Temperature',
-            data: chartData.temp,
+            data: [],
             borderColor: '#ef4444',
             backgroundColor: 'rgba(239, 68, 68, 0.1)',
             fill: true
@@ -59,10 +68,10 @@ const tempChart = new Chart(document.getElementById('tempChart'), {
 const humidityChart = new Chart(document.getElementById('humidityChart'), {
     type: 'line',
     data: {
-        labels: chartData.labels,
+        labels: [],
         datasets: [{
             label: 'Humidity',
-            data: chartData.humidity,
+            data: [],
             borderColor: '#38bdf8',
             backgroundColor: 'rgba(56, 189, 248, 0.1)',
             fill: true
@@ -74,10 +83,10 @@ const humidityChart = new Chart(document.getElementById('humidityChart'), {
 const flowChart = new Chart(document.getElementById('flowChart'), {
     type: 'line',
     data: {
-        labels: chartData.labels,
+        labels: [],
         datasets: [{
             label: 'Water Flow',
-            data: chartData.flow,
+            data: [],
             borderColor: '#22c55e',
             backgroundColor: 'rgba(34, 197, 94, 0.1)',
             fill: true
@@ -86,13 +95,54 @@ const flowChart = new Chart(document.getElementById('flowChart'), {
     options: commonChartOptions
 });
 
-// WebSocket Connection to Node-RED
+const charts = [
+    { chart: tempChart, decimator: new MinMaxDecimator(samples, 'temp', CHART_WINDOW_MS, MAX_CHART_POINTS) },
+    { chart: humidityChart, decimator: new MinMaxDecimator(samples, 'humidity', CHART_WINDOW_MS, MAX_CHART_POINTS) },
+    { chart: flowChart, decimator: new MinMaxDecimator(samples, 'flow', CHART_WINDOW_MS, MAX_CHART_POINTS) }
+];
+const scheduleRender = frameScheduler(renderDashboard);
+
+// Offline cache: cached history is drawn first, then only missed readings are fetched
+const readingCache = new ReadingCache();
+
+function addReadings(readings) {
+    readings.forEach((reading) => {
+        if (reading.time >= samples.lastTime()) samples.push(reading.time, reading);
+    });
+    if (readings.length) {
+        latestData = readings[readings.length - 1];
+        scheduleRender();
+    }
+}
+
+function loadHistory() {
+    return readingCache.store.readRecent(DEVICE_ID, CHART_WINDOW_MS)
+        .then((readings) => {
+            addReadings(readings);
+            if (readings.length) log('system', `Restored ${readings.length} cached readings.`);
+        })
+        .catch((e) => console.error('Error reading cached readings', e));
+}
+
+function syncHistory() {
+    return syncReadings(readingCache.store, SYNC_API, DEVICE_ID)
+        .then((readings) => {
+            addReadings(readings);
+            if (readings.length) log('info', `Synced ${readings.length} missed readings.`);
+        })
+        .catch((e) => console.log('History sync unavailable:', e.message));
+}
+
+// WebSocket Connection to the gateway
+let socket = null;
+
 function connectWebSocket() {
-    log('system', 'Connecting to Node-RED WebSocket...');
-    const ws = new WebSocket(NODERED_WS);
+    if (socket && socket.readyState <= WebSocket.OPEN) return;
+    log('system', 'Connecting to gateway WebSocket...');
+    const ws = socket = new WebSocket(GATEWAY_WS);
 
     ws.onopen = () => {
-        log('info', 'Connected to Node-RED');
+        log('info', 'Connected to gateway');
         mqttStatus.classList.remove('disconnected');
         mqttStatus.classList.add('connected');
         mqttStatusText.textContent = 'Connected';
@@ -101,7 +151,6 @@ function connectWebSocket() {
     ws.onmessage = (event) => {
         try {
             const data = JSON.parse(event.data);
-            console.log('Data received from Node-RED:', data);
             log('info', `Data received: Temp=${data.temp}°C, Humidity=${data.humidity}%, Flow=${data.flow}L/h`);
             updateDashboard(data);
             if (isAgentRunning) {
@@ -128,6 +177,40 @@ function connectWebSocket() {
     };
 }
 
+// Server-Sent Events from the fan-out hub (alternative to the gateway WebSocket)
+function connectHub() {
+    log('system', 'Connecting to dashboard hub...');
+    const source = new EventSource(HUB_EVENTS);
+
+    source.onopen = () => {
+        log('info', 'Connected to dashboard hub');
+        mqttStatus.classList.remove('disconnected');
+        mqttStatus.classList.add('connected');
+        mqttStatusText.textContent = 'Connected';
+    };
+
+    // Recent readings sent once on connect: fill the charts without re-running the agent
+    source.addEventListener('snapshot', (event) => {
+        const snapshot = JSON.parse(event.data);
+        snapshot.readings.forEach((data) => updateDashboard(data));
+    });
+
+    source.addEventListener('reading', (event) => {
+        const data = JSON.parse(event.data);
+        updateDashboard(data);
+        if (isAgentRunning) {
+            runAgentLogic(data);
+        }
+    });
+
+    // EventSource reconnects by itself; just reflect the state
+    source.onerror = () => {
+        mqttStatus.classList.add('disconnected');
+        mqttStatus.classList.remove('connected');
+        mqttStatusText.textContent = 'Reconnecting...';
+    };
+}
+
 // Offline/Online Detection
 window.addEventListener('offline', () => {
     log('alert', '📴 App is OFFLINE. Showing cached data only.');
@@ -139,49 +222,95 @@ window.addEventListener('offline', () => {
 window.addEventListener('online', () => {
     log('info', '🌐 App is ONLINE. Reconnecting...');
     mqttStatusText.textContent = 'Reconnecting...';
-    setTimeout(() => {
-        location.reload();
-    }, 1000);
+    // Fetch only what was missed while offline, then resume live data
+    syncHistory().then(() => {
+        if (!HUB_EVENTS) connectWebSocket();
+    });
 });
 
 // Check initial online status
 if (!navigator.onLine) {
     log('alert', '📴 App started in OFFLINE mode. Showing cached data only.');
     mqttStatusText.textContent = 'Offline Mode';
+    loadHistory();
 } else {
-    connectWebSocket();
+    loadHistory()
+        .then(syncHistory)
+        .then(HUB_EVENTS ? connectHub : connectWebSocket);
 }
 
 // Dashboard Updates
-function updateDashboard(data) {
-    const timestamp = new Date().toLocaleTimeString();
-
-    // Update Values
-    tempValue.textContent = `${data.temp.toFixed(1)} °C`;
-    humidityValue.textContent = `${data.humidity.toFixed(1)} %`;
-    flowValue.textContent = `${data.flow.toFixed(1)} L/h`;
-
-    // Update Charts
-    if (chartData.labels.length > MAX_DATA_POINTS) {
-        chartData.labels.shift();
-        chartData.temp.shift();
-        chartData.humidity.shift();
-        chartData.flow.shift();
+// Incoming samples are only recorded; values and charts are redrawn at most once per frame
+function updateDashboard(data, t = readingTime(data)) {
+    readingCache.record(data.device || DEVICE_ID, t, data);
+    if (t >= samples.lastTime()) samples.push(t, data);
+    latestData = data;
+    scheduleRender();
+}
+
+function renderDashboard() {
+    if (latestData) {
+        tempValue.textContent = `${latestData.temp.toFixed(1)} °C`;
+        humidityValue.textContent = `${latestData.humidity.toFixed(1)} %`;
+        flowValue.textContent = `${latestData.flow.toFixed(1)} L/h`;
     }
 
-    chartData.labels.push(timestamp);
-    chartData.temp.push(data.temp);
-    chartData.humidity.push(data.humidity);
-    chartData.flow.push(data.flow);
+    charts.forEach(({ chart, decimator }) => {
+        decimator.update();
+        const { times, values } = decimator.points();
+        chart.data.labels = times.map(formatTime);
+        chart.data.datasets[0].data = values;
+        chart.update('none');
+    });
 
-    tempChart.update();
-    humidityChart.update();
-    flowChart.update();
+    if (pendingRecommendations) {
+        updateRecommendations(...pendingRecommendations);
+        pendingRecommendations = null;
+    }
 }
 
 // Agent Logic
-let lastAct1State = false;
-let lastAct2State = false;
+// Actuator state: commands are sent only on transitions, with hysteresis
+// around the thresholds, a minimum dwell time and a periodic resync
+const TEMP_HYSTERESIS = 1.0; // °C below the threshold before LED 1 turns off
+const FLOW_HYSTERESIS = 5.0; // L/h below the threshold before LED 2 turns off
+const MIN_DWELL_MS = 5000; // An actuator holds a state at least this long
+const RESYNC_INTERVAL_MS = 60000; // Re-send the full state this often
+const actuators = {
+    ACT1: { level: null, on: null, changedAt: 0 },
+    ACT2: { level: null, on: null, changedAt: 0 }
+};
+let lastResync = Date.now();
+
+// Returns true if the actuator changed state (and the command was sent)
+function updateActuator(name, value, threshold, hysteresis) {
+    const act = actuators[name];
+    if (value > threshold) {
+        act.level = true;
+    } else if (act.level === null || value < threshold - hysteresis) {
+        act.level = false;
+    }
+
+    const now = Date.now();
+    if (act.level === act.on) return false;
+    if (act.on !== null && now - act.changedAt < MIN_DWELL_MS) return false;
+
+    act.on = act.level;
+    act.changedAt = now;
+    sendActuatorCommand(`${name}:${act.on ? 'ON' : 'OFF'}`);
+    return true;
+}
+
+function resyncActuators() {
+    const now = Date.now();
+    if (now - lastResync < RESYNC_INTERVAL_MS) return;
+    lastResync = now;
+    Object.entries(actuators).forEach(([name, act]) => {
+        if (act.on !== null) {
+            sendActuatorCommand(`${name}:${act.on ? 'ON' : 'OFF'}`);
+        }
+    });
+}
 
 function runAgentLogic(data) {
     const tempThreshold = parseFloat(document.getElementById('temp-threshold').value);
@@ -203,12 +332,6 @@ function runAgentLogic(data) {
             title: 'Critical Temperature Alert',
             text: `Temperature at ${data.temp.toFixed(1)}°C exceeds maximum threshold of ${tempThreshold}°C. Immediate actions: (1) Activate cooling system, (2) Check ventilation systems, (3) Reduce heat-generating equipment, (4) Monitor for equipment overheating, (5) Ensure proper airflow.`
         });
-
-        if (!lastAct1State) {
-            sendActuatorCommand('ACT1:ON');
-            log('action', `[AGENT] High Temp (${data.temp.toFixed(1)}°C) > ${tempThreshold}°C. ACTIVATING LED 1.`);
-            lastAct1State = true;
-        }
     } else if (data.temp < tempMinThreshold) {
         hasAlert = true;
         recommendations.push({
@@ -217,11 +340,13 @@ function runAgentLogic(data) {
             title: 'Low Temperature Warning',
             text: `Temperature at ${data.temp.toFixed(1)}°C is below minimum threshold of ${tempMinThreshold}°C. Recommended actions: (1) Activate heating system, (2) Check insulation, (3) Close windows/doors, (4) Monitor for freezing conditions, (5) Protect sensitive equipment.`
         });
-    } else {
-        if (lastAct1State) {
-            sendActuatorCommand('ACT1:OFF');
+    }
+
+    if (updateActuator('ACT1', data.temp, tempThreshold, TEMP_HYSTERESIS)) {
+        if (actuators.ACT1.on) {
+            log('action', `[AGENT] High Temp (${data.temp.toFixed(1)}°C) > ${tempThreshold}°C. ACTIVATING LED 1.`);
+        } else {
             log('info', `[AGENT] Temp normalized (${data.temp.toFixed(1)}°C). Deactivating LED 1.`);
-            lastAct1State = false;
         }
     }
 
@@ -253,12 +378,6 @@ function runAgentLogic(data) {
             title: 'High Water Flow Alert',
             text: `Water flow at ${data.flow.toFixed(1)} L/h exceeds maximum threshold of ${flowThreshold} L/h. Immediate actions: (1) Check for leaks in the system, (2) Inspect all valves and connections, (3) Verify pump settings, (4) Monitor water pressure, (5) Shut off if necessary.`
         });
-
-        if (!lastAct2State) {
-            sendActuatorCommand('ACT2:ON');
-            log('action', `[AGENT] High Flow (${data.flow.toFixed(1)} L/h) > ${flowThreshold} L/h. ACTIVATING LED 2.`);
-            lastAct2State = true;
-        }
     } else if (data.flow < flowMinThreshold) {
         hasAlert = true;
         recommendations.push({
@@ -267,16 +386,20 @@ function runAgentLogic(data) {
             title: 'Low Water Flow Warning',
             text: `Water flow at ${data.flow.toFixed(1)} L/h is below minimum threshold of ${flowMinThreshold} L/h. Recommended actions: (1) Check for blockages, (2) Verify pump operation, (3) Inspect inlet filters, (4) Check water supply, (5) Monitor system pressure.`
         });
-    } else {
-        if (lastAct2State) {
-            sendActuatorCommand('ACT2:OFF');
+    }
+
+    if (updateActuator('ACT2', data.flow, flowThreshold, FLOW_HYSTERESIS)) {
+        if (actuators.ACT2.on) {
+            log('action', `[AGENT] High Flow (${data.flow.toFixed(1)} L/h) > ${flowThreshold} L/h. ACTIVATING LED 2.`);
+        } else {
             log('info', `[AGENT] Flow normalized (${data.flow.toFixed(1)} L/h). Deactivating LED 2.`);
-            lastAct2State = false;
         }
     }
+    resyncActuators();
 
-    // Update recommendations display
-    updateRecommendations(recommendations, hasAlert, data);
+    // Update recommendations display on the next frame
+    pendingRecommendations = [recommendations, hasAlert, data];
+    scheduleRender();
 }
 
 function updateRecommendations(recommendations, hasAlert, data) {
@@ -343,9 +466,9 @@ function updateRecommendations(recommendations, hasAlert, data) {
     }
 }
 
-// Send Actuator Command via HTTP to Node-RED
+// Send Actuator Command via HTTP to the gateway
 function sendActuatorCommand(command) {
-    fetch(`${NODERED_API}/actuator`, {
+    fetch(`${GATEWAY_API}/actuator`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
@@ -368,6 +491,9 @@ function log(type, message) {
     entry.className = `log-entry ${type}`;
     entry.textContent = `[${new Date().toLocaleTimeString()}] ${message}`;
     logContainer.appendChild(entry);
+    while (logContainer.childElementCount > MAX_LOG_ENTRIES) {
+        logContainer.removeChild(logContainer.firstElementChild);
+    }
     logContainer.scrollTop = logContainer.scrollHeight;
 }
 
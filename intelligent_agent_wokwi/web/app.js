@@ -2,16 +2,18 @@
 const MQTT_BROKER = 'wss://test.mosquitto.org:8081'; // WebSocket port for browser
 const TOPIC_SENSORS = 'wokwi/sensors/sayf_project';
 const TOPIC_ACTUATORS = 'wokwi/actuators/sayf_project';
+// Readings stored by the backend (python web/server.py), fetched after an outage
+const DEVICE_ID = 'sayf_project'; // Device whose readings are cached and synced
+const SYNC_API = `/api/readings?device=${DEVICE_ID}`;
 
 // State
 let isAgentRunning = true;
-let chartData = {
-    labels: [],
-    temp: [],
-    humidity: [],
-    flow: []
-};
-const MAX_DATA_POINTS = 20;
+const CHART_WINDOW_MS = 60 * 1000; // Time span shown in the charts (can be hours)
+const MAX_CHART_POINTS = 300; // Longer windows are decimated to about this many points
+const HISTORY_CAPACITY = 262144; // Samples kept in memory (~1.5 h at 50 Hz, 5 MB)
+const MAX_LOG_ENTRIES = 200;
+const samples = new SeriesRing(HISTORY_CAPACITY, ['temp', 'humidity', 'flow']);
+let latestData = null;
 
 // DOM Elements
 const tempValue = document.getElementById('temp-value');
@@ -28,6 +30,7 @@ const flowThresholdInput = document.getElementById('flow-threshold');
 const commonChartOptions = {
     responsive: true,
     maintainAspectRatio: false,
+    animation: false,
     plugins: {
         legend: { display: false }
     },
@@ -47,10 +50,10 @@ const commonChartOptions = {
 const tempChart = new Chart(document.getElementById('tempChart'), {
     type: 'line',
     data: {
-        labels: chartData.labels,
+        labels: [],
         datasets: [{
             label: 'Temperature',
-            data: chartData.temp,
+            data: [],
             borderColor: '#ef4444',
             backgroundColor: 'rgba(239, 68, 68, 0.1)',
             fill: true
@@ -62,10 +65,10 @@ const tempChart = new Chart(document.getElementById('tempChart'), {
 const humidityChart = new Chart(document.getElementById('humidityChart'), {
     type: 'line',
     data: {
-        labels: chartData.labels,
+        labels: [],
         datasets: [{
             label: 'Humidity',
-            data: chartData.humidity,
+            data: [],
             borderColor: '#38bdf8',
             backgroundColor: 'rgba(56, 189, 248, 0.1)',
             fill: true
@@ -77,10 +80,10 @@ const humidityChart = new Chart(document.getElementById('humidityChart'), {
 const flowChart = new Chart(document.getElementById('flowChart'), {
     type: 'line',
     data: {
-        labels: chartData.labels,
+        labels: [],
         datasets: [{
             label: 'Water Flow',
-            data: chartData.flow,
+            data: [],
             borderColor: '#22c55e',
             backgroundColor: 'rgba(34, 197, 94, 0.1)',
             fill: true
@@ -89,6 +92,44 @@ const flowChart = new Chart(document.getElementById('flowChart'), {
     options: commonChartOptions
 });
 
+const charts = [
+    { chart: tempChart, decimator: new MinMaxDecimator(samples, 'temp', CHART_WINDOW_MS, MAX_CHART_POINTS) },
+    { chart: humidityChart, decimator: new MinMaxDecimator(samples, 'humidity', CHART_WINDOW_MS, MAX_CHART_POINTS) },
+    { chart: flowChart, decimator: new MinMaxDecimator(samples, 'flow', CHART_WINDOW_MS, MAX_CHART_POINTS) }
+];
+const scheduleRender = frameScheduler(renderDashboard);
+
+// Offline cache: cached history is drawn first, then only missed readings are fetched
+const readingCache = new ReadingCache();
+
+function addReadings(readings) {
+    readings.forEach((reading) => {
+        if (reading.time >= samples.lastTime()) samples.push(reading.time, reading);
+    });
+    if (readings.length) {
+        latestData = readings[readings.length - 1];
+        scheduleRender();
+    }
+}
+
+function loadHistory() {
+    return readingCache.store.readRecent(DEVICE_ID, CHART_WINDOW_MS)
+        .then((readings) => {
+            addReadings(readings);
+            if (readings.length) log('system', `Restored ${readings.length} cached readings.`);
+        })
+        .catch((e) => console.error('Error reading cached readings', e));
+}
+
+function syncHistory() {
+    return syncReadings(readingCache.store, SYNC_API, DEVICE_ID)
+        .then((readings) => {
+            addReadings(readings);
+            if (readings.length) log('info', `Synced ${readings.length} missed readings.`);
+        })
+        .catch((e) => console.log('History sync unavailable:', e.message));
+}
+
 // MQTT Connection
 log('system', 'Connecting to MQTT Broker...');
 const client = mqtt.connect(MQTT_BROKER);
@@ -107,13 +148,9 @@ client.on('connect', () => {
 });
 
 client.on('message', (topic, message) => {
-    console.log('MQTT Message received on topic:', topic);
-    console.log('Raw message:', message.toString());
-
     if (topic === TOPIC_SENSORS) {
         try {
             const data = JSON.parse(message.toString());
-            console.log('Parsed data:', data);
             log('info', `Data received: Temp=${data.temp}°C, Humidity=${data.humidity}%, Flow=${data.flow}L/h`);
             updateDashboard(data);
             if (isAgentRunning) {
@@ -144,81 +181,110 @@ window.addEventListener('offline', () => {
 window.addEventListener('online', () => {
     log('info', '🌐 App is ONLINE. Reconnecting...');
     mqttStatusText.textContent = 'Reconnecting...';
-    setTimeout(() => {
-        location.reload();
-    }, 1000);
+    // The MQTT client reconnects by itself; fetch only what was missed while offline
+    syncHistory();
 });
 
 // Check initial online status
 if (!navigator.onLine) {
     log('alert', '📴 App started in OFFLINE mode. Showing cached data only.');
     mqttStatusText.textContent = 'Offline Mode';
+    loadHistory();
+} else {
+    loadHistory().then(syncHistory);
 }
 
 // Dashboard Updates
-function updateDashboard(data) {
-    const timestamp = new Date().toLocaleTimeString();
-
-    // Update Values
-    tempValue.textContent = `${data.temp.toFixed(1)} °C`;
-    humidityValue.textContent = `${data.humidity.toFixed(1)} %`;
-    flowValue.textContent = `${data.flow.toFixed(1)} L/h`;
-
-    // Update Charts
-    if (chartData.labels.length > MAX_DATA_POINTS) {
-        chartData.labels.shift();
-        chartData.temp.shift();
-        chartData.humidity.shift();
-        chartData.flow.shift();
-    }
+// Incoming samples are only recorded; values and charts are redrawn at most once per frame
+function updateDashboard(data, t = readingTime(data)) {
+    readingCache.record(data.device || DEVICE_ID, t, data);
+    if (t >= samples.lastTime()) samples.push(t, data);
+    latestData = data;
+    scheduleRender();
+}
 
-    chartData.labels.push(timestamp);
-    chartData.temp.push(data.temp);
-    chartData.humidity.push(data.humidity);
-    chartData.flow.push(data.flow);
+function renderDashboard() {
+    if (latestData) {
+        tempValue.textContent = `${latestData.temp.toFixed(1)} °C`;
+        humidityValue.textContent = `${latestData.humidity.toFixed(1)} %`;
+        flowValue.textContent = `${latestData.flow.toFixed(1)} L/h`;
+    }
 
-    tempChart.update();
-    humidityChart.update();
-    flowChart.update();
+    charts.forEach(({ chart, decimator }) => {
+        decimator.update();
+        const { times, values } = decimator.points();
+        chart.data.labels = times.map(formatTime);
+        chart.data.datasets[0].data = values;
+        chart.update('none');
+    });
 }
 
 // Agent Logic
-let lastAct1State = false;
-let lastAct2State = false;
+// Actuator state: commands are sent only on transitions, with hysteresis
+// around the thresholds, a minimum dwell time and a periodic resync
+const TEMP_HYSTERESIS = 1.0; // °C below the threshold before LED 1 turns off
+const FLOW_HYSTERESIS = 5.0; // L/h below the threshold before LED 2 turns off
+const MIN_DWELL_MS = 5000; // An actuator holds a state at least this long
+const RESYNC_INTERVAL_MS = 60000; // Re-send the full state this often
+const actuators = {
+    ACT1: { level: null, on: null, changedAt: 0 },
+    ACT2: { level: null, on: null, changedAt: 0 }
+};
+let lastResync = Date.now();
+
+// Returns true if the actuator changed state (and the command was sent)
+function updateActuator(name, value, threshold, hysteresis) {
+    const act = actuators[name];
+    if (value > threshold) {
+        act.level = true;
+    } else if (act.level === null || value < threshold - hysteresis) {
+        act.level = false;
+    }
+
+    const now = Date.now();
+    if (act.level === act.on) return false;
+    if (act.on !== null && now - act.changedAt < MIN_DWELL_MS) return false;
+
+    act.on = act.level;
+    act.changedAt = now;
+    client.publish(TOPIC_ACTUATORS, `${name}:${act.on ? 'ON' : 'OFF'}`);
+    return true;
+}
+
+function resyncActuators() {
+    const now = Date.now();
+    if (now - lastResync < RESYNC_INTERVAL_MS) return;
+    lastResync = now;
+    Object.entries(actuators).forEach(([name, act]) => {
+        if (act.on !== null) {
+            client.publish(TOPIC_ACTUATORS, `${name}:${act.on ? 'ON' : 'OFF'}`);
+        }
+    });
+}
 
 function runAgentLogic(data) {
     const tempThreshold = parseFloat(tempThresholdInput.value);
     const flowThreshold = parseFloat(flowThresholdInput.value);
 
     // Actuator 1 (Temperature)
-    if (data.temp > tempThreshold) {
-        if (!lastAct1State) {
-            client.publish(TOPIC_ACTUATORS, 'ACT1:ON');
+    if (updateActuator('ACT1', data.temp, tempThreshold, TEMP_HYSTERESIS)) {
+        if (actuators.ACT1.on) {
             log('action', `[AGENT] High Temp (${data.temp}°C) > ${tempThreshold}°C. ACTIVATING LED 1.`);
-            lastAct1State = true;
-        }
-    } else {
-        if (lastAct1State) {
-            client.publish(TOPIC_ACTUATORS, 'ACT1:OFF');
+        } else {
             log('info', `[AGENT] Temp normalized. Deactivating LED 1.`);
-            lastAct1State = false;
         }
     }
 
     // Actuator 2 (Flow)
-    if (data.flow > flowThreshold) {
-        if (!lastAct2State) {
-            client.publish(TOPIC_ACTUATORS, 'ACT2:ON');
+    if (updateActuator('ACT2', data.flow, flowThreshold, FLOW_HYSTERESIS)) {
+        if (actuators.ACT2.on) {
             log('action', `[AGENT] High Flow (${data.flow} L/h) > ${flowThreshold} L/h. ACTIVATING LED 2.`);
-            lastAct2State = true;
-        }
-    } else {
-        if (lastAct2State) {
-            client.publish(TOPIC_ACTUATORS, 'ACT2:OFF');
+        } else {
             log('info', `[AGENT] Flow normalized. Deactivating LED 2.`);
-            lastAct2State = false;
         }
     }
+
+    resyncActuators();
 }
 
 // Helper Functions
@@ -227,6 +293,9 @@ function log(type, message) {
     entry.className = `log-entry ${type}`;
     entry.textContent = `[${new Date().toLocaleTimeString()}] ${message}`;
     logContainer.appendChild(entry);
+    while (logContainer.childElementCount > MAX_LOG_ENTRIES) {
+        logContainer.removeChild(logContainer.firstElementChild);
+    }
     logContainer.scrollTop = logContainer.scrollHeight;
 }
 
@@ -0,0 +1,113 @@
+// Chart data structures shared by app.js and app-nodered.js
+//
+// Samples are kept in a fixed-capacity ring of typed arrays, so storing
+// one costs O(1) and memory stays constant however long the page is open.
+// Charts are not fed every sample: a MinMaxDecimator summarises the chart
+// window into time-aligned buckets, keeping the lowest and highest sample of
+// each bucket so spikes stay visible, and only scans samples added since
+// its last update.
+
+class SeriesRing {
+    constructor(capacity, keys) {
+        this.capacity = capacity;
+        this.times = new Float64Array(capacity); // epoch ms
+        this.columns = {};
+        keys.forEach((key) => {
+            this.columns[key] = new Float32Array(capacity);
+        });
+        this.written = 0; // Total samples ever pushed
+    }
+
+    push(time, data) {
+        const i = this.written % this.capacity;
+        this.times[i] = time;
+        for (const key in this.columns) {
+            this.columns[key][i] = data[key];
+        }
+        this.written++;
+    }
+
+    // Logical index of the oldest retained sample
+    get first() {
+        return Math.max(0, this.written - this.capacity);
+    }
+
+    lastTime() {
+        return this.written ? this.times[(this.written - 1) % this.capacity] : 0;
+    }
+}
+
+class MinMaxDecimator {
+    constructor(ring, key, windowMs, maxPoints) {
+        this.ring = ring;
+        this.key = key;
+        this.windowMs = windowMs;
+        // Two points (min and max) per bucket
+        this.width = windowMs / Math.max(1, Math.floor(maxPoints / 2));
+        this.buckets = []; // { index, minT, minV, maxT, maxV }, oldest first
+        this.scanned = 0;
+    }
+
+    update() {
+        const ring = this.ring;
+        const column = ring.columns[this.key];
+        this.scanned = Math.max(this.scanned, ring.first);
+        for (; this.scanned < ring.written; this.scanned++) {
+            const i = this.scanned % ring.capacity;
+            const t = ring.times[i];
+            const v = column[i];
+            const index = Math.floor(t / this.width);
+            const last = this.buckets[this.buckets.length - 1];
+            if (!last || index > last.index) {
+                this.buckets.push({ index, minT: t, minV: v, maxT: t, maxV: v });
+                continue;
+            }
+            if (v < last.minV) { last.minV = v; last.minT = t; }
+            if (v > last.maxV) { last.maxV = v; last.maxT = t; }
+        }
+
+        // Forget buckets that scrolled out of the window
+        const cutoff = Math.floor((ring.lastTime() - this.windowMs) / this.width);
+        let expired = 0;
+        while (expired < this.buckets.length && this.buckets[expired].index < cutoff) expired++;
+        if (expired) this.buckets.splice(0, expired);
+    }
+
+    // Points to draw, in time order
+    points() {
+        const times = [];
+        const values = [];
+        this.buckets.forEach((b) => {
+            if (b.minT === b.maxT) {
+                times.push(b.minT);
+                values.push(b.minV);
+            } else if (b.minT < b.maxT) {
+                times.push(b.minT, b.maxT);
+                values.push(b.minV, b.maxV);
+            } else {
+                times.push(b.maxT, b.minT);
+                values.push(b.maxV, b.minV);
+            }
+        });
+        return { times, values };
+    }
+}
+
+function formatTime(ms) {
+    const d = new Date(ms);
+    const pad = (n) => (n < 10 ? '0' : '') + n;
+    return `${pad(d.getHours())}:${pad(d.getMinutes())}:${pad(d.getSeconds())}`;
+}
+
+// Runs `callback` at most once per animation frame, however often it is requested
+function frameScheduler(callback) {
+    let pending = false;
+    return () => {
+        if (pending) return;
+        pending = true;
+        requestAnimationFrame(() => {
+            pending = false;
+            callback();
+        });
+    };
+}
@@ -1,20 +1,128 @@
 #!/usr/bin/env python3
 """
-Simple HTTP Server for Wokwi Agent Web Interface
+HTTP Server for Wokwi Agent Web Interface
 Serves the web interface on http://localhost:8000/
+
+Each request is handled on its own thread. Static files are kept in memory
+together with a gzip copy, an ETag and a Last-Modified date, and are
+reloaded when they change on disk; clients revalidate with conditional
+GETs and get 304 responses for unchanged files.
+
+JSON API (reads the backend's binary storage, see history.py and rollups.py):
+    /api/devices                      device IDs with stored data
+    /api/latest[?device=ID]           newest stored reading per device
+    /api/history?device=ID&metric=temperature[&start=S&end=S&points=N]
+                                      downsampled history between two epoch
+                                      times in seconds (default: last hour)
+    /api/readings?device=ID&since=MS  raw readings newer than an epoch time in
+                                      milliseconds, oldest first, at most
+                                      MAX_SYNC_READINGS per response (the
+                                      dashboards' incremental sync); when
+                                      there are more, fetch the next page
+                                      with &since_ns=<next_ns of the response>
 """
 
+import gzip
+import hashlib
 import http.server
-import socketserver
+import json
+import mimetypes
 import os
+import sys
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qs, urlsplit
 
-PORT = 8000
 DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIRECTORY = os.path.dirname(DIRECTORY)
+sys.path.insert(0, PROJECT_DIRECTORY)
+
+import history
+import rollups
+import storage
+
+PORT = 8000
+DATA_DIR = os.path.join(PROJECT_DIRECTORY, storage.DATA_DIR)  # Where backend_service.py stores readings
+STATIC_EXTENSIONS = {".html", ".js", ".css", ".json", ".png", ".ico", ".svg"}
+COMPRESS_MIN_SIZE = 1024  # Smaller responses are sent uncompressed
+HISTORY_WINDOW = 3600  # Default /api/history range in seconds
+HISTORY_POINTS = 500
+MAX_HISTORY_POINTS = 5000
+MAX_SYNC_READINGS = 10000
+
+# Pages and the service worker must be revalidated on every load so updates show up;
+# other assets may be reused for a while and are then revalidated with their ETag
+NO_CACHE_FILES = {"index.html", "index-nodered.html", "service-worker.js", "manifest.json"}
+CACHE_MAX_AGE = {".png": 7 * 86400, ".ico": 7 * 86400, ".svg": 7 * 86400, ".js": 3600, ".css": 3600}
+
+
+class StaticAsset:
+    """A file held in memory with its validators and an optional gzip copy."""
+
+    def __init__(self, name, path):
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.mtime = stat.st_mtime
+        self.size = stat.st_size
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()[:16]
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type.endswith(("javascript", "json")):
+            self.content_type += "; charset=utf-8"
+        extension = os.path.splitext(name)[1]
+        if name in NO_CACHE_FILES:
+            self.cache_control = "no-cache"
+        else:
+            self.cache_control = f"public, max-age={CACHE_MAX_AGE.get(extension, 0)}"
+
+        # Keep the compressed copy only if it is meaningfully smaller (PNGs usually are not)
+        self.gzip_body = None
+        if len(self.body) >= COMPRESS_MIN_SIZE:
+            compressed = gzip.compress(self.body, 9, mtime=0)
+            if len(compressed) < len(self.body) * 0.9:
+                self.gzip_body = compressed
+
+
+class AssetCache:
+    """Loads static files on first use and reloads them when they change on disk."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        if os.path.splitext(name)[1] not in STATIC_EXTENSIONS or name != os.path.basename(name):
+            return None
+        path = os.path.join(self.directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        asset = self._assets.get(name)
+        if asset is None or asset.mtime != stat.st_mtime or asset.size != stat.st_size:
+            with self._lock:
+                asset = StaticAsset(name, path)
+                self._assets[name] = asset
+        return asset
+
+
+def _epoch_ns(value, default):
+    return int(float(value) * 1e9) if value else default
+
+
+def _reading(row):
+    timestamp_ns, temp, humidity, flow = row
+    return {"timestamp": timestamp_ns / 1e9, "temperature": temp, "humidity": humidity, "flow": flow}
+
+
+class DashboardRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive: browsers reuse one connection per dashboard
+    assets = AssetCache(DIRECTORY)
+    data_dir = DATA_DIR
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, directory=DIRECTORY, **kwargs)
-    
     def end_headers(self):
         # Add CORS headers to allow WebSocket connections
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -22,20 +130,151 @@ class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         super().end_headers()
 
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        url = urlsplit(self.path)
+        if url.path.startswith("/api/"):
+            self.handle_api(url.path, parse_qs(url.query), head)
+            return
+
+        name = url.path.lstrip("/") or "index.html"
+        asset = self.assets.get(name)
+        if asset is None:
+            self.send_body(404, b"Not Found", "text/plain; charset=utf-8", head=head)
+            return
+
+        headers = {
+            "ETag": asset.etag,
+            "Last-Modified": asset.last_modified,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self.not_modified(asset):
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_body(200, asset.body, asset.content_type, headers, asset.gzip_body, head)
+
+    def not_modified(self, asset):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return asset.etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(asset.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_body(self, status, body, content_type, headers=None, gzip_body=None, head=False):
+        if gzip_body is None and len(body) >= COMPRESS_MIN_SIZE and self.accepts_gzip():
+            gzip_body = gzip.compress(body, 6)
+        use_gzip = gzip_body is not None and self.accepts_gzip()
+        if use_gzip:
+            body = gzip_body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def accepts_gzip(self):
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def send_json(self, status, data, head=False):
+        body = json.dumps(data, separators=(",", ":")).encode()
+        self.send_body(status, body, "application/json", {"Cache-Control": "no-store", "Vary": "Accept-Encoding"},
+                       head=head)
+
+    def handle_api(self, path, query, head):
+        param = lambda name, default=None: query.get(name, [default])[0]
+        devices = storage.list_devices(self.data_dir)
+        device_id = param("device")
+        if device_id is not None and device_id not in devices:
+            self.send_json(404, {"error": f"Unknown device: {device_id}"}, head)
+            return
+
+        try:
+            if path == "/api/devices":
+                data = {"devices": devices}
+            elif path == "/api/latest":
+                data = {"devices": {}}
+                for device in [device_id] if device_id else devices:
+                    row = history.latest_reading(device, self.data_dir)
+                    if row is not None:
+                        data["devices"][device] = _reading(row)
+            elif path == "/api/history":
+                if device_id is None:
+                    raise ValueError("device is required")
+                metric = param("metric", "temperature")
+                end_ns = _epoch_ns(param("end"), time.time_ns())
+                start_ns = _epoch_ns(param("start"), end_ns - HISTORY_WINDOW * 1_000_000_000)
+                points = min(int(param("points", HISTORY_POINTS)), MAX_HISTORY_POINTS)
+                buckets = rollups.query_history(device_id, metric, start_ns, end_ns, points, self.data_dir)
+                data = {
+                    "device": device_id,
+                    "metric": metric,
+                    "columns": ["timestamp", "min", "max", "avg", "count"],
+                    "points": [[ts / 1e9, low, high, avg, count] for ts, low, high, avg, count in buckets],
+                }
+            elif path == "/api/readings":
+                if device_id is None:
+                    raise ValueError("device is required")
+                # Pages continue from the exact nanosecond timestamp of the last reading sent, so
+                # readings later in the same millisecond are not skipped
+                if param("since_ns") is not None:
+                    start_ns = int(param("since_ns")) + 1
+                else:
+                    start_ns = (int(param("since", 0)) + 1) * 1_000_000
+                rows = history.get_index(device_id, self.data_dir).query(start_ns, time.time_ns(),
+                                                                         limit=MAX_SYNC_READINGS + 1)
+                page = rows[:MAX_SYNC_READINGS]
+                data = {
+                    "device": device_id,
+                    "columns": ["time_ms", "temperature", "humidity", "flow"],
+                    "readings": [[ts // 1_000_000, temp, humidity, flow] for ts, temp, humidity, flow in page],
+                    "more": len(rows) > MAX_SYNC_READINGS,
+                }
+                if data["more"]:
+                    data["next_ns"] = str(page[-1][0])  # A string: beyond the precision of JS numbers
+            else:
+                self.send_json(404, {"error": "Unknown endpoint"}, head)
+                return
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)}, head)
+            return
+        self.send_json(200, data, head)
+
+
 def main():
-    os.chdir(DIRECTORY)
-    
-    with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
+    with http.server.ThreadingHTTPServer(("", PORT), DashboardRequestHandler) as httpd:
         print("=" * 60)
         print("Wokwi Agent Web Interface Server")
         print("=" * 60)
         print(f"Server running at: http://localhost:{PORT}/")
         print(f"Serving directory: {DIRECTORY}")
         print(f"Open in browser: http://localhost:{PORT}/index-nodered.html")
+        print(f"Telemetry API: http://localhost:{PORT}/api/latest (data: {DATA_DIR})")
         print("=" * 60)
         print("Press Ctrl+C to stop the server")
         print("=" * 60)
-        
+
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
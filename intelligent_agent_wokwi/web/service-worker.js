@@ -1,8 +1,12 @@
-const CACHE_NAME = 'wokwi-agent-v1';
+importScripts('telemetry-store.js');
+
+const CACHE_NAME = 'wokwi-agent-v3';
 const urlsToCache = [
     '/index.html',
     '/index-nodered.html',
     '/style.css',
+    '/series.js',
+    '/telemetry-store.js',
     '/app.js',
     '/app-nodered.js',
     '/manifest.json',
@@ -11,6 +15,9 @@ const urlsToCache = [
     'https://unpkg.com/mqtt/dist/mqtt.min.js'
 ];
 
+// Readings cached by the dashboards (see telemetry-store.js)
+const telemetryStore = new TelemetryStore();
+
 // Install event - cache resources
 self.addEventListener('install', (event) => {
     event.waitUntil(
@@ -25,6 +32,11 @@ self.addEventListener('install', (event) => {
 
 // Fetch event - serve from cache, fallback to network
 self.addEventListener('fetch', (event) => {
+    // Live data and commands always go to the network
+    if (event.request.method !== 'GET' || new URL(event.request.url).pathname.startsWith('/api/')) {
+        return;
+    }
+
     event.respondWith(
         caches.match(event.request)
             .then((response) => {
@@ -72,16 +84,13 @@ self.addEventListener('activate', (event) => {
     );
     self.clients.claim();
 });
-self.addEventListener('install', event => {
-  console.log('Service worker installé');
-  self.skipWaiting();
-});
 
-self.addEventListener('activate', event => {
-  console.log('Service worker activé');
+// Message event - batches of readings from the dashboards, written in one transaction
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'readings') {
+        event.waitUntil(
+            telemetryStore.addBatch(event.data.readings)
+                .catch((error) => console.error('Error caching readings:', error))
+        );
+    }
 });
-
-self.addEventListener('fetch', event => {
-  // Exemple simple : laisser passer les requêtes
-});
-
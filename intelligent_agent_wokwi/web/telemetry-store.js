@@ -0,0 +1,181 @@
+// Local cache of recent readings in IndexedDB
+//
+// Readings are stored under the backend's timestamp (epoch ms, see
+// readingTime) and indexed by [device, time], so a device's newest readings
+// and "everything after time T" are cheap index-range reads. Keys are
+// generated, so readings of one millisecond (batched or back-dated samples)
+// are all kept. The dashboards batch new readings and hand them to the
+// service worker, which writes each batch in one transaction and evicts
+// readings that are too old or too many. On start the dashboards draw the
+// cached history before connecting, and after an outage they fetch only the
+// readings newer than the last cached one (see syncReadings).
+//
+// Loaded by the pages with <script> and by the service worker with importScripts.
+
+const TELEMETRY_DB = 'wokwi-telemetry';
+const TELEMETRY_STORE = 'readings';
+const TELEMETRY_DB_VERSION = 1;
+const TELEMETRY_MAX_AGE_MS = 24 * 60 * 60 * 1000; // Keep one day of readings
+const TELEMETRY_MAX_RECORDS = 200000; // ... but never more than this many
+const TELEMETRY_EVICT_INTERVAL_MS = 60 * 1000;
+const TELEMETRY_FLUSH_MS = 1000; // Readings are written in batches this often
+
+function requestDone(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+// Time of a live reading in epoch ms on the backend's clock, like the readings
+// fetched by syncReadings: the WebSocket feed sends an ISO string, the hub
+// epoch seconds. Readings without one (straight from MQTT) fall back to the browser clock.
+function readingTime(data) {
+    const stamp = data.timestamp;
+    if (typeof stamp === 'number') return Math.floor(stamp * 1000);
+    if (typeof stamp === 'string') {
+        // Date.parse takes at most milliseconds; drop finer ISO fractions
+        const time = Date.parse(stamp.replace(/(\.\d{3})\d+/, '$1'));
+        if (!Number.isNaN(time)) return time;
+    }
+    return Date.now();
+}
+
+// Key range of one device's readings with time in (after, until]
+function deviceRange(device, after = -Infinity, until = Infinity) {
+    return IDBKeyRange.bound([device, after], [device, until], true, false);
+}
+
+function transactionDone(tx) {
+    return new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onabort = tx.onerror = () => reject(tx.error);
+    });
+}
+
+class TelemetryStore {
+    constructor(maxAgeMs = TELEMETRY_MAX_AGE_MS, maxRecords = TELEMETRY_MAX_RECORDS) {
+        this.maxAgeMs = maxAgeMs;
+        this.maxRecords = maxRecords;
+        this.lastEvict = 0;
+        this.opening = null;
+    }
+
+    open() {
+        if (!this.opening) {
+            const request = indexedDB.open(TELEMETRY_DB, TELEMETRY_DB_VERSION);
+            request.onupgradeneeded = () => {
+                const store = request.result.createObjectStore(TELEMETRY_STORE, { autoIncrement: true });
+                store.createIndex('device_time', ['device', 'time']);
+                store.createIndex('time', 'time');
+            };
+            this.opening = requestDone(request);
+        }
+        return this.opening;
+    }
+
+    // Write a batch of { device, time, temp, humidity, flow } readings in one transaction.
+    // With `replace` ({ device, after, until }), that device's cached readings in
+    // (after, until] are dropped first: the batch holds all of them
+    async addBatch(readings, replace = null) {
+        const db = await this.open();
+        const tx = db.transaction(TELEMETRY_STORE, 'readwrite');
+        const store = tx.objectStore(TELEMETRY_STORE);
+        if (replace) {
+            const range = deviceRange(replace.device, replace.after, replace.until);
+            const keys = await requestDone(store.index('device_time').getAllKeys(range));
+            keys.forEach((key) => store.delete(key));
+        }
+        readings.forEach((reading) => store.add(reading));
+        await transactionDone(tx);
+        if (Date.now() - this.lastEvict >= TELEMETRY_EVICT_INTERVAL_MS) {
+            await this.evict();
+        }
+    }
+
+    // Drop readings older than maxAgeMs, then the oldest ones above maxRecords
+    async evict(now = Date.now()) {
+        this.lastEvict = now;
+        const db = await this.open();
+        const tx = db.transaction(TELEMETRY_STORE, 'readwrite');
+        const store = tx.objectStore(TELEMETRY_STORE);
+        const byTime = store.index('time');
+        const expired = await requestDone(byTime.getAllKeys(IDBKeyRange.upperBound(now - this.maxAgeMs, true)));
+        expired.forEach((key) => store.delete(key));
+        const excess = (await requestDone(store.count())) - this.maxRecords;
+        if (excess > 0) {
+            const oldest = await requestDone(byTime.getAllKeys(null, excess));
+            oldest.forEach((key) => store.delete(key));
+        }
+        await transactionDone(tx);
+    }
+
+    // A device's cached readings from the last `windowMs` before its newest one, oldest first
+    async readRecent(device, windowMs) {
+        const last = await this.lastTime(device);
+        const db = await this.open();
+        const index = db.transaction(TELEMETRY_STORE).objectStore(TELEMETRY_STORE).index('device_time');
+        return requestDone(index.getAll(IDBKeyRange.bound([device, last - windowMs], [device, Infinity])));
+    }
+
+    // Timestamp of a device's newest cached reading, or 0
+    async lastTime(device) {
+        const db = await this.open();
+        const index = db.transaction(TELEMETRY_STORE).objectStore(TELEMETRY_STORE).index('device_time');
+        const cursor = await requestDone(index.openKeyCursor(deviceRange(device), 'prev'));
+        return cursor ? cursor.key[1] : 0;
+    }
+}
+
+// Page side: collects readings and writes them in batches, through the
+// service worker when one controls the page (off the UI thread)
+class ReadingCache {
+    constructor(store = new TelemetryStore()) {
+        this.store = store;
+        this.batch = [];
+    }
+
+    record(device, time, data) {
+        this.batch.push({ device, time, temp: data.temp, humidity: data.humidity, flow: data.flow });
+        if (this.batch.length === 1) {
+            setTimeout(() => this.flush(), TELEMETRY_FLUSH_MS);
+        }
+    }
+
+    flush() {
+        const readings = this.batch;
+        this.batch = [];
+        if (!readings.length) return Promise.resolve();
+        const worker = navigator.serviceWorker && navigator.serviceWorker.controller;
+        if (worker) {
+            worker.postMessage({ type: 'readings', readings });
+            return Promise.resolve();
+        }
+        return this.store.addBatch(readings).catch((e) => console.error('Error caching readings', e));
+    }
+}
+
+// Fetch the readings stored by the backend after the newest cached one of `device` and
+// cache them (`api` is the /api/readings URL with ?device=...); returns them oldest first
+async function syncReadings(store, api, device) {
+    // With an empty cache, start from the oldest reading the cache would keep (the only use
+    // of the browser clock); otherwise re-read the newest cached millisecond, later readings
+    // in it may not be cached yet. Both sides are backend timestamps
+    const since = Math.max(await store.lastTime(device) - 1, Date.now() - store.maxAgeMs);
+    const readings = [];
+    let url = `${api}&since=${since}`;
+    while (url) {
+        const response = await fetch(url, { cache: 'no-store' });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        const data = await response.json();
+        data.readings.forEach(([time, temp, humidity, flow]) => {
+            readings.push({ device, time, temp, humidity, flow });
+        });
+        url = data.more ? `${api}&since_ns=${data.next_ns}` : null;
+    }
+    if (readings.length) {
+        // The fetched readings replace the cached ones they overlap (the re-read millisecond)
+        await store.addBatch(readings, { device, after: since, until: readings[readings.length - 1].time });
+    }
+    return readings;
+}